@@ -0,0 +1,3 @@
+"""
+Benchmarks of the processing pipeline on synthetic WFDB records.
+"""
@@ -0,0 +1,195 @@
+"""
+Benchmark the processing pipeline on synthetic records of scalable length.
+
+Every stage (read, intervals, summary, segmentation) is timed on records of
+the requested lengths, and its peak memory and throughput are recorded. The
+results are compared with the stored baselines so regressions can be caught
+offline.
+
+Examples:
+    python -m benchmarks.run_benchmarks                      # 0.5h and 2h records
+    python -m benchmarks.run_benchmarks --hours 0.5 2 8 24
+    python -m benchmarks.run_benchmarks --update-baseline
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import multiprocessing
+import concurrent.futures
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.synthetic import make_record
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(BENCHMARK_DIR, ".data")
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baselines.json")
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 ** 2 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def _measure(function, repeat):
+    """Return (result, best wall time in seconds, peak traced memory in MB) of function()."""
+    best = float("inf")
+    peak = 0
+    result = None
+    for _ in range(repeat):
+        result = None
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return result, best, round(peak / 1024 ** 2, 2)
+
+
+def bench_record(path, window_size=30, window_step=5, read_range_sec=60, repeat=3):
+    """
+    Benchmark every stage on one record. Runs in its own process so that the
+    process-wide peak RSS belongs to this record only.
+
+    Returns:
+        list: One dictionary of metrics per stage.
+    """
+    from src.processing import RecordReader, find_rhythm_interval, rhythm_summary, create_segments
+
+    directory, record_name = os.path.split(path)
+    header = RecordReader(directory, record_name).get_header()
+    n_samples = header.sig_len
+    results = []
+
+    def record_stage(stage, seconds, peak_mb, **throughput):
+        results.append({"stage": stage, "seconds": round(seconds, 4), "peak_mb": peak_mb,
+                        "max_rss_mb": _max_rss_mb(), **throughput})
+
+    range_size = int(read_range_sec * header.fs)
+    ranges = [(start, min(start + range_size, n_samples)) for start in range(0, n_samples, range_size)]
+
+    def read():
+        reader = RecordReader(directory, record_name)
+        return sum(len(record['signal']) for record in reader.read_ranges(0, ranges))
+
+    samples_read, seconds, peak = _measure(read, repeat)
+    record_stage("read", seconds, peak, samples_per_sec=round(samples_read / seconds))
+
+    rhythm_table, seconds, peak = _measure(lambda: find_rhythm_interval(path, database_path=""), repeat)
+    record_stage("intervals", seconds, peak, samples_per_sec=round(n_samples / seconds),
+                 rows=len(rhythm_table))
+
+    summary_table, seconds, peak = _measure(lambda: rhythm_summary(rhythm_table), repeat)
+    record_stage("summary", seconds, peak, rows_per_sec=round(len(rhythm_table) / seconds),
+                 rows=len(summary_table))
+
+    segments_table, seconds, peak = _measure(
+        lambda: create_segments(rhythm_table, window_size=window_size, window_step=window_step), repeat
+    )
+    record_stage("segmentation", seconds, peak, samples_per_sec=round(n_samples / seconds),
+                 segments_per_sec=round(len(segments_table) / seconds), rows=len(segments_table))
+    return results
+
+
+def run(hours, fs=128, data_dir=DEFAULT_DATA_DIR, repeat=3, window_size=30, window_step=5):
+    """
+    Generate (or reuse) the synthetic records and benchmark each one.
+
+    Returns:
+        dict: Metrics keyed by '<record>/<stage>'.
+    """
+    metrics = {}
+    context = multiprocessing.get_context("spawn")
+    for length in hours:
+        path = make_record(data_dir, length, fs=fs)
+        record_name = os.path.basename(path)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results = pool.submit(bench_record, path, window_size, window_step, 60, repeat).result()
+        for result in results:
+            metrics[f"{record_name}/{result.pop('stage')}"] = result
+    return metrics
+
+
+def compare(metrics, baselines, time_tolerance, memory_tolerance):
+    """
+    Compare metrics with baselines.
+
+    Returns:
+        list: Human-readable descriptions of every regression.
+    """
+    regressions = []
+    for key, result in metrics.items():
+        baseline = baselines.get(key)
+        if baseline is None:
+            continue
+        # Small absolute slack so that sub-millisecond stages do not flap
+        if result["seconds"] > baseline["seconds"] * (1 + time_tolerance) + 0.01:
+            regressions.append(f"{key}: {result['seconds']}s vs baseline {baseline['seconds']}s")
+        if result["peak_mb"] > baseline["peak_mb"] * (1 + memory_tolerance) + 1:
+            regressions.append(f"{key}: {result['peak_mb']} MB vs baseline {baseline['peak_mb']} MB")
+    return regressions
+
+
+def _print_table(metrics, baselines):
+    print(f"{'benchmark':40} {'seconds':>9} {'baseline':>9} {'peak MB':>9} {'RSS MB':>8}  throughput")
+    for key, result in metrics.items():
+        baseline = baselines.get(key, {}).get("seconds", "-")
+        throughput = ", ".join(f"{k}={v:,}" for k, v in result.items() if k.endswith("_per_sec"))
+        print(f"{key:40} {result['seconds']:>9} {baseline:>9} {result['peak_mb']:>9} "
+              f"{str(result['max_rss_mb']):>8}  {throughput}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ECG processing pipeline on synthetic records.")
+    parser.add_argument("--hours", type=float, nargs="+", default=[0.5, 2], help="Record lengths in hours")
+    parser.add_argument("--fs", type=int, default=128, help="Sampling frequency of the records (default: 128)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the best time is kept")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Where synthetic records are generated")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline file")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="Allowed slowdown (default: 0.5 = +50%%)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.1, help="Allowed memory growth (default: 0.1)")
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    metrics = run(args.hours, fs=args.fs, data_dir=args.data_dir, repeat=args.repeat)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+    _print_table(metrics, baselines)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(metrics, f, indent=2)
+
+    if args.update_baseline:
+        baselines.update(metrics)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(baselines.items())), f, indent=2)
+            f.write("\n")
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    regressions = compare(metrics, baselines, args.time_tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Synthetic WFDB records for benchmarking.
+
+Records mimic the long-term databases the tool is used with: two ECG-like
+channels stored in format 212, a beat annotation for every heartbeat and a
+'+' annotation with an aux note at every rhythm change.
+"""
+
+import os
+import numpy as np
+import wfdb
+
+RHYTHMS = ["(N", "(AFIB", "(N", "(AFL", "(N", "(B", "(T", "(SVTA"]
+BEAT_SYMBOLS = ["N", "A", "V", "Q", '"']
+BEAT_WEIGHTS = [0.90, 0.04, 0.04, 0.01, 0.01]
+
+
+def record_name_for(hours, fs):
+    return f"synth_{hours:g}h_{fs}hz".replace(".", "p")
+
+
+def make_record(directory, hours, fs=128, mean_episode_sec=300, seed=0):
+    """
+    Write a synthetic record and return its path without extension.
+
+    Args:
+        directory (str): Output directory.
+        hours (float): Length of the record in hours.
+        fs (int): Sampling frequency in Hz.
+        mean_episode_sec (float): Mean duration of a rhythm episode in seconds.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        str: Path of the record, usable with wfdb.rdrecord and find_rhythm_interval.
+    """
+    record_name = record_name_for(hours, fs)
+    path = os.path.join(directory, record_name)
+    if all(os.path.exists(f"{path}.{ext}") for ext in ("hea", "dat", "atr")):
+        return path
+
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    n_samples = int(hours * 3600 * fs)
+
+    # Beats with a jittered RR interval between 0.5 and 1.1 seconds
+    rr = rng.uniform(0.5, 1.1, size=int(hours * 3600 / 0.5) + 1)
+    beats = (np.cumsum(rr) * fs).astype(np.int64)
+    beats = beats[beats < n_samples - 1]
+    symbols = rng.choice(BEAT_SYMBOLS, size=len(beats), p=BEAT_WEIGHTS)
+
+    # Rhythm changes, the first one at the start of the record
+    n_episodes = max(1, int(hours * 3600 / mean_episode_sec))
+    changes = np.unique(np.concatenate(([0], rng.integers(1, n_samples - 1, size=n_episodes - 1))))
+    aux = [RHYTHMS[i % len(RHYTHMS)] for i in range(len(changes))]
+
+    samples = np.concatenate((beats, changes))
+    all_symbols = np.concatenate((symbols, np.full(len(changes), "+")))
+    all_aux = np.concatenate((np.full(len(beats), ""), aux))
+    order = np.argsort(samples, kind="stable")
+
+    # QRS-like spikes on a slow baseline
+    t = np.arange(n_samples) / fs
+    signal = np.empty((n_samples, 2))
+    signal[:, 0] = 0.1 * np.sin(2 * np.pi * 0.3 * t)
+    signal[:, 1] = 0.05 * np.cos(2 * np.pi * 0.2 * t)
+    half_width = fs // 10
+    spike = np.exp(-0.5 * (np.arange(-half_width, half_width) / (fs / 100)) ** 2)
+    for beat in beats[(beats >= half_width) & (beats < n_samples - half_width)]:
+        signal[beat - half_width:beat + half_width, 0] += spike
+        signal[beat - half_width:beat + half_width, 1] += 0.6 * spike
+    signal += rng.normal(0, 0.02, size=signal.shape)
+
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        wfdb.wrsamp(record_name, fs=fs, units=["mV", "mV"], sig_name=["ECG1", "ECG2"],
+                    p_signal=signal, fmt=["212", "212"], adc_gain=[200.0, 200.0], baseline=[0, 0],
+                    comments=["synthetic benchmark record"])
+        wfdb.wrann(record_name, "atr", samples[order], symbol=all_symbols[order].tolist(),
+                   aux_note=all_aux[order].tolist())
+    finally:
+        os.chdir(cwd)
+    return path
@@ -12,10 +12,16 @@ setup(
     packages=find_packages(),
     install_requires=[
         "streamlit>=1.40.2",
-        "wfdb>=4.1.2",
+        "wfdb>=4.1.2,<4.2",
+        "scipy>=1.7.0",
         "numpy>=1.24.0",
         "polars>=0.20.0",
         "matplotlib>=3.7.0",
         "neurokit2>=0.2.0"
     ],
+    entry_points={
+        "console_scripts": [
+            "ecg-batch=src.processing.batch:main",
+        ],
+    },
 )
@@ -1,8 +1,12 @@
 import streamlit as st
 import polars as pl
+import matplotlib.pyplot as plt
 import os
+import time
+import uuid
+import hashlib
 from pathlib import Path
-from tempfile import mkdtemp
+from tempfile import mkdtemp, TemporaryFile
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
@@ -10,8 +14,128 @@ from src.processing import (
     find_rhythm_interval,
     create_segments,
     rhythm_summary,
-    plot_rhythm_summary
+    plot_rhythm_summary,
+    RecordCache,
+    UnsupportedInMemoryFormat
 )
+from src.processing.export import FORMATS, STREAM_FORMATS, table_to_bytes, iter_export
+from src.processing.memo import StageCache
+from src.processing.decimation import RecordView
+from src.processing.jobs import JobRunner
+from src.processing.resampling import resample_rhythm_table
+
+# Sampling frequencies offered for harmonizing records of different databases
+TARGET_FS_OPTIONS = {"Original": None, "128 Hz (LTAF)": 128, "250 Hz": 250, "360 Hz (MIT-BIH)": 360}
+
+EXPORT_FORMATS = {"NDJSON": "ndjson", "Parquet": "parquet", "Parquet (zip of chunks)": "parquet-zip",
+                  "Arrow IPC": "arrow"}
+
+# st.download_button holds the whole file in memory, so larger exports are
+# written with export_stream or the batch CLI instead
+MAX_EXPORT_BYTES = 200 * 1024 ** 2
+
+class ExportTooLarge(ValueError):
+    """Raised when a table is too large to be downloaded from the app"""
+
+def export_table(table, fmt, max_bytes=MAX_EXPORT_BYTES):
+    """Return the download data, file extension and mime type of a table in the chosen format"""
+    too_large = ExportTooLarge(
+        f"The export is larger than {max_bytes // 1024 ** 2} MB, too large to download from the app. "
+        "Write it in chunks with export_stream(table, 'table.ndjson') or process the record with "
+        "`python -m src.processing.batch` instead."
+    )
+    if fmt in STREAM_FORMATS:
+        # Spool the chunks to disk and give up as soon as the file passes the cap,
+        # so at most max_bytes of it is ever read back into memory
+        with TemporaryFile() as export_file:
+            for data in iter_export(table, fmt):
+                export_file.write(data)
+                if export_file.tell() > max_bytes:
+                    raise too_large
+            export_file.seek(0)
+            data = export_file.read()
+        return data, STREAM_FORMATS[fmt]["extensions"][0].lstrip("."), STREAM_FORMATS[fmt]["mime"]
+    if table.estimated_size() > max_bytes:
+        raise too_large
+    return table_to_bytes(table, fmt), FORMATS[fmt]["extensions"][0].lstrip("."), FORMATS[fmt]["mime"]
+
+def download_table(label, table, fmt, stage, key, file_stem):
+    """Show a download button for a table, or a warning when it is too large to download from the app"""
+    def export_or_warning():
+        try:
+            return export_table(table, fmt)
+        except ExportTooLarge as e:
+            return str(e)
+
+    # The warning is cached too, so reruns do not spool a too large export again;
+    # it is kept as text because every rerun of the script redefines ExportTooLarge
+    export = get_stage_cache().cached(stage, (key, fmt), export_or_warning)
+    if isinstance(export, str):
+        st.warning(export)
+        return
+    data, extension, mime = export
+    st.download_button(label=label, data=data, file_name=f"{file_stem}.{extension}", mime=mime)
+
+@st.cache_resource
+def get_record_cache():
+    """Return the on-disk cache shared by every session for PhysioNet records"""
+    return RecordCache()
+
+@st.cache_resource
+def get_stage_cache():
+    """Return the memo of pipeline results, shared by every session and bounded in size"""
+    return StageCache()
+
+@st.cache_resource
+def get_job_runner():
+    """Return the worker pool shared by every session for record loading and segmentation"""
+    return JobRunner()
+
+def run_stage(stage, key, compute, label):
+    """
+    Return the result of a pipeline stage, computing it in the background.
+
+    While the job runs, its progress and a cancel button are shown and the
+    script is rerun until the result is ready, so widgets stay responsive;
+    changing an input submits a new job that supersedes the stale one.
+    compute receives the job's instrumentation.
+    """
+    stage_cache = get_stage_cache()
+    if stage_cache.contains(stage, key):
+        return stage_cache.cached(stage, key, lambda: compute(None))
+
+    session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+    cancelled = st.session_state.setdefault("cancelled_stages", {})
+    if cancelled.get(stage) == key:
+        st.warning(f"{label} was cancelled.")
+        if st.button("Restart", key=f"restart_{stage}"):
+            del cancelled[stage]
+            st.rerun()
+        st.stop()
+
+    runner = get_job_runner()
+    job = runner.submit((session_id, stage), key,
+                        lambda instrumentation: stage_cache.cached(stage, key, lambda: compute(instrumentation)))
+    if job.done():
+        return job.result()
+
+    fraction = job.fraction()
+    message = job.message() or f"{label}..."
+    st.progress(fraction or 0.0, text=f"{message} ({job.elapsed():.0f}s)")
+    if st.button("Cancel", key=f"cancel_{stage}"):
+        job.cancel()
+        cancelled[stage] = key
+        st.rerun()
+    time.sleep(0.5)
+    st.rerun()
+
+def uploaded_files_key(*uploaded_files):
+    """Identify an uploaded record by the names and content of its files"""
+    digest = hashlib.sha256()
+    for uploaded_file in uploaded_files:
+        digest.update(uploaded_file.name.encode())
+        digest.update(uploaded_file.getvalue())
+    return ("upload", digest.hexdigest())
 
 def save_uploadedfiles(record_file, annotation_file, data_file):
     """Save uploaded files to a temporary directory and return the paths"""
@@ -46,12 +170,15 @@ def main():
     - Support for custom WFDB format files
     - Automatic rhythm interval detection
     - Customizable signal segmentation
-    - Export results in JSON format
+    - Export results as NDJSON, Parquet, zipped Parquet chunks or Arrow IPC
     """)
 
     # Add a separator for better visual organization
     st.markdown("---")
 
+    # Results of earlier runs, keyed by record and parameters
+    stage_cache = get_stage_cache()
+
     # File upload or database selection
     upload_files = st.checkbox("Upload my own record files")
 
@@ -78,24 +205,43 @@ def main():
                     st.error("All files must have the same base name!")
                     st.stop()
                 
-                # Save files to temporary directory
-                temp_dir, record_name = save_uploadedfiles(record_file, annotation_file, data_file)
-                
-                try:
-                    # Force wfdb to use local files by using absolute path
-                    rhythm_table = find_rhythm_interval(
-                        record_name=os.path.join(temp_dir, record_name), 
-                        database_path=""  # Empty string to force local file reading
-                    )
-                    st.write(rhythm_table)
-                    record_id = record_name
-                finally:
-                    # Clean up temporary directory
-                    import shutil
+                def load_uploaded_record(instrumentation):
+                    # Parse the uploads in memory; getbuffer() exposes them without a copy
+                    record_name = os.path.splitext(record_file.name)[0]
+                    files = {
+                        f"{record_name}.hea": record_file.getbuffer(),
+                        f"{record_name}.dat": data_file.getbuffer(),
+                        f"{record_name}.atr": annotation_file.getbuffer(),
+                    }
                     try:
-                        shutil.rmtree(temp_dir)
-                    except:
+                        return find_rhythm_interval(record_name=record_name, files=files,
+                                                    instrumentation=instrumentation)
+                    except UnsupportedInMemoryFormat:
+                        # Signal formats other than 16 and 212 are read from files
                         pass
+
+                    # Save files to temporary directory
+                    temp_dir, record_name = save_uploadedfiles(record_file, annotation_file, data_file)
+                    
+                    try:
+                        # Force wfdb to use local files by using absolute path
+                        return find_rhythm_interval(
+                            record_name=os.path.join(temp_dir, record_name), 
+                            database_path="",  # Empty string to force local file reading
+                            instrumentation=instrumentation
+                        )
+                    finally:
+                        # Clean up temporary directory
+                        import shutil
+                        try:
+                            shutil.rmtree(temp_dir)
+                        except:
+                            pass
+
+                record_key = uploaded_files_key(record_file, data_file, annotation_file)
+                rhythm_table = run_stage("rhythm_table", record_key, load_uploaded_record, "Loading the record")
+                st.write(rhythm_table)
+                record_id = base_names.pop()
                 
             except Exception as e:
                 st.error(f"Error processing uploaded files: {str(e)}")
@@ -119,10 +265,18 @@ def main():
         
         record_selection = st.selectbox("Select a record", record_options)
         record_id = record_selection
-        st.write(f"Your selected record: {record_id} is now fetching from the physionet database...")
+        st.write(f"Your selected record: {record_id} is now loading (fetched from the physionet database on first use)...")
         
+        record_key = ("database", db_path, record_selection)
+        record_cache = get_record_cache()
         try:
-            rhythm_table = find_rhythm_interval(record_name=record_selection, database_path=db_path)
+            rhythm_table = run_stage(
+                "rhythm_table", record_key,
+                lambda instrumentation: find_rhythm_interval(record_name=record_selection, database_path=db_path,
+                                                             cache=record_cache,
+                                                             instrumentation=instrumentation),
+                "Loading the record"
+            )
             st.write(rhythm_table)
         except Exception as e:
             st.error(f"Error loading record: {str(e)}")
@@ -130,17 +284,14 @@ def main():
 
     # Only show the rest if we have a rhythm table
     if 'rhythm_table' in locals():
+        export_format = EXPORT_FORMATS[st.radio("Export format", list(EXPORT_FORMATS), horizontal=True)]
+
         # Download button for rhythm table
-        json_str_rhythm = rhythm_table.write_json(None)
-        st.download_button(
-            label="Download rhythm table",
-            data=json_str_rhythm,
-            file_name=f"rhythm_table_{record_id}.json",
-            mime="application/json"
-        )
+        download_table("Download rhythm table", rhythm_table, export_format, "rhythm_table_export", record_key,
+                       f"rhythm_table_{record_id}")
         
         # Show summary of the rhythm table
-        summary_table = rhythm_summary(rhythm_table)
+        summary_table = stage_cache.cached("rhythm_summary", record_key, lambda: rhythm_summary(rhythm_table))
         st.subheader("Summary of Rhythm Statistics in the Record")
         st.write(summary_table)
                 
@@ -148,42 +299,55 @@ def main():
             # Plot rhythm summary
             st.subheader("Visualization of Rhythm Statistics in the Record")  
             plot_rhythm_summary(summary_table)
+
+        # Zoomable signal view; the decimation pyramid is built once per record
+        if st.checkbox("Show the ECG signal"):
+            record_view = stage_cache.cached("record_view", record_key, lambda: RecordView(rhythm_table))
+            record_seconds = max(1.0, len(record_view) / record_view.fs)
+            view_start, view_end = st.slider(
+                "Time range (seconds)", min_value=0.0, max_value=record_seconds,
+                value=(0.0, min(record_seconds, 60.0)), step=1.0
+            )
+            fig = record_view.plot(view_start, max(view_end, view_start + 1.0), width=1000)
+            st.pyplot(fig)
+            # Every rerun draws a new figure; pyplot keeps them all open until closed
+            plt.close(fig)
             
         
         # Text input box 
-        col1, col2 = st.columns(2)
+        col1, col2, col3 = st.columns(3)
         with col1:
             window_width = st.number_input("Window width (seconds)", min_value=1, value=30)
         with col2:
             window_step = st.number_input("Window step (seconds)", min_value=1, value=5)
+        with col3:
+            target_fs = TARGET_FS_OPTIONS[st.selectbox("Sampling rate", list(TARGET_FS_OPTIONS))]
 
         try:
-            # Create a status container
-            status_container = st.empty()
-            
-            def update_status(message):
-                status_container.info(message)
-            
-            segments_table = create_segments(
-                rhythm_table, 
-                window_size=window_width, 
-                window_step=window_step,
-                progress_callback=update_status
-            )
+            # Segment in the background; the job reports its progress per interval
+            # Records are resampled once per target rate, so all segments have the same width
+            def segment_record(instrumentation):
+                table = rhythm_table
+                if target_fs:
+                    table = resample_rhythm_table(table, target_fs, instrumentation=instrumentation,
+                                                  cache=stage_cache, key=record_key)
+                return create_segments(
+                    table, 
+                    window_size=window_width, 
+                    window_step=window_step,
+                    instrumentation=instrumentation
+                )
+
+            segment_key = (record_key, window_width, window_step, target_fs)
+            segments_table = run_stage("segments", segment_key, segment_record, "Creating segments")
             
-            # Clear the status messages when done
-            status_container.empty()
             st.subheader("Created Segments of the Record")
             st.write(segments_table)
             
             # Download button for segments
-            json_str_segments = segments_table.write_json(None)
-            st.download_button(
-                label="Download segments",
-                data=json_str_segments,
-                file_name=f"segments_{record_id}_w{window_width}_s{window_step}.json",
-                mime="application/json"
-            )
+            fs_suffix = f"_fs{target_fs}" if target_fs else ""
+            download_table("Download segments", segments_table, export_format, "segments_export", segment_key,
+                           f"segments_{record_id}_w{window_width}_s{window_step}{fs_suffix}")
         except Exception as e:
             st.error(f"Error creating segments: {str(e)}")
 
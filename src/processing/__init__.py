@@ -9,7 +9,21 @@ from .rhythm_segmentation import (
     plot_rhythm_summary
 )
 
-from .read_record import Record, RecordReader
+from .read_record import Record, RecordReader, UnsupportedInMemoryFormat
+from .record_cache import RecordCache, LocalSource, HTTPSource, PhysioNetSource
+from .batch import run_batch, process_record
+from .streaming import iter_rhythm_intervals, iter_segments
+from .export import write_table, read_table, to_compact, from_compact, iter_export, export_stream
+from .memo import StageCache
+from .lazy_segments import LazySegmentTable, create_lazy_segments
+from .metrics import Instrumentation, LogSink, JSONLinesSink, CSVSink
+from .signal_dtype import to_physical
+from .catalog import EpisodeCatalog
+from .decimation import SignalPyramid, RecordView
+from .features import segment_features
+from .jobs import JobRunner, JobCancelled
+from .resampling import resample_rhythm_table
+from .segment_store import SegmentStore
 
 __all__ = [
     'find_rhythm_interval',
@@ -17,5 +31,36 @@ __all__ = [
     'rhythm_summary',
     'plot_rhythm_summary',
     'Record',
-    'RecordReader'
+    'RecordReader',
+    'UnsupportedInMemoryFormat',
+    'RecordCache',
+    'LocalSource',
+    'HTTPSource',
+    'PhysioNetSource',
+    'run_batch',
+    'process_record',
+    'iter_rhythm_intervals',
+    'iter_segments',
+    'write_table',
+    'read_table',
+    'to_compact',
+    'from_compact',
+    'iter_export',
+    'export_stream',
+    'StageCache',
+    'LazySegmentTable',
+    'create_lazy_segments',
+    'Instrumentation',
+    'LogSink',
+    'JSONLinesSink',
+    'CSVSink',
+    'to_physical',
+    'EpisodeCatalog',
+    'SignalPyramid',
+    'RecordView',
+    'segment_features',
+    'JobRunner',
+    'JobCancelled',
+    'resample_rhythm_table',
+    'SegmentStore'
 ] 
\ No newline at end of file
@@ -0,0 +1,313 @@
+"""
+Database-wide batch processing.
+
+Runs find_rhythm_interval -> rhythm_summary -> create_segments over every
+record of a database on a pool of worker processes, writes the tables of
+each record and a merged summary of the whole database.
+
+Example:
+    python -m src.processing.batch ltafdb --out results/ltafdb --workers 8
+"""
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import polars as pl
+
+from .export import write_table
+from .features import segment_features
+from .metrics import Instrumentation, metrics_sink
+from .record_cache import RecordCache, LocalSource, HTTPSource, DEFAULT_CACHE_DIR, list_local_records
+from .resampling import resample_rhythm_table
+from .segment_store import SegmentStore
+from .rhythm_segmentation import find_rhythm_interval, rhythm_summary, create_segments
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Columns kept from each rhythm table to build the database-wide summary
+SUMMARY_COLUMNS = ["RecordName", "rhythm", "IntervalDuration", "NoOfPAC", "NoOfPVC"]
+
+
+def _init_worker(max_memory_mb, polars_threads):
+    """Worker initializer sizing the Polars thread pool and capping the data segment of the process."""
+    # Polars starts its thread pool on first use, so this still applies after the import
+    os.environ.setdefault("POLARS_MAX_THREADS", str(polars_threads))
+    if max_memory_mb and resource is not None:
+        limit = int(max_memory_mb) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+
+def process_record(database, record_name, out_dir, window_size, window_step,
+                   cache_dir=None, cache_max_bytes=None, segments=True, source=None, metrics=False,
+                   signal_dtype="float64", channels=None, features=False, target_fs=None, store=None):
+    """
+    Run the full pipeline on one record and write its tables.
+
+    Parameters:
+    - database: PhysioNet database name or local WFDB directory
+    - record_name: Name of the record
+    - out_dir: Directory receiving the tables of the record
+    - window_size: Size of each segment window in seconds
+    - window_step: Step size between windows in seconds
+    - cache_dir: Directory of the RecordCache used for remote databases
+    - cache_max_bytes: Size cap of that cache
+    - segments: Whether to create and write the segment table
+    - source: Optional mirror used by the record cache instead of PhysioNet
+    - metrics: Whether to collect the stage events of the record
+    - signal_dtype: 'float64', 'float32' or 'int16' signals in the written tables
+    - channels: None for the first channel, or a list of channels (or 'all') segmented together
+    - features: Whether to compute and write the beat features of the segments
+    - target_fs: Optional sampling frequency the record is resampled to before segmentation
+    - store: Optional SegmentStore directory the segments are appended to
+
+    Returns:
+    - Dictionary with the record status, table sizes, elapsed time, the
+      columns of the rhythm table needed for the merged summary and, with
+      metrics=True, the list of stage events
+    """
+    started = time.perf_counter()
+    events = []
+    instrumentation = Instrumentation(events.append) if metrics else None
+    result = {"RecordName": record_name, "status": "ok", "error": None,
+              "intervals": 0, "segments": 0, "elapsed(sec)": 0.0, "summary_rows": None, "metrics": events}
+    try:
+        if os.path.isdir(database):
+            rhythm_table = find_rhythm_interval(os.path.join(database, record_name), database_path="",
+                                                instrumentation=instrumentation, signal_dtype=signal_dtype,
+                                                channels=channels)
+        else:
+            cache_kwargs = {} if cache_max_bytes is None else {"max_bytes": cache_max_bytes}
+            cache = RecordCache(cache_dir, source=source, **cache_kwargs)
+            rhythm_table = find_rhythm_interval(record_name, database_path=database, cache=cache,
+                                                instrumentation=instrumentation, signal_dtype=signal_dtype,
+                                                channels=channels)
+        if target_fs:
+            rhythm_table = resample_rhythm_table(rhythm_table, target_fs, instrumentation=instrumentation)
+
+        write_table(rhythm_table, os.path.join(out_dir, f"rhythm_table_{record_name}.parquet"))
+        summary_table = rhythm_summary(rhythm_table, instrumentation=instrumentation)
+        summary_table.write_csv(os.path.join(out_dir, f"summary_{record_name}.csv"))
+        result["intervals"] = len(rhythm_table)
+        result["summary_rows"] = rhythm_table.select(SUMMARY_COLUMNS)
+
+        if segments:
+            segments_table = create_segments(rhythm_table, window_size=window_size, window_step=window_step,
+                                             instrumentation=instrumentation)
+            write_table(segments_table,
+                        os.path.join(out_dir, f"segments_{record_name}_w{window_size}_s{window_step}.parquet"))
+            result["segments"] = len(segments_table)
+            if store is not None:
+                SegmentStore(store).append(segments_table)
+
+            if features:
+                features_table = segment_features(segments_table.drop("signals"), fs=rhythm_table['RecordFs'][0],
+                                                  instrumentation=instrumentation)
+                write_table(features_table.drop("annotations", "indices"),
+                            os.path.join(out_dir, f"features_{record_name}_w{window_size}_s{window_step}.parquet"))
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {str(e)}"
+    result["elapsed(sec)"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def run_batch(database, out_dir, records=None, window_size=30, window_step=5, workers=None,
+              max_memory_mb=None, cache_dir=None, cache_max_bytes=None, segments=True,
+              source=None, progress_callback=None, metrics_path=None, signal_dtype="float64", channels=None,
+              prefetch=None, features=False, target_fs=None, store=None):
+    """
+    Process every record of a database on a pool of worker processes.
+
+    Parameters:
+    - database: 'mitdb', 'ltafdb' (or any PhysioNet database) or a local WFDB directory
+    - out_dir: Output directory
+    - records: Optional list of record names; defaults to every record of the database
+    - window_size: Size of each segment window in seconds
+    - window_step: Step size between windows in seconds
+    - workers: Number of worker processes; defaults to the number of CPUs
+    - max_memory_mb: Optional memory cap of each worker in MB
+    - cache_dir: Directory of the record cache used for remote databases
+    - cache_max_bytes: Size cap of the record cache in bytes
+    - segments: Whether to create segment tables
+    - source: Optional mirror (LocalSource or HTTPSource) used instead of PhysioNet
+    - progress_callback: Optional callback receiving each finished record's result
+    - metrics_path: Optional .jsonl or .csv file receiving the stage events of every record
+    - signal_dtype: 'float64', 'float32' or 'int16' (raw ADC samples, a quarter of the size)
+    - channels: None for the first channel, or a list of channels (or 'all') segmented together
+    - prefetch: Optional number of concurrent downloads used to fetch every record of a
+      remote database into the cache before processing starts
+    - features: Whether to write the beat features of the segments of each record
+    - target_fs: Optional sampling frequency every record is resampled to, so that the
+      segments of records with different sampling frequencies have the same width
+    - store: Optional SegmentStore directory receiving the segments of every record;
+      the workers append to it one record at a time
+
+    Returns:
+    - Tuple (records_table, summary_table): the status of every record and
+      the rhythm summary of the whole database
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if records is None:
+        if os.path.isdir(database):
+            records = list_local_records(database)
+        else:
+            records = RecordCache(cache_dir, source=source).list_records(database)
+    if prefetch and not os.path.isdir(database):
+        # Failed downloads are retried by the workers and reported per record
+        cache_kwargs = {} if cache_max_bytes is None else {"max_bytes": cache_max_bytes}
+        RecordCache(cache_dir, source=source, **cache_kwargs).prefetch(database, records, concurrency=prefetch)
+
+    workers = workers or os.cpu_count() or 1
+    # Each worker is one process; keep native thread pools from oversubscribing the CPUs
+    polars_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    def run_pool(pool_records, pool_workers):
+        """Run records on a new pool; returns the records interrupted by a worker that died."""
+        # Polars is multi-threaded, so workers are spawned rather than forked
+        with concurrent.futures.ProcessPoolExecutor(max_workers=pool_workers,
+                                                    mp_context=multiprocessing.get_context("spawn"),
+                                                    initializer=_init_worker,
+                                                    initargs=(max_memory_mb, polars_threads)) as pool:
+            futures = {
+                pool.submit(process_record, database, record_name, out_dir, window_size, window_step,
+                            cache_dir, cache_max_bytes, segments, source, metrics_path is not None, signal_dtype,
+                            channels, features, target_fs, store): record_name
+                for record_name in pool_records
+            }
+            interrupted = set()
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    interrupted.add(futures[future])
+                    continue
+                results.append(result)
+                if progress_callback:
+                    progress_callback(result)
+        return [record_name for record_name in pool_records if record_name in interrupted]
+
+    # A worker killed by the memory cap breaks the whole pool and interrupts every
+    # record that has not finished. The records that were running are retried
+    # alone to find the one that kills its worker; the others are retried together.
+    results = []
+    pending, isolated = list(records), []
+    while pending or isolated:
+        if pending:
+            interrupted = run_pool(pending, workers)
+            isolated += interrupted[:workers]
+            pending = interrupted[workers:]
+        else:
+            record_name = isolated.pop(0)
+            if run_pool([record_name], 1):
+                result = {"RecordName": record_name, "status": "failed",
+                          "error": "BrokenProcessPool: the worker process died, e.g. beyond --max-memory-mb",
+                          "intervals": 0, "segments": 0, "elapsed(sec)": 0.0, "summary_rows": None, "metrics": []}
+                results.append(result)
+                if progress_callback:
+                    progress_callback(result)
+
+    order = {record_name: i for i, record_name in enumerate(records)}
+    results.sort(key=lambda r: order[r["RecordName"]])
+    records_table = pl.DataFrame(
+        [{k: v for k, v in r.items() if k not in ("summary_rows", "metrics")} for r in results],
+        schema={"RecordName": pl.String, "status": pl.String, "error": pl.String,
+                "intervals": pl.Int64, "segments": pl.Int64, "elapsed(sec)": pl.Float64},
+    )
+    records_table.write_csv(os.path.join(out_dir, "records.csv"))
+
+    if metrics_path is not None:
+        with metrics_sink(metrics_path) as sink:
+            for result in results:
+                for event in result["metrics"]:
+                    sink(event)
+
+    summary_rows = [r["summary_rows"] for r in results if r["summary_rows"] is not None]
+    summary_table = rhythm_summary(pl.concat(summary_rows)) if summary_rows else None
+    if summary_table is not None:
+        summary_table.write_csv(os.path.join(out_dir, "summary.csv"))
+    return records_table, summary_table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run rhythm interval detection, summary and segmentation over a whole WFDB database."
+    )
+    parser.add_argument("database", help="PhysioNet database (e.g. mitdb, ltafdb) or a local WFDB directory")
+    parser.add_argument("--out", required=True, help="Output directory")
+    parser.add_argument("--records", nargs="+", help="Only process these records")
+    parser.add_argument("--window-size", type=int, default=30, help="Window width in seconds (default: 30)")
+    parser.add_argument("--window-step", type=int, default=5, help="Window step in seconds (default: 5)")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: all CPUs)")
+    parser.add_argument("--max-memory-mb", type=int, default=None, help="Memory cap of each worker in MB")
+    parser.add_argument("--no-segments", action="store_true", help="Only write rhythm tables and summaries")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Local cache of downloaded records")
+    parser.add_argument("--source", default=None,
+                        help="Mirror of the databases: a base URL or a local directory (default: PhysioNet)")
+    parser.add_argument("--cache-max-gb", type=float, default=None, help="Size cap of the record cache in GB")
+    parser.add_argument("--signal-dtype", choices=["float64", "float32", "int16"], default="float64",
+                        help="Signal dtype of the written tables; int16 keeps the raw ADC samples (default: float64)")
+    parser.add_argument("--channels", nargs="+", default=None,
+                        help="Channels to read together, e.g. 0 1, or 'all' (default: the first channel)")
+    parser.add_argument("--metrics", default=None,
+                        help="Write the stage timings of every record to this .jsonl or .csv file")
+    parser.add_argument("--features", action="store_true",
+                        help="Also write RR interval, heart rate and beat count features of every segment")
+    parser.add_argument("--prefetch", type=int, default=None, metavar="N",
+                        help="Download the records of a remote database with N concurrent requests first")
+    parser.add_argument("--target-fs", type=float, default=None,
+                        help="Resample every record to this sampling frequency in Hz (default: keep the record's)")
+    parser.add_argument("--store", default=None, metavar="DIR",
+                        help="Also append the segments of every record to this memory-mapped segment store")
+    args = parser.parse_args(argv)
+
+    channels = args.channels
+    if channels == ["all"]:
+        channels = "all"
+    elif channels is not None:
+        channels = [int(channel) for channel in channels]
+
+    source = None
+    if args.source is not None:
+        source = LocalSource(args.source) if os.path.isdir(args.source) else HTTPSource(args.source)
+
+    def report(result):
+        message = f"{result['RecordName']}: {result['status']} in {result['elapsed(sec)']}s"
+        if result["error"]:
+            message += f" ({result['error']})"
+        print(message, flush=True)
+
+    records_table, _ = run_batch(
+        args.database,
+        args.out,
+        records=args.records,
+        window_size=args.window_size,
+        window_step=args.window_step,
+        workers=args.workers,
+        max_memory_mb=args.max_memory_mb,
+        cache_dir=args.cache_dir,
+        cache_max_bytes=None if args.cache_max_gb is None else int(args.cache_max_gb * 1024 ** 3),
+        segments=not args.no_segments,
+        source=source,
+        progress_callback=report,
+        metrics_path=args.metrics,
+        signal_dtype=args.signal_dtype,
+        channels=channels,
+        prefetch=args.prefetch,
+        features=args.features and not args.no_segments,
+        target_fs=args.target_fs,
+        store=None if args.no_segments else args.store,
+    )
+    failed = records_table.filter(pl.col("status") != "ok")
+    print(f"Processed {len(records_table) - len(failed)}/{len(records_table)} records into {args.out}")
+    return 1 if len(failed) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,447 @@
+"""
+Persistent catalog of rhythm episodes.
+
+The catalog is a local SQLite file holding one row per rhythm episode
+(record, rhythm, start/end, duration, PAC/PVC counts) but no signal. It is
+built from the header and annotation files alone, answers filter queries across whole
+databases from its indexes, and fetches signals on demand for the matching
+episodes only.
+
+Example:
+    python -m src.processing.catalog --catalog ltafdb.sqlite index ltafdb
+    python -m src.processing.catalog --catalog ltafdb.sqlite query --rhythm AFIB --min-duration 60 --min-pvc 5
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import contextlib
+import wfdb
+import numpy as np
+import polars as pl
+
+from .read_record import RecordReader
+from .record_cache import RecordCache, LocalSource, HTTPSource, DEFAULT_CACHE_DIR, list_local_records
+from .rhythm_segmentation import _annotation_bounds, _rhythm_bounds, _list_series
+from .signal_dtype import polars_signal_dtype, digital_to_int16
+
+DEFAULT_CATALOG = "episodes.sqlite"
+
+# Columns of the episodes table, named like the columns of the rhythm table;
+# RecordFs is Float64 when a sampling frequency is not a whole number
+EPISODE_SCHEMA = {
+    "Database": pl.String,
+    "RecordName": pl.String,
+    "intervalNo": pl.Int64,
+    "RecordFs": pl.Int64,
+    "rhythm": pl.String,
+    "Start": pl.Int64,
+    "End": pl.Int64,
+    "IntervalDuration": pl.Float64,
+    "NoOfPAC": pl.Int64,
+    "NoOfPVC": pl.Int64,
+}
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS records (
+    Database TEXT NOT NULL,
+    RecordName TEXT NOT NULL,
+    Location TEXT,
+    RecordFs INTEGER NOT NULL,
+    SignalLength INTEGER NOT NULL,
+    Episodes INTEGER NOT NULL,
+    IndexedAt REAL NOT NULL,
+    PRIMARY KEY (Database, RecordName)
+);
+CREATE TABLE IF NOT EXISTS episodes (
+    Database TEXT NOT NULL,
+    RecordName TEXT NOT NULL,
+    intervalNo INTEGER NOT NULL,
+    RecordFs INTEGER NOT NULL,
+    rhythm TEXT NOT NULL,
+    Start INTEGER NOT NULL,
+    "End" INTEGER NOT NULL,
+    IntervalDuration REAL NOT NULL,
+    NoOfPAC INTEGER NOT NULL,
+    NoOfPVC INTEGER NOT NULL,
+    PRIMARY KEY (Database, RecordName, intervalNo)
+);
+CREATE INDEX IF NOT EXISTS episodes_rhythm_duration ON episodes (rhythm, IntervalDuration);
+CREATE INDEX IF NOT EXISTS episodes_duration ON episodes (IntervalDuration);
+CREATE INDEX IF NOT EXISTS episodes_pac ON episodes (NoOfPAC);
+CREATE INDEX IF NOT EXISTS episodes_pvc ON episodes (NoOfPVC);
+"""
+
+
+def episodes_from_annotations(rd_fs, signal_length, beat_annotations, rhythm_annotations, annotated_indices):
+    """
+    Compute the episode rows of one record from its annotations, without its signal.
+
+    Parameters:
+    - rd_fs: Sampling frequency of the record
+    - signal_length: Number of samples of the record
+    - beat_annotations, rhythm_annotations: NumPy arrays of symbols and auxiliary notes
+    - annotated_indices: Sorted sample indices of the annotations
+
+    Returns:
+    - Dictionary of columns with the rhythm, Start, End, IntervalDuration,
+      NoOfPAC and NoOfPVC that find_rhythm_interval reports for the record
+    """
+    rhythm, rhythm_start, rhythm_end = _rhythm_bounds(rhythm_annotations, annotated_indices, signal_length)
+    lo, hi = _annotation_bounds(annotated_indices, rhythm_start, rhythm_end)
+    pac_cumsum = np.concatenate(([0], np.cumsum(beat_annotations == 'A')))
+    pvc_cumsum = np.concatenate(([0], np.cumsum(beat_annotations == 'V')))
+    # IntervalSignal is signal[Start:End], so its length is End - Start within the record
+    lengths = np.clip(np.minimum(rhythm_end, signal_length) - rhythm_start, 0, None)
+    return {
+        "rhythm": [label.replace("(", "", 1) for label in rhythm],
+        "Start": rhythm_start.tolist(),
+        "End": rhythm_end.tolist(),
+        "IntervalDuration": [round(length / rd_fs, 2) for length in lengths.tolist()],
+        "NoOfPAC": (pac_cumsum[hi] - pac_cumsum[lo]).tolist(),
+        "NoOfPVC": (pvc_cumsum[hi] - pvc_cumsum[lo]).tolist(),
+    }
+
+
+def _with_record_fs(rows, schema):
+    """
+    Build a table of catalog rows with RecordFs as Int64, like the rhythm table.
+
+    Catalogs written before RecordFs became an INTEGER column hold it as REAL,
+    and SQLite keeps fractional frequencies as REAL in either case.
+    """
+    table = pl.DataFrame(rows, orient="row", schema={**schema, "RecordFs": pl.Float64})
+    if (table["RecordFs"] == table["RecordFs"].round()).all():
+        table = table.with_columns(pl.col("RecordFs").cast(pl.Int64))
+    return table
+
+
+class EpisodeCatalog:
+    """
+    SQLite catalog of the rhythm episodes of one or more databases.
+
+    Episodes are indexed by rhythm and duration and by PAC/PVC counts, so
+    queries such as "AFIB episodes of at least 60 s with at least 5 PVCs"
+    are answered without reading any record.
+    """
+
+    def __init__(self, path=DEFAULT_CATALOG, cache=None):
+        """
+        Initialize an EpisodeCatalog object.
+
+        Args:
+            path (str): SQLite file of the catalog; created if missing.
+            cache (RecordCache): Optional cache used to fetch PhysioNet records.
+        """
+        self.path = path
+        self.cache = cache
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA_SQL)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _open_record(self, database, record_name):
+        """Return (location, header, annotation) of a record, without fetching or decoding its signal."""
+        if os.path.isdir(database):
+            location = os.path.abspath(database)
+        elif self.cache is not None:
+            location = os.path.dirname(self.cache.get_annotations(database, record_name))
+        else:
+            header = wfdb.rdheader(record_name, pn_dir=database)
+            annotation = wfdb.rdann(record_name, 'atr', pn_dir=database)
+            annotation.symbol = np.asarray(annotation.symbol)
+            annotation.aux_note = np.asarray(annotation.aux_note)
+            return None, header, annotation
+        reader = RecordReader(location, record_name)
+        return location, reader.get_header(), reader.get_annotation()
+
+    def add_record(self, database, record_name):
+        """
+        Index the episodes of one record, replacing any earlier entry.
+
+        Args:
+            database (str): PhysioNet database name or local WFDB directory.
+            record_name (str): Name of the record.
+
+        Returns:
+            int: Number of episodes indexed.
+        """
+        location, header, annotation = self._open_record(database, record_name)
+        episodes = episodes_from_annotations(header.fs, header.sig_len, annotation.symbol,
+                                             annotation.aux_note, annotation.sample)
+        rows = [
+            (database, record_name, i, header.fs, *values)
+            for i, values in enumerate(zip(episodes["rhythm"], episodes["Start"], episodes["End"],
+                                           episodes["IntervalDuration"], episodes["NoOfPAC"],
+                                           episodes["NoOfPVC"]))
+        ]
+        with self._connect() as connection:
+            connection.execute("DELETE FROM episodes WHERE Database = ? AND RecordName = ?", (database, record_name))
+            connection.executemany("INSERT INTO episodes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            connection.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (database, record_name, location, header.fs, int(header.sig_len),
+                                len(rows), time.time()))
+        return len(rows)
+
+    def index_database(self, database, records=None, refresh=False, progress_callback=None):
+        """
+        Index every record of a database.
+
+        Args:
+            database (str): PhysioNet database name or local WFDB directory.
+            records (list): Optional record names; defaults to every record of the database.
+            refresh (bool): Re-index records that are already in the catalog.
+            progress_callback (callable): Optional callback receiving (record_name, episodes or exception).
+
+        Returns:
+            pl.DataFrame: The records table of the catalog for this database.
+        """
+        if records is None:
+            if os.path.isdir(database):
+                records = list_local_records(database)
+            else:
+                records = (self.cache or RecordCache()).list_records(database)
+        indexed = set() if refresh else set(self.records(database)["RecordName"].to_list())
+        for record_name in records:
+            if record_name in indexed:
+                continue
+            try:
+                result = self.add_record(database, record_name)
+            except Exception as e:
+                result = e
+            if progress_callback:
+                progress_callback(record_name, result)
+        return self.records(database)
+
+    def records(self, database=None):
+        """Return the indexed records, optionally of one database only."""
+        sql = "SELECT Database, RecordName, Location, RecordFs, SignalLength, Episodes, IndexedAt FROM records"
+        params = ()
+        if database is not None:
+            sql += " WHERE Database = ?"
+            params = (database,)
+        with self._connect() as connection:
+            rows = connection.execute(sql + " ORDER BY Database, RecordName", params).fetchall()
+        return _with_record_fs(rows, {
+            "Database": pl.String, "RecordName": pl.String, "Location": pl.String, "RecordFs": pl.Int64,
+            "SignalLength": pl.Int64, "Episodes": pl.Int64, "IndexedAt": pl.Float64,
+        })
+
+    def query(self, rhythm=None, min_duration=None, max_duration=None, min_pac=None, max_pac=None,
+              min_pvc=None, max_pvc=None, database=None, records=None, limit=None):
+        """
+        Find episodes matching all the given filters.
+
+        Args:
+            rhythm (str or list): Rhythm label(s), e.g. 'AFIB' or ['AFIB', 'AFL'].
+            min_duration, max_duration (float): Bounds on IntervalDuration in seconds.
+            min_pac, max_pac (int): Bounds on NoOfPAC.
+            min_pvc, max_pvc (int): Bounds on NoOfPVC.
+            database (str): Only episodes of this database.
+            records (list): Only episodes of these records.
+            limit (int): Maximum number of episodes returned.
+
+        Returns:
+            pl.DataFrame: Matching episodes with the columns of EPISODE_SCHEMA.
+        """
+        conditions, params = [], []
+        if rhythm is not None:
+            rhythms = [rhythm] if isinstance(rhythm, str) else list(rhythm)
+            conditions.append(f"rhythm IN ({', '.join('?' * len(rhythms))})")
+            params += rhythms
+        for column, operator, value in [
+            ("IntervalDuration", ">=", min_duration), ("IntervalDuration", "<=", max_duration),
+            ("NoOfPAC", ">=", min_pac), ("NoOfPAC", "<=", max_pac),
+            ("NoOfPVC", ">=", min_pvc), ("NoOfPVC", "<=", max_pvc),
+        ]:
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+        if database is not None:
+            conditions.append("Database = ?")
+            params.append(database)
+        if records is not None:
+            records = list(records)
+            conditions.append(f"RecordName IN ({', '.join('?' * len(records))})")
+            params += records
+
+        columns = ", ".join(f'"{name}"' for name in EPISODE_SCHEMA)
+        sql = f"SELECT {columns} FROM episodes"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY Database, RecordName, intervalNo"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._connect() as connection:
+            rows = connection.execute(sql, params).fetchall()
+        return _with_record_fs(rows, EPISODE_SCHEMA)
+
+    def fetch_signals(self, episodes, channels=None, signal_dtype="float64"):
+        """
+        Read the signals and annotations of the given episodes, and only those.
+
+        Args:
+            episodes (pl.DataFrame): Rows returned by query.
+            channels: None for the first channel, or a list of channels, see find_rhythm_interval.
+            signal_dtype (str): 'float64', 'float32' or 'int16', see find_rhythm_interval.
+
+        Returns:
+            pl.DataFrame: The episodes with the IntervalSignal (signal[Start:End]),
+            IntervalBeatAnnotations, IntervalAnnotatedIndices and
+            IntervalRhythmAnnotations columns of find_rhythm_interval, plus
+            SignalNames with channels and AdcGain/Baseline in 'int16' mode, so
+            the result can be passed to create_segments.
+        """
+        locations = {(row["Database"], row["RecordName"]): row["Location"] for row in self.records().to_dicts()}
+        channel = 0 if channels is None else list(channels)
+        opened = {}
+        signals, beat_annotations, annotated_indices, rhythm_annotations = [], [], [], []
+        signal_names, adc_gains, baselines = [], [], []
+        for database, record_name, start, end in episodes.select("Database", "RecordName", "Start", "End").rows():
+            key = (database, record_name)
+            if key not in opened:
+                opened[key] = self._open_signals(database, record_name, locations.get(key))
+            reader, header, annotation = opened[key]
+
+            # Annotations of the episode, located like find_rhythm_interval does
+            lo, hi = _annotation_bounds(annotation.sample, start, end)
+            beat_annotations.append(annotation.symbol[lo:hi].tolist())
+            annotated_indices.append(annotation.sample[lo:hi] - start)
+            rhythm_annotations.append(annotation.aux_note[lo:hi].tolist())
+
+            end = min(end, header.sig_len)
+            if reader is None:
+                signals.append(self._read_remote(database, record_name, header, channel, start, end, signal_dtype))
+            elif end > start:
+                signals.append(reader.read_channels(channel, start, end, signal_dtype))
+            else:
+                signals.append(reader.read_channels(channel, start, start + 1, signal_dtype)[:0])
+            columns = np.atleast_1d(channel).tolist()
+            signal_names.append([header.sig_name[ch] for ch in columns])
+            adc_gains.append([float(header.adc_gain[ch]) for ch in columns])
+            baselines.append([int(header.baseline[ch]) for ch in columns])
+
+        n_channels = None if channels is None else len(channel)
+        fetched = episodes.with_columns(
+            _list_series("IntervalSignal", signals, polars_signal_dtype(signal_dtype, n_channels)),
+            pl.Series("IntervalBeatAnnotations", beat_annotations, dtype=pl.List(pl.String)),
+            _list_series("IntervalAnnotatedIndices", annotated_indices, pl.List(pl.Int64)),
+            pl.Series("IntervalRhythmAnnotations", rhythm_annotations, dtype=pl.List(pl.String)),
+        )
+        if channels is not None:
+            fetched = fetched.with_columns(pl.Series("SignalNames", signal_names, dtype=pl.List(pl.String)))
+        if signal_dtype == "int16":
+            if channels is None:
+                gains = [pl.Series("AdcGain", [gain[0] for gain in adc_gains], dtype=pl.Float64),
+                         pl.Series("Baseline", [baseline[0] for baseline in baselines], dtype=pl.Int64)]
+            else:
+                gains = [pl.Series("AdcGain", adc_gains, dtype=pl.Array(pl.Float64, n_channels)),
+                         pl.Series("Baseline", baselines, dtype=pl.Array(pl.Int64, n_channels))]
+            fetched = fetched.with_columns(gains)
+        return fetched
+
+    def _open_signals(self, database, record_name, location):
+        """
+        Return (reader, header, annotation) of a record whose signal is read.
+
+        Records of a remote database are fetched into the cache in full here,
+        as indexing only fetched their headers and annotations. Without a
+        cache the reader is None and episodes are read from PhysioNet.
+        """
+        if not os.path.isdir(database):
+            location = self._fetch_location(database, record_name)
+        elif location is None or not os.path.exists(os.path.join(location, record_name + ".hea")):
+            location = os.path.abspath(database)
+        if location is None:
+            _, header, annotation = self._open_record(database, record_name)
+            return None, header, annotation
+        reader = RecordReader(location, record_name)
+        return reader, reader.get_header(), reader.get_annotation()
+
+    def _fetch_location(self, database, record_name):
+        if self.cache is not None:
+            return os.path.dirname(self.cache.get(database, record_name))
+        return None
+
+    def _read_remote(self, database, record_name, header, channel, start, end, signal_dtype):
+        """Read one episode from PhysioNet when no cache is configured."""
+        columns = np.atleast_1d(channel).tolist()
+        if end <= start:
+            shape = (0,) if np.isscalar(channel) else (0, len(columns))
+            return np.empty(shape, dtype=signal_dtype)
+        physical = signal_dtype != "int16"
+        record = wfdb.rdrecord(record_name, pn_dir=database, sampfrom=start, sampto=end, channels=columns,
+                               physical=physical)
+        if physical:
+            signal = record.p_signal.astype(signal_dtype)
+        else:
+            signal = digital_to_int16(record.d_signal, header.fmt[columns[0]])
+        return signal[:, 0] if np.isscalar(channel) else signal
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query a catalog of rhythm episodes.")
+    parser.add_argument("--catalog", default=DEFAULT_CATALOG, help=f"SQLite catalog file (default: {DEFAULT_CATALOG})")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Local cache of downloaded records")
+    parser.add_argument("--source", default=None,
+                        help="Mirror of the databases: a base URL or a local directory (default: PhysioNet)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    index = commands.add_parser("index", help="Index the episodes of a database")
+    index.add_argument("database", help="PhysioNet database (e.g. mitdb, ltafdb) or a local WFDB directory")
+    index.add_argument("--records", nargs="+", help="Only index these records")
+    index.add_argument("--refresh", action="store_true", help="Re-index records already in the catalog")
+
+    query = commands.add_parser("query", help="Print the episodes matching the filters")
+    query.add_argument("--rhythm", nargs="+", help="Rhythm label(s), e.g. AFIB")
+    query.add_argument("--min-duration", type=float, help="Minimum duration in seconds")
+    query.add_argument("--max-duration", type=float, help="Maximum duration in seconds")
+    query.add_argument("--min-pac", type=int, help="Minimum number of PACs")
+    query.add_argument("--min-pvc", type=int, help="Minimum number of PVCs")
+    query.add_argument("--database", help="Only episodes of this database")
+    query.add_argument("--limit", type=int, help="Maximum number of episodes")
+    query.add_argument("--out", help="Write the episodes to this CSV file instead of printing them")
+    args = parser.parse_args(argv)
+
+    source = None
+    if args.source is not None:
+        source = LocalSource(args.source) if os.path.isdir(args.source) else HTTPSource(args.source)
+    catalog = EpisodeCatalog(args.catalog, cache=RecordCache(args.cache_dir, source=source))
+
+    if args.command == "index":
+        def report(record_name, result):
+            if isinstance(result, Exception):
+                print(f"{record_name}: failed ({type(result).__name__}: {result})", flush=True)
+            else:
+                print(f"{record_name}: {result} episodes", flush=True)
+
+        records = catalog.index_database(args.database, records=args.records, refresh=args.refresh,
+                                         progress_callback=report)
+        print(f"{len(records)} records, {records['Episodes'].sum()} episodes in {args.catalog}")
+        return 0
+
+    started = time.perf_counter()
+    episodes = catalog.query(rhythm=args.rhythm, min_duration=args.min_duration, max_duration=args.max_duration,
+                             min_pac=args.min_pac, min_pvc=args.min_pvc, database=args.database, limit=args.limit)
+    elapsed = time.perf_counter() - started
+    if args.out:
+        episodes.write_csv(args.out)
+    else:
+        with pl.Config(tbl_rows=-1):
+            print(episodes)
+    print(f"{len(episodes)} episodes in {elapsed * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+"""
+Level-of-detail views of long records for plotting.
+
+A SignalPyramid stores the minimum and maximum of the signal over bins of 8,
+64, 512, ... samples. It is built once per record. Any zoom range is then
+drawn from the finest level that covers it in a few thousand bins, and
+aggregated further to about one bin per pixel, so a 24 h record renders as
+fast as a 10 s one. Rhythm bands and beat markers are decimated to the same
+resolution.
+
+Example:
+    view = RecordView(rhythm_table)
+    fig = view.plot(start_sec=3600, end_sec=7200, width=1000)
+"""
+
+import numpy as np
+import polars as pl
+import matplotlib.pyplot as plt
+
+from .signal_dtype import physical_signal, GAIN_COLUMNS
+
+DEFAULT_FACTOR = 8
+DEFAULT_POINTS = 2000
+BUILD_CHUNK_SIZE = DEFAULT_FACTOR ** 7
+
+
+def _reduce(values, size, ufunc):
+    """Reduce consecutive bins of `size` values with ufunc; the last bin may be shorter."""
+    if len(values) == 0:
+        return values[:0]
+    return ufunc.reduceat(values, np.arange(0, len(values), size))
+
+
+class SignalPyramid:
+    """
+    Min/max decimation pyramid of a one-dimensional signal.
+
+    Level 0 is the signal itself; level k holds the minimum and maximum of
+    every bin of factor**k samples. The levels together take about
+    2 / (factor - 1) times the memory of the signal. NaN samples are ignored
+    unless a whole bin is NaN.
+    """
+
+    def __init__(self, signal, factor=DEFAULT_FACTOR, chunk_size=BUILD_CHUNK_SIZE):
+        """
+        Build the pyramid of a signal.
+
+        Args:
+            signal: NumPy array or any sliceable signal, e.g. a MappedSignal;
+                it is read in chunks, so a memory-mapped record is never
+                decoded in full.
+            factor (int): Number of bins of a level merged into one bin of the next level.
+            chunk_size (int): Samples read at a time while building the first level.
+        """
+        if factor < 2:
+            raise ValueError("factor must be at least 2")
+        self.signal = signal
+        self.factor = factor
+        chunk_size = max(factor, chunk_size - chunk_size % factor)
+
+        chunks = [np.asarray(signal[i:i + chunk_size]) for i in range(0, len(signal), chunk_size)]
+        mins = [_reduce(chunk, factor, np.fmin) for chunk in chunks]
+        maxs = [_reduce(chunk, factor, np.fmax) for chunk in chunks]
+        dtype = np.result_type(np.asarray(signal[:0]).dtype, np.float32)
+        level = (np.concatenate(mins).astype(dtype, copy=False) if mins else np.empty(0, dtype),
+                 np.concatenate(maxs).astype(dtype, copy=False) if maxs else np.empty(0, dtype))
+        self.levels = [level]
+        while len(level[0]) > 1:
+            level = (_reduce(level[0], factor, np.fmin), _reduce(level[1], factor, np.fmax))
+            self.levels.append(level)
+
+    def __len__(self):
+        return len(self.signal)
+
+    def nbytes(self):
+        """Memory held by the levels, without the signal itself, in bytes."""
+        return sum(mins.nbytes + maxs.nbytes for mins, maxs in self.levels)
+
+    def bin_size(self, level):
+        """Number of samples per bin at a level (1 for the signal itself)."""
+        return self.factor ** level
+
+    def level_for(self, start, end, max_points=DEFAULT_POINTS):
+        """
+        Return the finest level drawing samples [start, end) from at most
+        factor * max_points values.
+        """
+        budget = self.factor * max_points
+        level = 0
+        while (end - start) / self.bin_size(level) > budget and level < len(self.levels):
+            level += 1
+        return level
+
+    def view(self, start=0, end=None, max_points=DEFAULT_POINTS):
+        """
+        Return at most max_points points drawing the signal between two samples.
+
+        Short ranges return the samples themselves. Longer ranges return one
+        (min, max) pair per bin, both at the centre of the bin, so that a line
+        through the points draws the envelope of the signal.
+
+        Args:
+            start (int): First sample of the view.
+            end (int): Sample after the last one; defaults to the end of the signal.
+            max_points (int): Upper bound on the number of returned points, e.g. twice the pixel width.
+
+        Returns:
+            tuple: (x, y) NumPy arrays of sample positions and values.
+        """
+        end = len(self) if end is None else min(int(end), len(self))
+        start = max(0, min(int(start), end))
+        if end - start <= max_points:
+            return np.arange(start, end), np.asarray(self.signal[start:end])
+
+        level = self.level_for(start, end, max_points)
+        size = self.bin_size(level)
+        first, last = start // size, -(-end // size)
+        if level == 0:
+            values = np.asarray(self.signal[start:end])
+            mins = maxs = values
+            first = start
+        else:
+            mins, maxs = (values[first:last] for values in self.levels[level - 1])
+
+        # Merge bins of the level so that there are at most max_points // 2 of them
+        group = -(-len(mins) // max(1, max_points // 2))
+        mins, maxs = _reduce(mins, group, np.fmin), _reduce(maxs, group, np.fmax)
+        centres = (first + np.arange(len(mins)) * group) * size + group * size // 2
+        centres = np.minimum(centres, end - 1)
+        x = np.repeat(centres, 2)
+        y = np.empty(2 * len(mins), dtype=mins.dtype)
+        y[0::2], y[1::2] = mins, maxs
+        return x, y
+
+
+def _signal_of(rhythm_table, channel=0):
+    """Reassemble the signal of a record from the IntervalSignal column of its rhythm table."""
+    column = rhythm_table["IntervalSignal"]
+    if isinstance(column.dtype.inner, pl.Array):
+        column = column.list.eval(pl.element().arr.get(channel))
+    lengths = column.list.len().fill_null(0).to_numpy()
+    starts = rhythm_table["Start"].to_numpy()
+    length = int((starts + lengths).max()) if len(starts) else 0
+
+    values = column.filter(pl.Series(lengths > 0)).explode().to_numpy()
+    if column.dtype.inner == pl.Int16:
+        if not all(gain in rhythm_table.columns for gain in GAIN_COLUMNS):
+            raise ValueError(f"IntervalSignal holds ADC samples but the table has no {GAIN_COLUMNS} columns")
+        adc_gain, baseline = (np.atleast_1d(rhythm_table[gain][0]) for gain in GAIN_COLUMNS)
+        index = min(channel, len(adc_gain) - 1)
+        values = physical_signal(values, adc_gain[index], baseline[index])
+
+    # Samples between intervals (the End of each interval) are not in the table
+    signal = np.full(length, np.nan, dtype=np.result_type(values.dtype, np.float32))
+    offset = 0
+    for start, n in zip(starts.tolist(), lengths.tolist()):
+        signal[start:start + n] = values[offset:offset + n]
+        offset += n
+    return signal
+
+
+class RecordView:
+    """
+    Zoomable view of one record: its signal, rhythm bands and beat markers.
+
+    Everything needed is prepared once from the rhythm table, so each view
+    costs time proportional to the number of points drawn, not to the
+    length of the record.
+    """
+
+    def __init__(self, rhythm_table, channel=0, factor=DEFAULT_FACTOR):
+        """
+        Initialize a RecordView object.
+
+        Args:
+            rhythm_table (pl.DataFrame): Table returned by find_rhythm_interval, in any signal dtype.
+            channel (int): Channel drawn when the table holds multi-channel signals.
+            factor (int): Decimation factor between levels of the signal pyramid.
+        """
+        self.fs = float(rhythm_table["RecordFs"][0]) if len(rhythm_table) else 1.0
+        self.pyramid = SignalPyramid(_signal_of(rhythm_table, channel), factor=factor)
+
+        self.band_starts = rhythm_table["Start"].to_numpy()
+        # End is the last sample of an interval; bands end after it
+        self.band_ends = np.minimum(rhythm_table["End"].to_numpy() + 1, len(self.pyramid))
+        self.rhythms = rhythm_table["rhythm"].to_numpy()
+
+        # Annotated indices are relative to the start of their interval
+        annotations = rhythm_table.select(
+            (pl.col("IntervalAnnotatedIndices") + pl.col("Start")).explode().alias("Sample"),
+            pl.col("IntervalBeatAnnotations").explode().alias("Symbol"),
+        ).drop_nulls().filter(pl.col("Symbol") != "+")
+        self.marker_samples = annotations["Sample"].to_numpy()
+        self.marker_symbols = annotations["Symbol"].to_numpy().astype(str)
+        self.symbol_names, self.marker_codes = np.unique(self.marker_symbols, return_inverse=True)
+
+    def __len__(self):
+        return len(self.pyramid)
+
+    def nbytes(self):
+        """Memory held by the signal, its pyramid and the markers, in bytes."""
+        return (np.asarray(self.pyramid.signal).nbytes + self.pyramid.nbytes() + self.marker_samples.nbytes
+                + self.marker_symbols.nbytes + self.marker_codes.nbytes)
+
+    def signal(self, start=0, end=None, max_points=DEFAULT_POINTS):
+        """Return (x, y) of the signal between two samples, see SignalPyramid.view."""
+        return self.pyramid.view(start, end, max_points)
+
+    def bands(self, start=0, end=None, max_bands=DEFAULT_POINTS):
+        """
+        Return the rhythm intervals overlapping samples [start, end), clipped to the range.
+
+        When more than max_bands intervals overlap, the range is divided into
+        max_bands bins labelled with the rhythm at their centre, and
+        consecutive bins with the same rhythm are merged; bins whose centre
+        lies outside every interval, e.g. before the first one, get no band.
+
+        Returns:
+            pl.DataFrame: Columns rhythm, Start and End (exclusive).
+        """
+        end = len(self) if end is None else min(int(end), len(self))
+        start = max(0, min(int(start), end))
+        lo = np.searchsorted(self.band_ends, start, side="right")
+        hi = np.searchsorted(self.band_starts, end, side="left")
+        if hi - lo <= max_bands:
+            rhythms = self.rhythms[lo:hi]
+            starts = np.maximum(self.band_starts[lo:hi], start)
+            ends = np.minimum(self.band_ends[lo:hi], end)
+        else:
+            edges = start + (end - start) * np.arange(max_bands + 1) // max_bands
+            centres = (edges[:-1] + edges[1:]) // 2
+            # Bins before the first interval, or past the end of the one before them, get no band
+            interval = np.searchsorted(self.band_starts, centres, side="right") - 1
+            covered = interval >= 0
+            covered[covered] = centres[covered] < self.band_ends[interval[covered]]
+            labels = np.full(len(centres), None, dtype=object)
+            labels[covered] = self.rhythms[interval[covered]]
+            changes = np.flatnonzero(np.concatenate(([True], labels[1:] != labels[:-1])))
+            keep = covered[changes]
+            rhythms = labels[changes][keep]
+            starts = edges[changes][keep]
+            ends = np.append(edges[changes[1:]], end)[keep]
+        return pl.DataFrame({"rhythm": rhythms.tolist(), "Start": starts.tolist(), "End": ends.tolist()},
+                            schema={"rhythm": pl.String, "Start": pl.Int64, "End": pl.Int64})
+
+    def markers(self, start=0, end=None, max_points=DEFAULT_POINTS):
+        """
+        Return the beat annotations between two samples.
+
+        When there are more than max_points, only the first annotation of
+        each symbol in each of max_points bins is kept, so rare beats (e.g.
+        PVCs) stay visible among frequent ones.
+
+        Returns:
+            pl.DataFrame: Columns Sample and Symbol.
+        """
+        end = len(self) if end is None else min(int(end), len(self))
+        start = max(0, min(int(start), end))
+        lo, hi = np.searchsorted(self.marker_samples, [start, end], side="left")
+        samples, symbols = self.marker_samples[lo:hi], self.marker_symbols[lo:hi]
+        if len(samples) > max_points:
+            bins = (samples - start) * max_points // max(1, end - start)
+            _, keep = np.unique(bins * len(self.symbol_names) + self.marker_codes[lo:hi], return_index=True)
+            keep.sort()
+            samples, symbols = samples[keep], symbols[keep]
+        return pl.DataFrame({"Sample": samples.tolist(), "Symbol": symbols.tolist()},
+                            schema={"Sample": pl.Int64, "Symbol": pl.String})
+
+    def plot(self, start_sec=0, end_sec=None, width=1000, height=4):
+        """
+        Plot the signal with its rhythm bands and beat markers.
+
+        Args:
+            start_sec (float): Start of the view in seconds.
+            end_sec (float): End of the view in seconds; defaults to the end of the record.
+            width (int): Width of the plot in pixels; bounds the number of points drawn.
+            height (float): Height of the figure in inches.
+
+        Returns:
+            matplotlib.figure.Figure: The figure, e.g. for st.pyplot.
+        """
+        start = int(start_sec * self.fs)
+        end = len(self) if end_sec is None else int(end_sec * self.fs)
+        dpi = 100
+        fig, ax = plt.subplots(figsize=(width / dpi, height), dpi=dpi)
+
+        bands = self.bands(start, end, max_bands=width)
+        colors = dict(zip(sorted(set(self.rhythms.tolist())), plt.cm.tab10.colors * 10))
+        labelled = set()
+        for rhythm, band_start, band_end in bands.iter_rows():
+            ax.axvspan(band_start / self.fs, band_end / self.fs, color=colors[rhythm], alpha=0.15, lw=0,
+                       label=None if rhythm in labelled else rhythm)
+            labelled.add(rhythm)
+
+        x, y = self.signal(start, end, max_points=2 * width)
+        ax.plot(x / self.fs, y, color="black", lw=0.5)
+
+        markers = self.markers(start, end, max_points=width).filter(pl.col("Symbol") != "N")
+        if len(markers):
+            top = np.nanmax(y) if len(y) and not np.all(np.isnan(y)) else 0.0
+            for symbol, group in markers.group_by("Symbol", maintain_order=True):
+                ax.scatter(group["Sample"].to_numpy() / self.fs, np.full(len(group), top), marker="v", s=12,
+                           label=f"beat {symbol[0]}")
+
+        ax.set_xlim(start / self.fs, end / self.fs)
+        ax.set_xlabel("Time (seconds)")
+        ax.set_ylabel("Amplitude")
+        if labelled or len(markers):
+            ax.legend(loc="upper right", fontsize="small", ncol=4)
+        fig.tight_layout()
+        return fig
@@ -0,0 +1,353 @@
+"""
+Columnar export and re-import of rhythm and segment tables.
+
+Tables are written as Parquet or Arrow IPC in a compact schema: segment
+signals become fixed-size numeric arrays, beat and rhythm labels become
+categoricals and sample offsets are stored as 32-bit integers. Arrow IPC
+files can be memory-mapped by downstream jobs without parsing.
+
+Large segment tables can also be streamed out in record/interval chunks, as
+newline-delimited JSON or as a zip of per-chunk Parquet files, so that only
+one chunk is serialized at a time.
+"""
+
+import io
+import os
+import zipfile
+import polars as pl
+
+FORMATS = {
+    "parquet": {"extensions": (".parquet", ".pq"), "mime": "application/vnd.apache.parquet"},
+    "arrow": {"extensions": (".arrow", ".ipc", ".feather"), "mime": "application/vnd.apache.arrow.file"},
+}
+
+STREAM_FORMATS = {
+    "ndjson": {"extensions": (".ndjson", ".jsonl"), "mime": "application/x-ndjson"},
+    "parquet-zip": {"extensions": (".zip",), "mime": "application/zip"},
+}
+
+# Rows per streamed chunk; whole intervals are kept together up to this size
+DEFAULT_CHUNK_ROWS = 100
+
+# Label columns stored as categoricals, and list columns of labels
+CATEGORICAL_COLUMNS = ["RecordName", "rhythm", "rhythm_type"]
+CATEGORICAL_LIST_COLUMNS = ["IntervalBeatAnnotations", "IntervalRhythmAnnotations", "annotations"]
+INDEX_LIST_COLUMNS = ["IntervalAnnotatedIndices", "indices"]
+SIGNAL_COLUMNS = ["IntervalSignal", "signals"]
+
+
+def _signal_width(series):
+    """Return the common length of a list column of signals, or None if the lengths differ."""
+    lengths = series.list.len().unique()
+    if len(lengths) == 1 and lengths[0] > 0:
+        return int(lengths[0])
+    return None
+
+
+def to_compact(table):
+    """
+    Convert a rhythm or segment table to the compact export schema.
+
+    Parameters:
+    - table: Polars DataFrame returned by find_rhythm_interval or create_segments
+
+    Returns:
+    - Polars DataFrame with fixed-size signal arrays where all signals have the
+      same length, categorical labels and Int32 sample offsets
+    """
+    columns = []
+    for name in table.columns:
+        dtype = table.schema[name]
+        if name in CATEGORICAL_COLUMNS and dtype == pl.String:
+            columns.append(pl.col(name).cast(pl.Categorical))
+        elif name in CATEGORICAL_LIST_COLUMNS and dtype == pl.List(pl.String):
+            columns.append(pl.col(name).cast(pl.List(pl.Categorical)))
+        elif name in INDEX_LIST_COLUMNS and dtype == pl.List(pl.Int64):
+            columns.append(pl.col(name).cast(pl.List(pl.Int32)))
+        elif name in SIGNAL_COLUMNS and isinstance(dtype, pl.List) and len(table):
+            width = _signal_width(table[name])
+            columns.append(pl.col(name).list.to_array(width) if width else pl.col(name))
+        else:
+            columns.append(pl.col(name))
+    return table.select(columns)
+
+
+def from_compact(table):
+    """
+    Convert a table in the compact export schema back to the in-memory schema.
+
+    Parameters:
+    - table: Polars DataFrame read with read_table
+
+    Returns:
+    - Polars DataFrame with the columns and dtypes of find_rhythm_interval or create_segments
+    """
+    columns = []
+    for name in table.columns:
+        dtype = table.schema[name]
+        if name in CATEGORICAL_COLUMNS and dtype == pl.Categorical:
+            columns.append(pl.col(name).cast(pl.String))
+        elif name in CATEGORICAL_LIST_COLUMNS and dtype == pl.List(pl.Categorical):
+            columns.append(pl.col(name).cast(pl.List(pl.String)))
+        elif name in INDEX_LIST_COLUMNS and dtype == pl.List(pl.Int32):
+            columns.append(pl.col(name).cast(pl.List(pl.Int64)))
+        elif name in SIGNAL_COLUMNS and isinstance(dtype, pl.Array):
+            columns.append(pl.col(name).arr.to_list())
+        else:
+            columns.append(pl.col(name))
+    return table.select(columns)
+
+
+def _format_of(path, format):
+    if format is not None:
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format {format!r}, expected one of {sorted(FORMATS)}")
+        return format
+    extension = os.path.splitext(str(path))[1].lower()
+    for name, spec in FORMATS.items():
+        if extension in spec["extensions"]:
+            return name
+    raise ValueError(f"Cannot infer the format of {path!r}; pass format='parquet' or format='arrow'")
+
+
+def write_table(table, path, format=None, compression=None):
+    """
+    Write a rhythm or segment table as Parquet or Arrow IPC.
+
+    Parameters:
+    - table: Polars DataFrame returned by find_rhythm_interval or create_segments,
+      or a LazySegmentTable, which is materialized here
+    - path: Output path or binary file object
+    - format: 'parquet' or 'arrow'; inferred from the file extension when omitted
+    - compression: Compression codec; defaults to zstd for Parquet and to
+      uncompressed for Arrow IPC, so that IPC files can be memory-mapped
+    """
+    format = _format_of(path, format)
+    if hasattr(table, "to_eager"):
+        table = table.to_eager()
+    compact = to_compact(table)
+    if format == "parquet":
+        compact.write_parquet(path, compression=compression or "zstd")
+    else:
+        compact.write_ipc(path, compression=compression or "uncompressed")
+
+
+def read_table(path, format=None, memory_map=True, compact=False):
+    """
+    Read a table written with write_table.
+
+    Parameters:
+    - path: Input path or binary file object
+    - format: 'parquet' or 'arrow'; inferred from the file extension when omitted
+    - memory_map: Memory-map Arrow IPC files instead of reading them into memory
+    - compact: Keep the compact export schema instead of restoring the in-memory one
+
+    Returns:
+    - Polars DataFrame
+    """
+    format = _format_of(path, format)
+    if format == "parquet":
+        table = pl.read_parquet(path)
+    else:
+        table = pl.read_ipc(path, memory_map=memory_map)
+    return table if compact else from_compact(table)
+
+
+def table_to_bytes(table, format):
+    """
+    Serialize a table to bytes, e.g. for a download button.
+
+    Parameters:
+    - table: Polars DataFrame returned by find_rhythm_interval or create_segments
+    - format: 'parquet' or 'arrow'
+
+    Returns:
+    - Bytes of the Parquet or Arrow IPC file
+    """
+    buffer = io.BytesIO()
+    write_table(table, buffer, format=format)
+    return buffer.getvalue()
+
+
+def _chunk_bounds(record_names, interval_numbers, max_rows):
+    """Return (offset, length) of chunks of at most max_rows rows that do not split intervals,
+    except intervals longer than max_rows, which are split into chunks of their own."""
+    n_rows = len(record_names)
+    if n_rows == 0:
+        return []
+    keys = pl.DataFrame({"RecordName": record_names, "intervalNo": interval_numbers})
+    changed = keys.select(pl.any_horizontal(pl.all().ne_missing(pl.all().shift(1)))).to_series()
+    starts = changed.arg_true().to_list()
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+
+    bounds = []
+    chunk_start = 0
+    for group_start, group_end in zip(starts, starts[1:] + [n_rows]):
+        if group_end - chunk_start <= max_rows:
+            continue
+        if group_start > chunk_start:
+            bounds.append((chunk_start, group_start - chunk_start))
+        chunk_start = group_start
+        while group_end - chunk_start > max_rows:
+            bounds.append((chunk_start, max_rows))
+            chunk_start += max_rows
+    bounds.append((chunk_start, n_rows - chunk_start))
+    return bounds
+
+
+def iter_chunks(tables, max_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Split segment tables into chunks aligned to record/interval boundaries.
+
+    Parameters:
+    - tables: Polars DataFrame returned by create_segments, a LazySegmentTable,
+      or an iterable of DataFrames such as iter_segments; lazy tables are
+      materialized one chunk at a time. Rhythm tables, whose rows are
+      intervals, are accepted as well
+    - max_rows: Maximum number of rows per chunk; consecutive intervals are
+      packed together up to this size and longer intervals are split
+
+    Yields:
+    - Polars DataFrames with the columns of the input tables
+    """
+    if max_rows < 1:
+        raise ValueError("max_rows must be at least 1")
+    if isinstance(tables, pl.DataFrame) or hasattr(tables, "to_eager"):
+        tables = [tables]
+    for table in tables:
+        keys = table.index if hasattr(table, "to_eager") else table
+        intervals = keys["intervalNo"] if "intervalNo" in keys.columns else pl.int_range(len(keys), eager=True)
+        for offset, length in _chunk_bounds(keys["RecordName"], intervals, max_rows):
+            chunk = table.slice(offset, length)
+            yield chunk.to_eager() if hasattr(chunk, "to_eager") else chunk
+
+
+def _json_ready(table):
+    """Convert fixed-size array columns to lists, which the NDJSON writer cannot serialize."""
+    columns = []
+    for name, dtype in table.schema.items():
+        if isinstance(dtype, pl.Array):
+            columns.append(pl.col(name).arr.to_list())
+        elif isinstance(dtype, pl.List) and isinstance(dtype.inner, pl.Array):
+            columns.append(pl.col(name).list.eval(pl.element().arr.to_list()))
+        else:
+            columns.append(pl.col(name))
+    return table.select(columns)
+
+
+def iter_ndjson(tables, max_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Serialize segment tables as newline-delimited JSON, one chunk at a time.
+
+    Parameters:
+    - tables: Segment tables, see iter_chunks
+    - max_rows: Maximum number of rows serialized at a time
+
+    Yields:
+    - Bytes of the JSON lines of each chunk, one line per segment
+    """
+    for chunk in iter_chunks(tables, max_rows):
+        buffer = io.BytesIO()
+        _json_ready(chunk).write_ndjson(buffer)
+        yield buffer.getvalue()
+
+
+class _ChunkWriter(io.RawIOBase):
+    """Non-seekable sink collecting the bytes written by ZipFile until they are taken."""
+
+    def __init__(self):
+        super().__init__()
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        return len(data)
+
+    def take(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def iter_parquet_zip(tables, max_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Serialize segment tables as a zip archive of Parquet files, one chunk at a time.
+
+    Each chunk is written with write_table as part-00000.parquet,
+    part-00001.parquet, ... and can be read back with read_table. The archive
+    is written to a non-seekable stream, so sizes and checksums follow each
+    member instead of being patched into its header afterwards.
+
+    Parameters:
+    - tables: Segment tables, see iter_chunks
+    - max_rows: Maximum number of rows serialized at a time
+
+    Yields:
+    - Bytes of the zip archive, one piece per chunk followed by the central directory
+    """
+    writer = _ChunkWriter()
+    with zipfile.ZipFile(writer, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for number, chunk in enumerate(iter_chunks(tables, max_rows)):
+            buffer = io.BytesIO()
+            write_table(chunk, buffer, format="parquet")
+            archive.writestr(f"part-{number:05d}.parquet", buffer.getvalue())
+            yield writer.take()
+    yield writer.take()
+
+
+def _stream_format_of(path, format):
+    if format is not None:
+        if format not in STREAM_FORMATS:
+            raise ValueError(f"Unknown format {format!r}, expected one of {sorted(STREAM_FORMATS)}")
+        return format
+    extension = os.path.splitext(str(path))[1].lower()
+    for name, spec in STREAM_FORMATS.items():
+        if extension in spec["extensions"]:
+            return name
+    raise ValueError(f"Cannot infer the format of {path!r}; pass format='ndjson' or format='parquet-zip'")
+
+
+def iter_export(tables, format, max_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Serialize segment tables chunk by chunk in a streaming format.
+
+    Parameters:
+    - tables: Segment tables, see iter_chunks
+    - format: 'ndjson' or 'parquet-zip'
+    - max_rows: Maximum number of rows serialized at a time
+
+    Yields:
+    - Bytes of the export, e.g. to write to a file or an HTTP response
+    """
+    format = _stream_format_of(None, format)
+    if format == "ndjson":
+        return iter_ndjson(tables, max_rows)
+    return iter_parquet_zip(tables, max_rows)
+
+
+def export_stream(tables, path, format=None, max_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Write segment tables to a file chunk by chunk, keeping peak memory at one chunk.
+
+    Parameters:
+    - tables: Segment tables, see iter_chunks
+    - path: Output path or binary file object
+    - format: 'ndjson' or 'parquet-zip'; inferred from the file extension when omitted
+    - max_rows: Maximum number of rows serialized at a time
+
+    Returns:
+    - Number of bytes written
+    """
+    format = _stream_format_of(path, format)
+    if not hasattr(path, "write"):
+        with open(path, "wb") as output:
+            return export_stream(tables, output, format=format, max_rows=max_rows)
+    written = 0
+    for data in iter_export(tables, format, max_rows):
+        path.write(data)
+        written += len(data)
+    return written
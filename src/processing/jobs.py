@@ -0,0 +1,255 @@
+"""
+Background pipeline jobs with progress, cancellation and supersession.
+
+A JobRunner runs pipeline functions on a thread pool. Each job is submitted
+to a slot (for example one per app session and stage) together with the key
+of its inputs: submitting a different key to the same slot cancels the
+stale job, and submitting the same key again returns the running job.
+
+Jobs receive an Instrumentation. Its progress events are kept as the job's
+progress, and every progress point and stage boundary doubles as a
+cancellation point, so a cancelled job stops at the next interval of
+create_segments or the next stage of find_rhythm_interval.
+
+Example:
+    runner = JobRunner()
+    job = runner.submit("segments", (record_name, 30, 5),
+                        lambda instrumentation: create_segments(rhythm_table, 30, 5,
+                                                                instrumentation=instrumentation))
+    segments_table = job.result(timeout=600)
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+from .metrics import Instrumentation
+
+DEFAULT_WORKERS = 2
+
+# Finished jobs are forgotten when they have not been looked at for this many seconds
+DEFAULT_RETENTION = 600.0
+
+
+class JobCancelled(Exception):
+    """Raised inside a cancelled job at its next cancellation point, and by Job.result."""
+
+
+class _JobInstrumentation(Instrumentation):
+    """Instrumentation that raises JobCancelled once its job is cancelled."""
+
+    def __init__(self, *sinks, cancelled, **settings):
+        super().__init__(*sinks, **settings)
+        self.cancelled = cancelled
+
+    @property
+    def enabled(self):
+        # Always report, so that every progress call reaches the cancellation check
+        return True
+
+    def with_sinks(self, *sinks):
+        return _JobInstrumentation(*self.sinks, *sinks, cancelled=self.cancelled,
+                                   progress_interval=self.progress_interval, trace_memory=self.trace_memory)
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    @contextmanager
+    def stage(self, stage, record=None):
+        self.check()
+        with super().stage(stage, record) as event:
+            yield event
+        self.check()
+
+    def progress(self, stage, done, total=None, record=None, message=None):
+        self.check()
+        return super().progress(stage, done, total, record, message)
+
+
+class Job:
+    """
+    A pipeline function running in the background.
+
+    Attributes:
+        slot: Slot the job was submitted to.
+        key: Inputs the job's result depends on.
+        status (str): 'pending', 'running', 'done', 'failed' or 'cancelled'.
+        progress (dict): Latest progress event, or None before the first one.
+        started (float): time.time() the job started running, or None.
+        finished (float): time.time() the job finished, or None.
+    """
+
+    def __init__(self, slot, key, function, progress_interval):
+        self.slot = slot
+        self.key = key
+        self.status = "pending"
+        self.progress = None
+        self.started = None
+        self.finished = None
+        self.last_seen = time.time()
+        self._function = function
+        self._cancelled = threading.Event()
+        self._instrumentation = _JobInstrumentation(self._record_progress, cancelled=self._cancelled,
+                                                    progress_interval=progress_interval)
+        self._future = None
+
+    def _record_progress(self, event):
+        if event["event"] == "progress":
+            self.progress = event
+
+    def _run(self):
+        if self._cancelled.is_set():
+            self.status = "cancelled"
+            raise JobCancelled()
+        self.status = "running"
+        self.started = time.time()
+        try:
+            value = self._function(self._instrumentation)
+        except JobCancelled:
+            self.status = "cancelled"
+            raise
+        except BaseException:
+            self.status = "cancelled" if self._cancelled.is_set() else "failed"
+            raise
+        finally:
+            self.finished = time.time()
+        self.status = "done"
+        return value
+
+    def cancel(self):
+        """Ask the job to stop at its next cancellation point."""
+        self._cancelled.set()
+        if self._future is not None and self._future.cancel():
+            self.status = "cancelled"
+            self.finished = time.time()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def done(self):
+        """Whether the job has finished, failed or been cancelled."""
+        self.last_seen = time.time()
+        return self._future.done()
+
+    def fraction(self):
+        """Fraction of the work done according to the latest progress event, or None."""
+        if self.status == "done":
+            return 1.0
+        if not self.progress or not self.progress["total"]:
+            return None
+        return min(1.0, self.progress["done"] / self.progress["total"])
+
+    def message(self):
+        """Message of the latest progress event, or None."""
+        return self.progress["message"] if self.progress else None
+
+    def elapsed(self):
+        """Seconds the job has been running, or ran."""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def result(self, timeout=None):
+        """
+        Return the job's result, waiting up to timeout seconds.
+
+        Raises:
+            JobCancelled: If the job was cancelled.
+            TimeoutError: If the job is still running after timeout seconds.
+            Exception: The exception raised by the job's function.
+        """
+        self.last_seen = time.time()
+        try:
+            return self._future.result(timeout)
+        except (JobCancelled, CancelledError):
+            raise JobCancelled()
+        except Exception:
+            if self.cancelled:
+                raise JobCancelled()
+            raise
+
+
+class JobRunner:
+    """
+    Runs jobs on a thread pool, at most one current job per slot.
+
+    Threads share the caller's memory, so results are handed back without
+    copies; the NumPy and Polars work of the pipeline releases the GIL.
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, progress_interval=0.25, retention=DEFAULT_RETENTION):
+        """
+        Initialize a JobRunner object.
+
+        Args:
+            max_workers (int): Number of jobs running at the same time.
+            progress_interval (float): Minimum number of seconds between two
+                progress updates of a job.
+            retention (float): Seconds a finished job stays available after it
+                was last looked at with done() or result().
+        """
+        self.progress_interval = progress_interval
+        self.retention = retention
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ecg-job")
+        self.__jobs = {}  # slot -> Job
+        self.__lock = threading.Lock()
+
+    def submit(self, slot, key, function):
+        """
+        Start a job in a slot, superseding the slot's job for other inputs.
+
+        Args:
+            slot: Hashable name of the slot, e.g. (session id, 'segments').
+            key: Hashable inputs of the job; a running or finished job of the
+                slot with the same key is returned instead of starting a new
+                one, unless it was cancelled or failed.
+            function (callable): Function taking an Instrumentation and
+                returning the job's result.
+
+        Returns:
+            Job: The slot's current job.
+        """
+        with self.__lock:
+            self._prune()
+            current = self.__jobs.get(slot)
+            if current is not None:
+                if current.key == key and current.status not in ("cancelled", "failed"):
+                    current.last_seen = time.time()
+                    return current
+                current.cancel()
+            job = Job(slot, key, function, self.progress_interval)
+            job._future = self.__executor.submit(job._run)
+            self.__jobs[slot] = job
+            return job
+
+    def get(self, slot):
+        """Return the slot's current job, or None."""
+        with self.__lock:
+            return self.__jobs.get(slot)
+
+    def cancel(self, slot):
+        """Cancel the slot's current job, if any."""
+        job = self.get(slot)
+        if job is not None:
+            job.cancel()
+
+    def _prune(self):
+        now = time.time()
+        for slot, job in list(self.__jobs.items()):
+            if job._future.done() and now - job.last_seen > self.retention:
+                del self.__jobs[slot]
+
+    def jobs(self):
+        """Return the current job of every slot."""
+        with self.__lock:
+            return list(self.__jobs.values())
+
+    def shutdown(self, cancel=True):
+        """Stop the worker threads, cancelling the current jobs first by default."""
+        if cancel:
+            for job in self.jobs():
+                job.cancel()
+        self.__executor.shutdown(wait=True)
@@ -0,0 +1,235 @@
+"""
+Lazy segment tables.
+
+A segment is described by (record, interval, offset, length) over one shared
+buffer holding the interval signals of the rhythm table, so overlapping
+windows do not store their samples again. Segments are materialized only when
+accessed, exported or converted to the eager create_segments table.
+"""
+
+import numpy as np
+import polars as pl
+
+from .rhythm_segmentation import (
+    _window_starts,
+    _annotation_bounds,
+    _ragged_series,
+    _empty_segment_table,
+    _metadata_schema,
+)
+
+
+def _flatten(series, dtype):
+    """Return the flat values of a list column and the offsets of each row."""
+    lengths = series.list.len().fill_null(0).to_numpy()
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+    values = series.explode().drop_nulls().to_numpy()
+    if dtype is not None:
+        values = values.astype(dtype, copy=False)
+    return values, offsets
+
+
+class LazySegmentTable:
+    """
+    Segment table whose windows are views over shared interval signals.
+
+    The index holds one row per segment with the columns RecordName,
+    intervalNo, rhythm_type, offset (first sample in the shared signal
+    buffer), length, and the range of its annotations in the shared
+    annotation buffers, plus the SignalNames and AdcGain/Baseline columns
+    of multi-channel and int16 signals. Memory grows with the number of segments, not with
+    segments x window length.
+    """
+
+    def __init__(self, index, signal, beat_annotations, annotated_indices):
+        """
+        Initialize a LazySegmentTable object.
+
+        Args:
+            index (pl.DataFrame): One row per segment, see the class docstring.
+            signal (np.ndarray): Concatenated interval signals.
+            beat_annotations (np.ndarray): Concatenated beat symbols of all intervals.
+            annotated_indices (np.ndarray): Concatenated annotation positions,
+                expressed in the coordinates of the signal buffer.
+        """
+        self.__index = index
+        self.__signal = signal
+        self.__beat_annotations = beat_annotations
+        self.__annotated_indices = annotated_indices
+
+    @classmethod
+    def from_rhythm_table(cls, record_rhythm_table, window_size, window_step):
+        """
+        Describe the segments create_segments would produce, without copying samples.
+
+        Args:
+            record_rhythm_table (pl.DataFrame): Table returned by find_rhythm_interval.
+            window_size (float): Size of each segment window in seconds.
+            window_step (float): Step size between windows in seconds.
+
+        Returns:
+            LazySegmentTable: The lazy segment table.
+        """
+        # The signal buffer keeps the dtype (float64, float32 or int16) and the channels of the rhythm table
+        signal, signal_offsets = _flatten(record_rhythm_table['IntervalSignal'], None)
+        beat_annotations, annotation_offsets = _flatten(record_rhythm_table['IntervalBeatAnnotations'], str)
+        annotated_indices, _ = _flatten(record_rhythm_table['IntervalAnnotatedIndices'], np.int64)
+        # Move annotation positions from interval to buffer coordinates
+        annotation_rows = np.repeat(np.arange(len(record_rhythm_table)), np.diff(annotation_offsets))
+        annotated_indices = annotated_indices + signal_offsets[annotation_rows]
+
+        fs = record_rhythm_table['RecordFs'].to_list()
+        durations = record_rhythm_table['IntervalDuration'].to_list()
+
+        rows, offsets, lengths = [], [], []
+        for row in range(len(record_rhythm_table)):
+            if durations[row] < window_size:
+                continue
+            window_size_samples = int(window_size * fs[row])
+            window_step_samples = int(window_step * fs[row])
+            interval_length = signal_offsets[row + 1] - signal_offsets[row]
+            starts = _window_starts(interval_length, window_size_samples, window_step_samples)
+            rows.append(np.full(len(starts), row))
+            offsets.append(signal_offsets[row] + starts)
+            lengths.append(np.full(len(starts), window_size_samples))
+
+        rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+        offsets = np.concatenate(offsets) if offsets else np.empty(0, dtype=np.int64)
+        lengths = np.concatenate(lengths) if lengths else np.empty(0, dtype=np.int64)
+
+        # A window only sees the annotations of its own interval
+        interval_lo = annotation_offsets[rows]
+        interval_hi = annotation_offsets[rows + 1]
+        lo, hi = _annotation_bounds(annotated_indices, offsets, offsets + lengths - 1)
+        lo = np.clip(lo, interval_lo, interval_hi)
+        hi = np.clip(hi, lo, interval_hi)
+
+        metadata = {name: record_rhythm_table[name].gather(rows) for name in _metadata_schema(record_rhythm_table)}
+        index = pl.DataFrame({
+            'RecordName': record_rhythm_table['RecordName'].gather(rows).cast(pl.String),
+            'intervalNo': pl.Series(rows, dtype=pl.Int64),
+            'rhythm_type': record_rhythm_table['rhythm'].gather(rows).cast(pl.String),
+            'offset': pl.Series(offsets, dtype=pl.Int64),
+            'length': pl.Series(lengths, dtype=pl.Int64),
+            'annotation_start': pl.Series(lo, dtype=pl.Int64),
+            'annotation_end': pl.Series(hi, dtype=pl.Int64),
+            **metadata,
+        })
+        return cls(index, signal, beat_annotations, annotated_indices)
+
+    @property
+    def index(self):
+        return self.__index
+
+    def __len__(self):
+        return len(self.__index)
+
+    def signal(self, i):
+        """Return the signal of segment i as a view of the shared buffer."""
+        offset, length = self.__index['offset'][i], self.__index['length'][i]
+        return self.__signal[offset:offset + length]
+
+    def annotations(self, i):
+        lo, hi = self.__index['annotation_start'][i], self.__index['annotation_end'][i]
+        return self.__beat_annotations[lo:hi]
+
+    def indices(self, i):
+        lo, hi = self.__index['annotation_start'][i], self.__index['annotation_end'][i]
+        return self.__annotated_indices[lo:hi] - self.__index['offset'][i]
+
+    def __getitem__(self, i):
+        """Materialize segment i as a dictionary with the columns of create_segments."""
+        return {
+            'RecordName': self.__index['RecordName'][i],
+            'intervalNo': self.__index['intervalNo'][i],
+            'signals': self.signal(i),
+            'annotations': self.annotations(i),
+            'indices': self.indices(i),
+            'rhythm_type': self.__index['rhythm_type'][i],
+        }
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def filter(self, *predicates):
+        """Return the segments matching Polars predicates on the index, sharing the same buffers."""
+        return LazySegmentTable(self.__index.filter(*predicates), self.__signal,
+                                self.__beat_annotations, self.__annotated_indices)
+
+    def slice(self, offset, length=None):
+        return LazySegmentTable(self.__index.slice(offset, length), self.__signal,
+                                self.__beat_annotations, self.__annotated_indices)
+
+    def signals_array(self):
+        """
+        Materialize the signals of all segments as one array of
+        segments x samples (x channels for multi-channel signals).
+
+        Raises:
+            ValueError: If the segments have different lengths.
+        """
+        lengths = self.__index['length'].unique()
+        if len(lengths) > 1:
+            raise ValueError("Segments have different lengths; slice them by record first")
+        width = int(lengths[0]) if len(lengths) else 0
+        offsets = self.__index['offset'].to_numpy()
+        return self.__signal[offsets[:, None] + np.arange(width)]
+
+    def nbytes(self):
+        """Memory held by the index and the shared buffers, in bytes."""
+        return (self.__index.estimated_size() + self.__signal.nbytes
+                + self.__beat_annotations.nbytes + self.__annotated_indices.nbytes)
+
+    def to_eager(self):
+        """
+        Materialize every segment.
+
+        Returns:
+            pl.DataFrame: The table create_segments returns for the same inputs.
+        """
+        signal_dtype = pl.List(pl.Series(self.__signal[:0]).dtype)
+        metadata_schema = _metadata_schema(self.__index)
+        if len(self) == 0:
+            return _empty_segment_table(signal_dtype, metadata_schema)
+
+        offsets = self.__index['offset'].to_numpy()
+        lengths = self.__index['length'].to_numpy()
+        lo = self.__index['annotation_start'].to_numpy()
+        hi = self.__index['annotation_end'].to_numpy()
+
+        signal_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        signal_gather = np.arange(signal_offsets[-1]) - np.repeat(signal_offsets[:-1] - offsets, lengths)
+
+        counts = hi - lo
+        annotation_offsets = np.concatenate(([0], np.cumsum(counts)))
+        annotation_gather = np.arange(annotation_offsets[-1]) - np.repeat(annotation_offsets[:-1] - lo, counts)
+        shift = np.repeat(offsets, counts)
+
+        columns = [
+            self.__index['RecordName'],
+            self.__index['intervalNo'],
+            _ragged_series("signals", self.__signal[signal_gather], signal_offsets, signal_dtype),
+            _ragged_series("annotations", self.__beat_annotations[annotation_gather], annotation_offsets,
+                           pl.List(pl.String)),
+            _ragged_series("indices", self.__annotated_indices[annotation_gather] - shift, annotation_offsets,
+                           pl.List(pl.Int64)),
+            self.__index['rhythm_type'],
+        ]
+        columns += [self.__index[name] for name in metadata_schema]
+        return pl.DataFrame(columns)
+
+
+def create_lazy_segments(record_rhythm_table, window_size, window_step):
+    """
+    Create a lazy segment table from a rhythm table.
+
+    Parameters:
+    - record_rhythm_table: Table returned by find_rhythm_interval
+    - window_size: Size of each segment window in seconds
+    - window_step: Step size between windows in seconds
+
+    Returns:
+    - LazySegmentTable; call to_eager() for the create_segments DataFrame
+    """
+    return LazySegmentTable.from_rhythm_table(record_rhythm_table, window_size, window_step)
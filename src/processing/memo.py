@@ -0,0 +1,114 @@
+"""
+Size-bounded memoization of pipeline stage results.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+import polars as pl
+
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+
+def _size_of(value):
+    """Approximate memory footprint of a stage result in bytes."""
+    if isinstance(value, pl.DataFrame):
+        return value.estimated_size()
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if hasattr(value, "nbytes") and callable(value.nbytes):
+        return value.nbytes()
+    if isinstance(value, tuple):
+        return sum(_size_of(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class StageCache:
+    """
+    Least recently used cache of pipeline stage results with a byte budget.
+
+    Results are keyed by stage name and the inputs that determine them (for
+    example the record identity and window parameters), so a change of one
+    parameter only recomputes the stages that depend on it.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Initialize a StageCache object.
+
+        Args:
+            max_bytes (int): Budget for all cached results together.
+        """
+        self.max_bytes = max_bytes
+        self.__entries = OrderedDict()  # (stage, key) -> (value, size)
+        self.__total = 0
+        self.__computing = {}  # (stage, key) -> Event set when its computation ends
+        self.__lock = threading.RLock()
+
+    def cached(self, stage, key, compute):
+        """
+        Return the result of a stage, computing it only on a cache miss.
+
+        Concurrent calls for the same result wait for the one computing it
+        instead of computing it again.
+
+        Args:
+            stage (str): Name of the stage, e.g. 'rhythm_table'.
+            key (tuple): Hashable inputs the result depends on.
+            compute (callable): Function without arguments producing the result.
+
+        Returns:
+            The cached or freshly computed result.
+        """
+        entry_key = (stage, key)
+        while True:
+            with self.__lock:
+                if entry_key in self.__entries:
+                    self.__entries.move_to_end(entry_key)
+                    return self.__entries[entry_key][0]
+                computing = self.__computing.get(entry_key)
+                if computing is None:
+                    computing = self.__computing[entry_key] = threading.Event()
+                    break
+            # Another caller is computing the same result; if it fails, try again
+            computing.wait()
+
+        try:
+            value = compute()
+            size = _size_of(value)
+            with self.__lock:
+                if entry_key in self.__entries:
+                    self.__total -= self.__entries.pop(entry_key)[1]
+                self.__entries[entry_key] = (value, size)
+                self.__total += size
+                self._evict(keep=entry_key)
+        finally:
+            with self.__lock:
+                del self.__computing[entry_key]
+            computing.set()
+        return value
+
+    def _evict(self, keep):
+        for entry_key in list(self.__entries):
+            if self.__total <= self.max_bytes:
+                break
+            if entry_key == keep:
+                continue
+            self.__total -= self.__entries.pop(entry_key)[1]
+
+    def contains(self, stage, key):
+        return (stage, key) in self.__entries
+
+    def invalidate(self, stage=None):
+        """Drop every result, or only the results of one stage."""
+        with self.__lock:
+            for entry_key in list(self.__entries):
+                if stage is None or entry_key[0] == stage:
+                    self.__total -= self.__entries.pop(entry_key)[1]
+
+    def size(self):
+        """Total size in bytes of the cached results."""
+        return self.__total
+
+    def __len__(self):
+        return len(self.__entries)
@@ -1,14 +1,43 @@
 import os
 import wfdb
+from wfdb.io import _signal, _header, annotation as wfdb_annotation
+from wfdb.io.header import parse_header_content
 import numpy as np
 import pandas as pd
-from collections import Counter
+
+from .signal_dtype import check_signal_dtype, digital_nan, digital_to_int16, physical_signal
+
+
+def _index_by_value(values):
+    """
+    Build a compact code array and a per-value index of positions.
+
+    Args:
+        values (sequence): Annotation symbols or auxiliary notes.
+
+    Returns:
+        tuple: (table, codes, index, counts) where table holds the distinct
+        values, codes[i] is the position of values[i] in table, index maps
+        each value to the sorted positions where it occurs and counts maps
+        each value to its number of occurrences.
+    """
+    table, codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    codes = codes.astype(np.uint8 if len(table) <= 256 else np.uint16)
+    counts = np.bincount(codes, minlength=len(table))
+    positions = np.split(np.argsort(codes, kind='stable'), np.cumsum(counts)[:-1])
+    keys = table.tolist()
+    return table, codes, dict(zip(keys, positions)), dict(zip(keys, counts.tolist()))
+
+
+class UnsupportedInMemoryFormat(ValueError):
+    """Raised when a record held in memory is in a signal format that can only be read from files."""
+
 
 class Record:
     
     """Class representing an ECG record."""
     
-    def __init__(self, parent, signal, symbol, aux, sample, label, sf):
+    def __init__(self, parent, signal, symbol, aux, sample, label, sf, adc_gain=None, baseline=None):
         
         """
         Initialize a Record object.
@@ -21,6 +50,8 @@ class Record:
             sample (np.ndarray): Sample indices of annotations.
             label (str): Label or comment associated with the record.
             sf (int): Sampling frequency of the signal.
+            adc_gain (float): ADC gain, when signal holds raw int16 ADC samples.
+            baseline (int): ADC baseline, when signal holds raw int16 ADC samples.
         """
         
         self.__parent = parent
@@ -30,6 +61,13 @@ class Record:
         self.__sample = sample
         self.__label = label
         self.__sf = sf
+        self.__adc_gain = adc_gain
+        self.__baseline = baseline
+        # Symbols are coded once; counts, checks and index lookups then
+        # avoid rescanning the annotation lists
+        (self.__symbol_table, self.__symbol_codes,
+         self.__symbol_index, self.__symbol_counts) = _index_by_value(symbol)
+        _, _, self.__aux_index, _ = _index_by_value(aux)
         self.__collection = {"signal": self.__signal,
                              "symbol": self.__symbol,
                              "aux": self.__aux,
@@ -66,9 +104,9 @@ class Record:
         
         if (len(self.__symbol) > 0) and (len(self.__aux)) > 0:
             if this == "+":
-                return np.where(np.asarray(self.__symbol) == "+")[0]
+                return self.__symbol_index.get("+", np.empty(0, dtype=np.intp))
             elif this == "(N":
-                return np.where(np.asarray(self.__aux) == '(N')[0]
+                return self.__aux_index.get("(N", np.empty(0, dtype=np.intp))
             
     def get_intersect_of(self, a, b):
         """
@@ -108,9 +146,18 @@ class Record:
     def is_interval_valid(self, interval, sampling_freq, duration):
         return abs(interval[1] - interval[0]) >= (sampling_freq * duration)
     
+    def get_symbol_table(self):
+        return self.__symbol_table
+
+    def get_symbol_codes(self):
+        return self.__symbol_codes
+
+    def get_symbol_count(self, symbol):
+        return self.__symbol_counts.get(symbol, 0)
+
     def find_index_of_symbol(self, symbol):
-        if symbol in self.__symbol:
-            return np.where(np.asarray(self.__symbol) == symbol)[0]
+        if symbol in self.__symbol_index:
+            return self.__symbol_index[symbol]
         return -1
     
     def find_q_index(self):
@@ -120,10 +167,10 @@ class Record:
         return self.find_index_of_symbol('"')
     
     def has_unknown_beat(self):
-        return ("Q" in self.__symbol)
+        return ("Q" in self.__symbol_counts)
     
     def has_missed_beat(self):
-        return ('"' in self.__symbol)    
+        return ('"' in self.__symbol_counts)
    
     def move_to_any_q_or_quote(self):
         q_index = self.find_q_index()
@@ -140,10 +187,10 @@ class Record:
         return max(pvc_indexes)
     
     def has_pac(self):
-        return ("A" in self.__symbol)
+        return ("A" in self.__symbol_counts)
     
     def has_pvc(self):
-        return ("V" in self.__symbol)
+        return ("V" in self.__symbol_counts)
     
     def get_pac_percentage(self):
         pac_count = self.get_pac_counts()
@@ -168,10 +215,10 @@ class Record:
             return ((19 < percentage) and (self.get_pac_counts() == 0))            
         
     def get_pac_counts(self):
-        return Counter(self.__symbol)['A']
+        return self.get_symbol_count('A')
     
     def get_pvc_counts(self):
-        return Counter(self.__symbol)['V']
+        return self.get_symbol_count('V')
     
     def get_label(self):
         return self.__label
@@ -179,6 +226,12 @@ class Record:
     def get_sampling_frequency(self):
         return self.__sf
     
+    def get_physical_signal(self):
+        """Return the signal in float64 physical units, converting ADC samples if needed."""
+        if self.__adc_gain is None:
+            return np.asarray(self.__signal, dtype=np.float64)
+        return physical_signal(self.__signal, self.__adc_gain, self.__baseline)
+
     def get_duration(self):
         duration = len(self.__signal) / self.__sf
         return duration 
@@ -186,25 +239,550 @@ class Record:
     def which(self):
         return self.__parent
     
+def _dac(d_signal, baseline, adc_gain, d_nan, dtype):
+    """Convert digital samples to physical units the way wfdb does, in the given float dtype."""
+    p_signal = d_signal.astype(dtype)
+    np.subtract(p_signal, np.asarray(baseline, dtype=dtype), p_signal)
+    np.divide(p_signal, np.asarray(adc_gain, dtype=dtype), p_signal)
+    if d_nan is not None:
+        p_signal[d_signal == d_nan] = np.nan
+    return p_signal
+
+
+def parse_header(content, record_name=None):
+    """
+    Parse a single-segment WFDB header held in memory, the way wfdb.rdheader parses a file.
+
+    Args:
+        content (str or bytes-like): Content of the .hea file.
+        record_name (str): Name of the record, used in error messages.
+
+    Returns:
+        wfdb.Record: The header fields, without signal.
+
+    Raises:
+        ValueError: If the header describes a multi-segment record.
+    """
+    if not isinstance(content, str):
+        content = bytes(content).decode("ascii", errors="ignore")
+    header_lines, comment_lines = parse_header_content(content)
+    record_fields = _header._parse_record_line(header_lines[0])
+    if record_fields["n_seg"] is not None:
+        raise ValueError(f"Record {record_name or record_fields['record_name']} is multi-segment; "
+                         "it can only be read from files")
+    header = wfdb.Record()
+    if len(header_lines) > 1:
+        for field, value in _header._parse_signal_lines(header_lines[1:]).items():
+            setattr(header, field, value)
+    for field, value in record_fields.items():
+        if field != "n_seg":
+            setattr(header, field, value)
+    header.comments = [line.strip(" \t#") for line in comment_lines]
+    return header
+
+
+def parse_annotation(content, record_name, extension="atr", fs=None):
+    """
+    Parse a WFDB annotation file held in memory, the way wfdb.rdann parses a file.
+
+    Args:
+        content (bytes-like): Content of the annotation file; it is read without copying.
+        record_name (str): Name of the record.
+        extension (str): Annotator extension of the file.
+        fs (float): Sampling frequency used when the file does not define one.
+
+    Returns:
+        wfdb.Annotation: The annotations with their symbols.
+    """
+    filebytes = np.frombuffer(content, dtype="<u1")
+    filebytes = filebytes[:len(filebytes) - len(filebytes) % 2].reshape(-1, 2)
+    sample, label_store, subtype, chan, num, aux_note = wfdb_annotation.proc_ann_bytes(filebytes, None)
+    definition_inds, rm_inds = wfdb_annotation.get_special_inds(sample, label_store, aux_note)
+    ann_fs, custom_labels = wfdb_annotation.interpret_defintion_annotations(definition_inds, aux_note)
+    sample, label_store, subtype, chan, num, aux_note = wfdb_annotation.rm_empty_indices(
+        rm_inds, sample, label_store, subtype, chan, num, aux_note
+    )
+    label_store, subtype, chan, num = wfdb_annotation.lists_to_int_arrays(label_store, subtype, chan, num)
+    annotation = wfdb.Annotation(record_name=record_name,
+                                 extension=extension,
+                                 sample=np.array(sample, dtype="int64"),
+                                 label_store=label_store,
+                                 subtype=subtype,
+                                 chan=chan,
+                                 num=num,
+                                 aux_note=aux_note,
+                                 fs=ann_fs if ann_fs is not None else fs,
+                                 custom_labels=custom_labels)
+    annotation.set_label_elements(["symbol"])
+    return annotation
+
+
+class MappedSignal:
+    """
+    One or several channels of a WFDB signal file, memory-mapped and decoded on slicing.
+
+    Only the pages of the file covering the requested samples are touched,
+    and the mapping is read-only and shared, so several processes reading
+    the same record share one copy in the OS page cache. A single channel
+    decodes to a 1D array; a list of channels decodes to a 2D array of
+    samples x channels in one pass over the bytes. The content of a file
+    already in memory (e.g. an upload) is decoded the same way, without
+    copying it.
+    """
+
+    # Formats that can be decoded straight from the mapped bytes
+    FORMATS = ("16", "212")
+
+    def __init__(self, file_path, fmt, n_sig, index, sig_len, byte_offset, adc_gain, baseline, dtype="float64"):
+        """
+        Initialize a MappedSignal object.
+
+        Args:
+            file_path (str or bytes-like): Path of the .dat file, or its content in memory.
+            fmt (str): WFDB storage format, '16' or '212'.
+            n_sig (int): Number of channels interleaved in the file.
+            index (int or list): Position of the channel, or of each channel, among them.
+            sig_len (int): Number of samples per channel.
+            byte_offset (int): Offset of the first sample in the file.
+            adc_gain (float or list): ADC gain of each channel.
+            baseline (int or list): ADC baseline of each channel.
+            dtype (str): 'float64' or 'float32' for physical values, 'int16' for ADC samples.
+
+        Raises:
+            ValueError: If the format is not supported or the file is too short.
+        """
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Format {fmt} cannot be memory-mapped")
+        self.__fmt = fmt
+        self.__n_sig = n_sig
+        self.__index = index if np.isscalar(index) else list(index)
+        self.__sig_len = sig_len
+        self.__adc_gain = adc_gain if np.isscalar(adc_gain) else np.asarray(adc_gain)
+        self.__baseline = baseline if np.isscalar(baseline) else np.asarray(baseline)
+        self.__dtype = check_signal_dtype(dtype)
+        in_memory = not isinstance(file_path, (str, os.PathLike))
+        if fmt == "16":
+            if in_memory:
+                self.__data = np.frombuffer(file_path, dtype="<i2", count=sig_len * n_sig,
+                                            offset=byte_offset).reshape(sig_len, n_sig)
+            else:
+                self.__data = np.memmap(file_path, dtype="<i2", mode="r", offset=byte_offset, shape=(sig_len, n_sig))
+        else:
+            if in_memory:
+                self.__data = np.frombuffer(file_path, dtype=np.uint8, offset=byte_offset)
+            else:
+                self.__data = np.memmap(file_path, dtype=np.uint8, mode="r", offset=byte_offset)
+            if len(self.__data) < (sig_len * n_sig * 3 + 1) // 2:
+                raise ValueError("The signal file is shorter than its header states")
+
+    @property
+    def dtype(self):
+        return np.dtype(self.__dtype)
+
+    @property
+    def ndim(self):
+        return 1 if np.isscalar(self.__index) else 2
+
+    @property
+    def shape(self):
+        return (self.__sig_len,) if self.ndim == 1 else (self.__sig_len, len(self.__index))
+
+    def __len__(self):
+        return self.__sig_len
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.__sig_len)
+            if step != 1:
+                return self[start:stop][::step]
+            return self.decode(start, max(start, stop))
+        if key < 0:
+            key += self.__sig_len
+        return self.decode(key, key + 1)[0]
+
+    def _digital(self, sampfrom, sampto):
+        if self.__fmt == "16":
+            return np.array(self.__data[sampfrom:sampto, self.__index], dtype=np.int16)
+
+        # Format 212 packs two 12-bit samples into three bytes, channels interleaved
+        k = np.arange(sampfrom, sampto)[:, None] * self.__n_sig + np.atleast_1d(self.__index)
+        if sampto <= sampfrom:
+            k = k[:, 0] if self.ndim == 1 else k
+            return np.empty(k.shape, dtype=np.int16)
+        first_group = k.min() // 2
+        last_byte = 3 * (k.max() // 2) + 3
+        packed = np.asarray(self.__data[3 * first_group:last_byte])
+        if len(packed) < last_byte - 3 * first_group:
+            packed = np.concatenate((packed, np.zeros(last_byte - 3 * first_group - len(packed), np.uint8)))
+        groups = packed.reshape(-1, 3)[k // 2 - first_group].astype(np.int16)
+        d_signal = np.where(k % 2 == 0,
+                            groups[..., 0] + ((groups[..., 1] & 0x0F) << 8),
+                            groups[..., 2] + ((groups[..., 1] & 0xF0) << 4)).astype(np.int16)
+        d_signal[d_signal > 2047] -= 4096
+        return d_signal[:, 0] if self.ndim == 1 else d_signal
+
+    def decode(self, sampfrom, sampto):
+        """
+        Decode samples [sampfrom, sampto) of the channels.
+
+        Returns:
+            np.ndarray: Samples in the dtype of the MappedSignal, 1D for one
+            channel and samples x channels for several.
+        """
+        d_signal = self._digital(sampfrom, sampto)
+        if self.__dtype == "int16":
+            return digital_to_int16(d_signal, self.__fmt)
+        return _dac(d_signal, self.__baseline, self.__adc_gain, digital_nan(self.__fmt), self.__dtype)
+
+
 class RecordReader:
-    """Class for reading ECG records."""
-    
+    """
+    Class for reading ECG records.
+
+    A reader parses the header of a record once and loads its annotation
+    file once; every subsequent read only decodes the requested sample range
+    of the signal file, so many ranges of the same record can be read cheaply.
+    The files can also be given in memory, see from_memory.
+    """
+
+    def __init__(self, path, number, files=None):
+        """
+        Initialize a RecordReader object.
+
+        Args:
+            path (str): The path to the directory containing the record.
+            number (str): The name or identifier of the record.
+            files (dict): Optional {file name: bytes-like content} of the record's
+                .hea, signal and .atr files, read instead of the files under path.
+
+        Raises:
+            ValueError: If the header of the record cannot be found or read.
+        """
+        self.__path = path
+        self.__number = number
+        self.__fullpath = os.path.join(path or "", number)
+        self.__files = files
+        try:
+            if files is None:
+                self.__header = wfdb.rdheader(self.__fullpath)
+            else:
+                self.__header = parse_header(self._file(f"{number}.hea"), number)
+        except Exception as e:
+            raise ValueError(f"Cannot read header of record {number}: {str(e)}")
+        self.__annotation = None
+        self.__mapped = {}
+
     @classmethod
-    def read(cls, path, number, channel, sampfrom, sampto):
+    def from_memory(cls, number, files):
+        """
+        Create a reader of a record whose files are held in memory, e.g. uploads.
+
+        Signal files in formats 16 and 212 are decoded straight from their
+        buffers without copying them; other formats cannot be read from memory.
+
+        Args:
+            number (str): The name of the record.
+            files (dict): {file name: bytes-like content}, e.g. {'100.hea': ..., '100.dat': ..., '100.atr': ...}.
+
+        Returns:
+            RecordReader: The reader.
+        """
+        return cls(None, number, files=files)
+
+    def _file(self, file_name):
+        """Return the in-memory content of one file of the record."""
+        if file_name not in self.__files:
+            raise ValueError(f"File {file_name} of record {self.__number} was not provided")
+        return self.__files[file_name]
+
+    def map_signal(self, channel, dtype="float64"):
+        """
+        Memory-map one or several channels of the signal file.
+
+        Args:
+            channel (int or list): The channel number, or a list of channel
+                numbers stored in the same signal file.
+            dtype (str): Signal dtype, see read_signal.
+
+        Returns:
+            MappedSignal: The mapped channels, or None if the record cannot be
+            mapped (multi-segment record, unsupported format, skew, multiple
+            samples per frame or channels spread over several files).
+        """
+        key = (channel if np.isscalar(channel) else tuple(channel), dtype)
+        if key not in self.__mapped:
+            self.__mapped[key] = self._map_signal(channel, dtype)
+        return self.__mapped[key]
+
+    def _map_signal(self, channel, dtype):
+        header = self.__header
+        channels = np.atleast_1d(channel).tolist()
+        if not isinstance(header, wfdb.Record) or not channels:
+            return None
+        file_name = header.file_name[channels[0]]
+        fmt = header.fmt[channels[0]]
+        file_channels = [ch for ch in range(header.n_sig) if header.file_name[ch] == file_name]
+        if fmt not in MappedSignal.FORMATS or not set(channels) <= set(file_channels):
+            return None
+        for ch in file_channels:
+            if header.fmt[ch] != fmt or (header.samps_per_frame[ch] or 1) != 1 or (header.skew[ch] or 0) != 0:
+                return None
+        index = [file_channels.index(ch) for ch in channels]
+        adc_gain = [header.adc_gain[ch] for ch in channels]
+        baseline = [header.baseline[ch] for ch in channels]
+        if np.isscalar(channel):
+            index, adc_gain, baseline = index[0], adc_gain[0], baseline[0]
+        source = os.path.join(self.__path, file_name) if self.__files is None else self._file(file_name)
+        try:
+            return MappedSignal(file_path=source,
+                                fmt=fmt,
+                                n_sig=len(file_channels),
+                                index=index,
+                                sig_len=header.sig_len,
+                                byte_offset=(header.byte_offset[channels[0]] or 0) if header.byte_offset else 0,
+                                adc_gain=adc_gain,
+                                baseline=baseline,
+                                dtype=dtype)
+        except (ValueError, OSError):
+            if self.__files is not None:
+                # There is no file to fall back to
+                raise
+            return None
+
+    def open_signal(self, channel, dtype="float64"):
+        """
+        Return one channel, or several as samples x channels, as an array-like
+        that can be sliced by sample.
+
+        Mappable records return a MappedSignal, so slicing decodes only the
+        touched pages; other records are decoded in full.
+        """
+        mapped = self.map_signal(channel, dtype)
+        if mapped is not None:
+            return mapped
+        if np.isscalar(channel):
+            return self.read_signal([channel], dtype=dtype)[0]
+        return np.column_stack(self.read_signal(list(channel), dtype=dtype))
+
+    def get_header(self):
+        return self.__header
+
+    def get_label(self):
+        comments = self.__header.comments
+        return comments[0] if comments else ''
+
+    def get_sampling_frequency(self):
+        return self.__header.fs
+
+    def get_signal_length(self):
+        return self.__header.sig_len
+
+    def get_annotation(self):
+        """
+        Return the full annotation of the record, reading the file on first use.
+
+        Raises:
+            ValueError: If the record annotations cannot be found or read.
+        """
+        if self.__annotation is None:
+            try:
+                if self.__files is None:
+                    self.__annotation = wfdb.rdann(self.__fullpath, 'atr')
+                else:
+                    self.__annotation = parse_annotation(self._file(f"{self.__number}.atr"), self.__number,
+                                                         fs=self.__header.fs)
+            except Exception as e:
+                raise ValueError(f"Cannot read annotations of record {self.__number}: {str(e)}")
+            self.__annotation.symbol = np.asarray(self.__annotation.symbol)
+            self.__annotation.aux_note = np.asarray(self.__annotation.aux_note)
+        return self.__annotation
+
+    def read_signal(self, channels, sampfrom=0, sampto=None, dtype="float64"):
+        """
+        Decode the signal of the given channels within a sample range.
+
+        Only the bytes of the signal file covering [sampfrom, sampto) are read.
+
+        Args:
+            channels (list): Channel numbers to read.
+            sampfrom (int): Starting sample index to read.
+            sampto (int): Ending sample index to read (exclusive).
+            dtype (str): 'float64' or 'float32' for physical values, 'int16'
+                for the raw ADC samples (see get_adc_gain and get_baseline).
+
+        Returns:
+            list: One np.ndarray per requested channel.
+
+        Raises:
+            UnsupportedInMemoryFormat: If the record is held in memory and its
+                signal format is not 16 or 212.
+            ValueError: If int16 samples are requested from a multi-segment record.
+        """
+        check_signal_dtype(dtype)
+        header = self.__header
+        sampto = header.sig_len if sampto is None else sampto
+        mapped = [self.map_signal(ch, dtype) for ch in channels]
+        if all(signal is not None for signal in mapped):
+            header.check_read_inputs(sampfrom, sampto, channels, True, True, 64)
+            return [signal[sampfrom:sampto] for signal in mapped]
+        if self.__files is not None:
+            formats = sorted({header.fmt[ch] for ch in channels})
+            raise UnsupportedInMemoryFormat(f"Record {self.__number} (format {', '.join(formats)}) cannot be "
+                                            f"read from memory; only formats {' and '.join(MappedSignal.FORMATS)} can")
+        if not isinstance(header, wfdb.Record):
+            # Multi-segment records are delegated to wfdb
+            if dtype == "int16":
+                raise ValueError(f"Record {self.__number} is multi-segment; int16 samples are not supported")
+            record = wfdb.rdrecord(self.__fullpath, sampfrom=sampfrom, sampto=sampto, channels=channels)
+            return [record.p_signal[:, i].astype(dtype, copy=False) for i in range(len(channels))]
+
+        header.check_read_inputs(sampfrom, sampto, channels, True, True, 64)
+        digital = self._read_digital(sampfrom, sampto, channels)
+        if dtype == "int16":
+            return [digital_to_int16(d_signal, header.fmt[ch]) for d_signal, ch in zip(digital, channels)]
+
+        d_nans = digital_nan(header.fmt)
+        return [_dac(d_signal, header.baseline[ch], header.adc_gain[ch], d_nans[ch], dtype)
+                for d_signal, ch in zip(digital, channels)]
+
+    def _read_digital(self, sampfrom, sampto, channels):
+        """
+        Read the digital samples of channels within a sample range from the signal file.
+
+        wfdb's segment reader only reads the bytes of the range; it is private
+        API, so wfdb.rdrecord is used instead when it is missing or its
+        signature changed.
+        """
+        header = self.__header
+        rd_segment = getattr(_signal, "_rd_segment", None)
+        if rd_segment is not None:
+            try:
+                return rd_segment(file_name=header.file_name,
+                                  dir_name=self.__path,
+                                  pn_dir=None,
+                                  fmt=header.fmt,
+                                  n_sig=header.n_sig,
+                                  sig_len=header.sig_len,
+                                  byte_offset=header.byte_offset,
+                                  samps_per_frame=header.samps_per_frame,
+                                  skew=header.skew,
+                                  init_value=header.init_value,
+                                  sampfrom=sampfrom,
+                                  sampto=sampto,
+                                  channels=channels,
+                                  ignore_skew=False,
+                                  return_res=64)
+            except TypeError:
+                pass
+        record = wfdb.rdrecord(self.__fullpath, sampfrom=sampfrom, sampto=sampto, channels=list(channels),
+                               physical=False, return_res=64)
+        return [record.d_signal[:, i] for i in range(len(channels))]
+
+    def read_channels(self, channel, sampfrom=0, sampto=None, dtype="float64"):
+        """
+        Decode one channel, or several together, within a sample range.
+
+        Args:
+            channel (int or list): The channel number, or a list of channel numbers.
+            sampfrom (int): Starting sample index to read.
+            sampto (int): Ending sample index to read (exclusive).
+            dtype (str): Signal dtype, see read_signal.
+
+        Returns:
+            np.ndarray: 1D for one channel, samples x channels for a list.
+        """
+        if np.isscalar(channel):
+            return self.read_signal([channel], sampfrom, sampto, dtype)[0]
+        sampto = self.__header.sig_len if sampto is None else sampto
+        mapped = self.map_signal(channel, dtype)
+        if mapped is not None:
+            self.__header.check_read_inputs(sampfrom, sampto, list(channel), True, True, 64)
+            return mapped[sampfrom:sampto]
+        return np.column_stack(self.read_signal(list(channel), sampfrom, sampto, dtype))
+
+    def get_adc_gain(self, channel):
+        if np.isscalar(channel):
+            return self.__header.adc_gain[channel]
+        return np.array([self.__header.adc_gain[ch] for ch in channel])
+
+    def get_baseline(self, channel):
+        if np.isscalar(channel):
+            return self.__header.baseline[channel]
+        return np.array([self.__header.baseline[ch] for ch in channel])
+
+    def get_signal_names(self, channels=None):
+        channels = range(self.__header.n_sig) if channels is None else np.atleast_1d(channels)
+        return [self.__header.sig_name[ch] for ch in channels]
+
+    def read_range(self, channel, sampfrom, sampto, dtype="float64"):
+        """
+        Read one sample range of the record.
+
+        Args:
+            channel (int or list): The channel number of the ECG signal to read,
+                or a list of channels read together as samples x channels.
+            sampfrom (int): Starting sample index to read.
+            sampto (int): Ending sample index to read.
+            dtype (str): Signal dtype, see read_signal.
+
+        Returns:
+            Record: A Record object representing the range of the ECG record.
+        """
+        sampto = self.__header.sig_len if sampto is None else sampto
+        signal = self.read_channels(channel, sampfrom, sampto, dtype)
+        gain = {}
+        if dtype == "int16":
+            gain = {"adc_gain": self.get_adc_gain(channel), "baseline": self.get_baseline(channel)}
+
+        # Annotations are kept when sampfrom <= sample <= sampto, like wfdb.rdann
+        ann = self.get_annotation()
+        lo = np.searchsorted(ann.sample, sampfrom, side='left')
+        hi = np.searchsorted(ann.sample, sampto, side='right')
+
+        return Record(parent=self.__number,
+                      signal=signal,
+                      symbol=ann.symbol[lo:hi].tolist(),
+                      aux=ann.aux_note[lo:hi].tolist(),
+                      sample=ann.sample[lo:hi] - sampfrom,
+                      label=self.get_label(),
+                      sf=self.get_sampling_frequency(),
+                      **gain)
+
+    def read_ranges(self, channel, ranges, dtype="float64"):
+        """
+        Read several sample ranges of the record, reusing the parsed header
+        and annotation file.
+
+        Args:
+            channel (int or list): The channel number, or list of channels, to read.
+            ranges (iterable): (sampfrom, sampto) pairs.
+            dtype (str): Signal dtype, see read_signal.
+
+        Yields:
+            Record: One Record object per range.
+        """
+        for sampfrom, sampto in ranges:
+            yield self.read_range(channel, sampfrom, sampto, dtype)
+
+    @classmethod
+    def read(cls, path, number, channel, sampfrom, sampto, dtype="float64"):
         
         """
         Read an ECG record.
 
         This method reads an ECG record from the specified path, extracts the signal,
         annotations, sample indices, comments, and sampling frequency, and returns
-        a Record object representing the record.
+        a Record object representing the record. The header is parsed once and
+        only the requested sample range of the signal file is decoded.
 
         Args:
             path (str): The path to the directory containing the record.
             number (str): The name or identifier of the record.
-            channel (int): The channel number of the ECG signal to read.
+            channel (int or list): The channel number of the ECG signal to read,
+                or a list of channels read together as samples x channels.
             sampfrom (int): Starting sample index to read.
             sampto (int): Ending sample index to read.
+            dtype (str): 'float64' (default), 'float32' or 'int16' for raw ADC samples.
 
         Returns:
             Record: A Record object representing the ECG record.
@@ -213,28 +791,4 @@ class RecordReader:
             ValueError: If the specified record file cannot be found or read.
             ValueError: If the specified record annotations cannot be found or read.
         """
-        
-        
-        fullpath = os.path.join(path, number)
-        signal = wfdb.rdrecord(fullpath,
-                               sampfrom=sampfrom,
-                               sampto=sampto).p_signal[:, channel]
-        
-        ann = wfdb.rdann(fullpath, 'atr',
-                            shift_samps=True,
-                            sampfrom=sampfrom,
-                            sampto=sampto)
-        
-        symbol = ann.symbol
-        aux = ann.aux_note
-        sample = ann.sample
-        comment = wfdb.rdrecord(fullpath).comments[0]
-        sf = wfdb.rdrecord(fullpath).fs
-        
-        return Record(parent=number,
-                      signal=signal,
-                      symbol=symbol,
-                      aux=aux,
-                      sample=sample,
-                      label=comment,
-                      sf=sf)
+        return cls(path, number).read_range(channel, sampfrom, sampto, dtype)
@@ -0,0 +1,553 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import posixpath
+import contextlib
+import urllib.error
+import urllib.request
+import concurrent.futures
+import wfdb
+from wfdb.io import download
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ecg_analysis_tool", "records")
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RETRIES = 3
+# Records returned by get or prefetch are not evicted for this many seconds,
+# so a reader in another process does not lose the files it is about to open
+DEFAULT_LEASE = 600.0
+CHECKSUM_FILE = "SHA256SUMS.txt"
+CHUNK_SIZE = 1024 * 1024
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def _parse_checksums(text):
+    """Parse the lines of a SHA256SUMS.txt file into a {file name: checksum} dict."""
+    checksums = {}
+    for line in text.splitlines():
+        parts = line.strip().split(maxsplit=1)
+        if len(parts) == 2:
+            checksums[parts[1].lstrip("*")] = parts[0]
+    return checksums
+
+
+def _is_transient(error):
+    """Whether a failed download is worth retrying."""
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500 or error.code in (408, 429)
+    return not isinstance(error, FileNotFoundError)
+
+
+def list_local_records(directory):
+    """
+    List the records of a local WFDB directory.
+
+    Parameters:
+    - directory: Directory with .hea/.dat/.atr files
+
+    Returns:
+    - Sorted list of record names that have both a header and an annotation file
+    """
+    records_file = os.path.join(directory, "RECORDS")
+    if os.path.exists(records_file):
+        with open(records_file, "r", encoding="ascii") as f:
+            return [line.strip() for line in f if line.strip()]
+    return sorted(
+        os.path.splitext(name)[0]
+        for name in os.listdir(directory)
+        if name.endswith(".hea") and os.path.exists(os.path.join(directory, os.path.splitext(name)[0] + ".atr"))
+    )
+
+
+class LocalSource:
+    """A local directory standing in for a remote WFDB database server."""
+
+    def __init__(self, root):
+        """
+        Initialize a LocalSource object.
+
+        Args:
+            root (str): Directory holding one sub-directory per database.
+        """
+        self.root = root
+
+    def open(self, database, file_name, offset=0):
+        f = open(os.path.join(self.root, database, file_name), "rb")
+        f.seek(offset)
+        return f
+
+    def checksums(self, database):
+        path = os.path.join(self.root, database, CHECKSUM_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return _parse_checksums(f.read())
+
+
+class HTTPSource:
+    """A WFDB database server laid out as <base_url>/<database>/<file>."""
+
+    def __init__(self, base_url, timeout=60):
+        """
+        Initialize an HTTPSource object.
+
+        Args:
+            base_url (str): URL under which every database is a sub-directory.
+            timeout (float): Timeout in seconds of every request.
+        """
+        self.base_url = base_url
+        self.timeout = timeout
+
+    def url(self, database, file_name):
+        return posixpath.join(self.base_url, database, file_name)
+
+    def open(self, database, file_name, offset=0):
+        """
+        Open a file of the server, from byte offset on.
+
+        A server that ignores the Range request answers with status 200 and
+        the whole file; callers resuming a download must check the status.
+        """
+        request = urllib.request.Request(self.url(database, file_name))
+        if offset:
+            request.add_header("Range", f"bytes={offset}-")
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def checksums(self, database):
+        try:
+            with self.open(database, CHECKSUM_FILE) as f:
+                return _parse_checksums(f.read().decode("utf-8"))
+        except Exception:
+            return None
+
+
+class PhysioNetSource(HTTPSource):
+    """The PhysioNet file server, which keeps every database under its latest version."""
+
+    def __init__(self, base_url=None, timeout=60):
+        super().__init__(base_url or download.config.db_index_url, timeout=timeout)
+        self.__versions = {}
+
+    def url(self, database, file_name):
+        if database not in self.__versions:
+            self.__versions[database] = download.get_version(database)
+        return posixpath.join(self.base_url, database, self.__versions[database], file_name)
+
+
+class RecordCache:
+    """
+    Persistent on-disk cache of WFDB records fetched from a remote database.
+
+    Every record is stored once under <cache_dir>/<database>/<record> together
+    with the SHA-256 checksum of each of its files. The cache is kept under a
+    size cap by evicting the least recently used records. Records accessed
+    within the last `lease` seconds are never evicted, so the cache may exceed
+    the cap while many records are in use.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, source=None, annotators=("atr",),
+                 lease=DEFAULT_LEASE):
+        """
+        Initialize a RecordCache object.
+
+        Args:
+            cache_dir (str): Directory of the cache. Defaults to ~/.cache/ecg_analysis_tool/records.
+            max_bytes (int): Size cap of the cache in bytes.
+            source: Object with open(database, file_name) and checksums(database)
+                methods, e.g. LocalSource or HTTPSource. Defaults to PhysioNet.
+            annotators (tuple): Annotation file extensions fetched with each record.
+            lease (float): Seconds after its last access during which a record
+                is protected from eviction.
+        """
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.lease = lease
+        self.source = source if source is not None else PhysioNetSource()
+        self.annotators = tuple(annotators)
+        self.__index_path = os.path.join(self.cache_dir, "index.json")
+        self.__checksums = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @contextlib.contextmanager
+    def _index_lock(self):
+        """Serialize index updates between processes sharing the cache."""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.__index_path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def _record_lock(self, database, record_name):
+        """
+        Give one fetch at a time the files of a record.
+
+        Concurrent fetches of the same record would otherwise write to and
+        resume the same .part files. The lock is held per open file, so it
+        also serializes threads of one process.
+        """
+        if fcntl is None:
+            yield
+            return
+        with self._open_record_lock(database, record_name) as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _open_record_lock(self, database, record_name):
+        directory = os.path.join(self.cache_dir, database)
+        os.makedirs(directory, exist_ok=True)
+        return open(os.path.join(directory, f"{record_name}.lock"), "a")
+
+    def _load_index(self):
+        if not os.path.exists(self.__index_path):
+            return {}
+        with open(self.__index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_index(self, index):
+        tmp_path = f"{self.__index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_path, self.__index_path)
+
+    def _source_checksums(self, database):
+        if database not in self.__checksums:
+            self.__checksums[database] = self.source.checksums(database)
+        return self.__checksums[database]
+
+    def _open_source(self, database, file_name, offset):
+        """Open a file of the source from offset on; returns (file, offset actually used)."""
+        if not offset:
+            return self.source.open(database, file_name), 0
+        try:
+            src = self.source.open(database, file_name, offset=offset)
+        except urllib.error.HTTPError as e:
+            if e.code != 416:
+                raise
+            # Range not satisfiable: the partial file does not belong to this file
+            return self.source.open(database, file_name), 0
+        if getattr(src, "status", 206) != 206:
+            # The server ignored the range and sends the whole file
+            return src, 0
+        return src, offset
+
+    def _fetch_file(self, database, file_name, directory):
+        """
+        Copy one file from the source into the cache and return its size and checksum.
+
+        A partial download left behind by an interrupted fetch is resumed
+        from where it stopped instead of being downloaded again.
+        """
+        sha256 = hashlib.sha256()
+        tmp_path = os.path.join(directory, f"{file_name}.part")
+        offset = os.path.getsize(tmp_path) if os.path.exists(tmp_path) else 0
+        src, offset = self._open_source(database, file_name, offset)
+        with src:
+            if offset:
+                with open(tmp_path, "rb") as partial:
+                    for chunk in iter(lambda: partial.read(CHUNK_SIZE), b""):
+                        sha256.update(chunk)
+            size = offset
+            with open(tmp_path, "ab" if offset else "wb") as dst:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                    sha256.update(chunk)
+                    dst.write(chunk)
+                    size += len(chunk)
+            # http.client returns a short body without error when the connection drops
+            content_length = getattr(src, "headers", {}).get("Content-Length")
+            if content_length is not None and size - offset < int(content_length):
+                raise ConnectionError(f"Incomplete download of {database}/{file_name}: "
+                                      f"{size - offset} of {content_length} bytes")
+        checksum = sha256.hexdigest()
+
+        expected = (self._source_checksums(database) or {}).get(file_name)
+        if expected is not None and expected != checksum:
+            os.remove(tmp_path)
+            raise ValueError(f"Checksum mismatch for {database}/{file_name}")
+        os.replace(tmp_path, os.path.join(directory, file_name))
+        return size, checksum
+
+    def _record_files(self, directory, record_name, signals=True):
+        """Return the signal and annotation files of a record whose header is in directory."""
+        file_names = []
+        if signals:
+            header = wfdb.rdheader(os.path.join(directory, record_name))
+            file_names = list(dict.fromkeys(getattr(header, "file_name", None) or []))
+        return file_names + [f"{record_name}.{annotator}" for annotator in self.annotators]
+
+    def _fetch_record(self, database, record_name, signals=True):
+        """Fetch the header, signal files (unless signals is False) and annotations of a record into the cache."""
+        directory = os.path.join(self.cache_dir, database)
+        os.makedirs(directory, exist_ok=True)
+
+        files = {}
+        size, files[f"{record_name}.hea"] = self._fetch_file(database, f"{record_name}.hea", directory)
+        for file_name in self._record_files(directory, record_name, signals):
+            file_size, files[file_name] = self._fetch_file(database, file_name, directory)
+            size += file_size
+        return {"files": files, "size": size, "database": database, "signals": signals}
+
+    def _remove_files(self, database, entry):
+        for file_name in entry["files"]:
+            try:
+                os.remove(os.path.join(self.cache_dir, database, file_name))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self, index, keep):
+        """Drop least recently used records, except the keys in keep, until the cache fits under max_bytes."""
+        total = sum(entry["size"] for entry in index.values())
+        leased_since = time.time() - self.lease
+        for key in sorted(index, key=lambda k: index[k]["last_access"]):
+            if total <= self.max_bytes or index[key]["last_access"] > leased_since:
+                break
+            if key in keep:
+                continue
+            entry = index.pop(key)
+            self._remove_files(entry["database"], entry)
+            total -= entry["size"]
+
+    def _is_intact(self, entry, signals=True):
+        """Whether the files of an entry are all in the cache, including the signal files if signals is True."""
+        if signals and not entry.get("signals", True):
+            return False
+        directory = os.path.join(self.cache_dir, entry["database"])
+        return all(os.path.exists(os.path.join(directory, file_name)) for file_name in entry["files"])
+
+    def get(self, database, record_name, validate=False):
+        """
+        Return the local path of a record, fetching it on a cache miss.
+
+        Args:
+            database (str): Name of the database, e.g. 'mitdb' or 'ltafdb'.
+            record_name (str): Name of the record within the database.
+            validate (bool): Compare the stored checksums with the source's
+                SHA256SUMS.txt and refetch the record when they differ.
+
+        Returns:
+            str: Path of the record without extension, readable with wfdb.rdrecord.
+        """
+        key = f"{database}/{record_name}"
+        if validate:
+            with self._index_lock():
+                entry = self._load_index().get(key)
+            expected = self._source_checksums(database) or {}
+            if entry is None or any(expected.get(name, checksum) != checksum
+                                    for name, checksum in entry["files"].items()):
+                with self._record_lock(database, record_name):
+                    return self._store(database, record_name, self._fetch_record(database, record_name))
+
+        return self._touch(database, record_name) or self._fetch_and_store(database, record_name)
+
+    def get_annotations(self, database, record_name):
+        """
+        Return the local path of a record's header and annotations, fetching only those on a cache miss.
+
+        The signal files are not fetched, so this reads the annotations of a
+        long record without downloading its samples; get fetches them later.
+
+        Args:
+            database (str): Name of the database, e.g. 'mitdb' or 'ltafdb'.
+            record_name (str): Name of the record within the database.
+
+        Returns:
+            str: Path of the record without extension, readable with wfdb.rdheader and wfdb.rdann.
+        """
+        return self._touch(database, record_name, signals=False) or \
+            self._fetch_and_store(database, record_name, signals=False)
+
+    def _fetch_and_store(self, database, record_name, signals=True):
+        """Fetch a missing record into the cache, unless another fetch of it did while this one waited."""
+        with self._record_lock(database, record_name):
+            return self._touch(database, record_name, signals) or \
+                self._store(database, record_name, self._fetch_record(database, record_name, signals))
+
+    def _touch(self, database, record_name, signals=True):
+        """Mark a cached record as used and return its path, or return None on a cache miss."""
+        key = f"{database}/{record_name}"
+        # Check and touch a hit under the same lock, so it cannot be evicted in between
+        with self._index_lock():
+            index = self._load_index()
+            entry = index.get(key)
+            if entry is None or not self._is_intact(entry, signals):
+                return None
+            entry["last_access"] = time.time()
+            self._evict(index, keep={key})
+            self._save_index(index)
+        return os.path.join(self.cache_dir, database, record_name)
+
+    def _store(self, database, record_name, entry, pinned=()):
+        """Record an entry in the index, evict older records except the pinned keys and return the record path."""
+        key = f"{database}/{record_name}"
+        with self._index_lock():
+            index = self._load_index()
+            entry["last_access"] = time.time()
+            index[key] = entry
+            self._evict(index, keep={key, *pinned})
+            self._save_index(index)
+        return os.path.join(self.cache_dir, database, record_name)
+
+    def prefetch(self, database, records=None, concurrency=DEFAULT_CONCURRENCY, retries=DEFAULT_RETRIES,
+                 backoff=0.5, progress_callback=None):
+        """
+        Fetch many records of a database into the cache concurrently.
+
+        Blocking wrapper of prefetch_async; from a running event loop, await
+        prefetch_async instead.
+
+        Returns:
+            list: One result dictionary per record, see prefetch_async.
+        """
+        return asyncio.run(self.prefetch_async(database, records, concurrency=concurrency, retries=retries,
+                                               backoff=backoff, progress_callback=progress_callback))
+
+    async def prefetch_async(self, database, records=None, concurrency=DEFAULT_CONCURRENCY,
+                             retries=DEFAULT_RETRIES, backoff=0.5, progress_callback=None):
+        """
+        Fetch many records of a database into the cache concurrently.
+
+        At most `concurrency` files are downloaded at a time. A failed download
+        is retried with exponential backoff and continues from the bytes it
+        already received. Records already in the cache are skipped, so running
+        an interrupted prefetch again resumes it.
+
+        Records of the same prefetch never evict each other. At most
+        `concurrency` records are fetched at a time, in order, and once the
+        records of the prefetch fill max_bytes the remaining ones fail instead
+        of being downloaded.
+
+        Args:
+            database (str): Name of the database, e.g. 'mitdb' or 'ltafdb'.
+            records (list): Record names; defaults to the RECORDS file of the database.
+            concurrency (int): Maximum number of simultaneous downloads.
+            retries (int): Additional attempts per file after a transient failure.
+            backoff (float): Delay in seconds before the first retry; doubled on each retry.
+            progress_callback (callable): Optional callback receiving each record's result.
+
+        Returns:
+            list: One dictionary per record, in the order of records, with the
+            keys RecordName, status ('cached', 'fetched' or 'failed'), error,
+            bytes and elapsed(sec).
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+        record_slots = asyncio.Semaphore(concurrency)
+        directory = os.path.join(self.cache_dir, database)
+        os.makedirs(directory, exist_ok=True)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            def call(function, *args):
+                return loop.run_in_executor(executor, function, *args)
+
+            if records is None:
+                records = await call(self.list_records, database)
+            with self._index_lock():
+                index = self._load_index()
+            pinned = set()
+            prefetched = {"bytes": 0}
+
+            async def fetch_file(file_name):
+                for attempt in range(retries + 1):
+                    async with semaphore:
+                        try:
+                            return await call(self._fetch_file, database, file_name, directory)
+                        except Exception as e:
+                            if attempt == retries or not _is_transient(e):
+                                raise
+                    await asyncio.sleep(backoff * 2 ** attempt)
+
+            async def lock_record(record_name):
+                """Take the record lock of _record_lock without blocking the event loop."""
+                if fcntl is None:
+                    return None
+                lock_file = self._open_record_lock(database, record_name)
+                try:
+                    while True:
+                        try:
+                            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                            return lock_file
+                        except BlockingIOError:
+                            await asyncio.sleep(0.05)
+                except BaseException:
+                    lock_file.close()
+                    raise
+
+            async def fetch_record(record_name):
+                async with record_slots:
+                    lock_file = await lock_record(record_name)
+                    try:
+                        return await fetch_record_files(record_name)
+                    finally:
+                        if lock_file is not None:
+                            lock_file.close()
+
+            async def fetch_record_files(record_name):
+                started = time.perf_counter()
+                result = {"RecordName": record_name, "status": "cached", "error": None, "bytes": 0}
+                try:
+                    key = f"{database}/{record_name}"
+                    entry = index.get(key)
+                    if entry is None or not self._is_intact(entry):
+                        # Another process may have fetched it while this one waited for the lock
+                        entry = (await call(self._load_index)).get(key)
+                    if entry is None or not self._is_intact(entry):
+                        if prefetched["bytes"] >= self.max_bytes:
+                            raise ValueError(f"The prefetched records fill the cache size cap of {self.max_bytes} "
+                                             "bytes; raise max_bytes or prefetch fewer records")
+                        files = {}
+                        size, files[f"{record_name}.hea"] = await fetch_file(f"{record_name}.hea")
+                        file_names = await call(self._record_files, directory, record_name)
+                        fetched = await asyncio.gather(*(fetch_file(file_name) for file_name in file_names),
+                                                       return_exceptions=True)
+                        for error in fetched:
+                            if isinstance(error, BaseException):
+                                raise error
+                        for file_name, (file_size, checksum) in zip(file_names, fetched):
+                            files[file_name] = checksum
+                            size += file_size
+                        entry = {"files": files, "size": size, "database": database, "signals": True}
+                        result.update(status="fetched", bytes=size)
+                    prefetched["bytes"] += entry["size"]
+                    pinned.add(key)
+                    await call(self._store, database, record_name, entry, pinned)
+                except Exception as e:
+                    result.update(status="failed", error=f"{type(e).__name__}: {e}")
+                result["elapsed(sec)"] = round(time.perf_counter() - started, 3)
+                if progress_callback:
+                    progress_callback(result)
+                return result
+
+            return list(await asyncio.gather(*(fetch_record(record_name) for record_name in records)))
+
+    def contains(self, database, record_name):
+        return f"{database}/{record_name}" in self._load_index()
+
+    def size(self):
+        """Total size in bytes of the cached records."""
+        return sum(entry["size"] for entry in self._load_index().values())
+
+    def list_records(self, database):
+        """Return the record names listed in the RECORDS file of a database."""
+        with self.source.open(database, "RECORDS") as f:
+            return [line.strip() for line in f.read().decode("ascii").splitlines() if line.strip()]
+
+    def clear(self):
+        """Remove every cached record."""
+        with self._index_lock():
+            for entry in self._load_index().values():
+                self._remove_files(entry["database"], entry)
+            self._save_index({})
@@ -0,0 +1,170 @@
+"""
+Sampling-rate harmonization of rhythm tables.
+
+Records of different databases have different sampling frequencies (MIT-BIH
+360 Hz, LTAF 128 Hz), so the same window in seconds gives segments of
+different lengths. Resampling the rhythm table to a common target frequency
+before create_segments makes the segments of every record the same width.
+
+Each interval signal is resampled as a whole with a polyphase filter, and
+the annotation sample indices are scaled with it. The filter of each
+up/down ratio is designed once, and resampled tables can be memoized in a
+StageCache.
+
+Example:
+    rhythm_table = resample_rhythm_table(find_rhythm_interval("100", "mitdb"), 250)
+    segments_table = create_segments(rhythm_table, window_size=30, window_step=5)
+"""
+
+from fractions import Fraction
+from functools import lru_cache
+
+import numpy as np
+import polars as pl
+from scipy import signal as scipy_signal
+
+from .metrics import instrumentation_for
+from .rhythm_segmentation import _list_series
+from .signal_dtype import DIGITAL_NAN
+
+# Largest denominator of the up/down ratio; e.g. 360 -> 250 Hz is 25/36
+MAX_DENOMINATOR = 1000
+
+
+def resampling_ratio(fs, target_fs):
+    """
+    Return the (up, down) factors that take fs to target_fs.
+
+    Raises:
+        ValueError: If either frequency is not positive.
+    """
+    if fs <= 0 or target_fs <= 0:
+        raise ValueError(f"Sampling frequencies must be positive, got {fs} and {target_fs}")
+    ratio = Fraction(target_fs).limit_denominator(MAX_DENOMINATOR) / Fraction(fs).limit_denominator(MAX_DENOMINATOR)
+    return ratio.numerator, ratio.denominator
+
+
+@lru_cache(maxsize=32)
+def polyphase_filter(up, down):
+    """Return the anti-aliasing FIR filter of scipy.signal.resample_poly for up/down, designed once."""
+    max_rate = max(up, down)
+    return scipy_signal.firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+
+
+def resample_signal(signal, fs, target_fs, baseline=0):
+    """
+    Resample a signal from fs to target_fs.
+
+    Parameters:
+    - signal: NumPy array of samples, or samples x channels
+    - fs: Sampling frequency of the signal
+    - target_fs: Sampling frequency of the result
+    - baseline: ADC baseline of int16 samples (one per channel); the filter
+      pads the signal with zeros, so ADC samples are resampled around their
+      baseline to keep the edges of the signal at the same physical level
+
+    Returns:
+    - NumPy array of ceil(len(signal) * target_fs / fs) samples, in the dtype
+      of float and int16 input; int16 ADC samples are rounded, and DIGITAL_NAN
+      samples mark the samples whose filter window reached an invalid sample
+    """
+    up, down = resampling_ratio(fs, target_fs)
+    signal = np.asarray(signal)
+    if up == down:
+        return signal
+    window = polyphase_filter(up, down)
+    if signal.dtype == np.int16:
+        samples = signal.astype(np.float64) - baseline
+        samples[signal == DIGITAL_NAN] = np.nan
+        resampled = scipy_signal.resample_poly(samples, up, down, axis=0, window=window) + baseline
+        invalid = np.isnan(resampled)
+        resampled = np.clip(np.rint(resampled), DIGITAL_NAN + 1, np.iinfo(np.int16).max)
+        resampled[invalid] = DIGITAL_NAN
+        return resampled.astype(np.int16)
+    resampled = scipy_signal.resample_poly(signal, up, down, axis=0, window=window)
+    if np.issubdtype(signal.dtype, np.floating):
+        # resample_poly computes in float64; float32 signals stay float32
+        return resampled.astype(signal.dtype, copy=False)
+    return resampled
+
+
+def resample_indices(indices, fs, target_fs, length=None):
+    """
+    Map annotation sample indices from fs to target_fs.
+
+    Parameters:
+    - indices: NumPy array of sample indices
+    - fs: Sampling frequency of the indices
+    - target_fs: Sampling frequency of the result
+    - length: Optional number of samples of the resampled signal; indices are clipped to it
+
+    Returns:
+    - NumPy int64 array of the nearest samples at target_fs
+    """
+    resampled = np.rint(np.asarray(indices, dtype=np.float64) * (target_fs / fs)).astype(np.int64)
+    if length is not None:
+        np.clip(resampled, 0, max(length - 1, 0), out=resampled)
+    return resampled
+
+
+def resample_rhythm_table(rhythm_table, target_fs, instrumentation=None, cache=None, key=None):
+    """
+    Resample the signals and annotation indices of a rhythm table to target_fs.
+
+    Parameters:
+    - rhythm_table: Polars DataFrame returned by find_rhythm_interval, in any
+      signal dtype mode and with one or several channels
+    - target_fs: Sampling frequency of the result, e.g. 250
+    - instrumentation: Optional Instrumentation receiving the 'resample' stage event
+    - cache: Optional StageCache memoizing the result under key
+    - key: Hashable identity of the rhythm table in cache, e.g. the record's
+      database and name; the table is only cached when both are given
+
+    Returns:
+    - The rhythm table with RecordFs set to target_fs and IntervalSignal,
+      IntervalAnnotatedIndices, Start, End and IntervalDuration at target_fs.
+      Rows already at target_fs are returned unchanged.
+    """
+    if cache is not None and key is not None:
+        return cache.cached("resample", (key, target_fs),
+                            lambda: resample_rhythm_table(rhythm_table, target_fs, instrumentation))
+
+    record_label = rhythm_table["RecordName"][0] if len(rhythm_table) else None
+    with instrumentation_for(instrumentation).stage("resample", record_label) as event:
+        resampled_table = _resample_rhythm_table(rhythm_table, target_fs)
+        event["rows"] = len(resampled_table)
+        event["samples"] = int(resampled_table["IntervalSignal"].list.len().sum() or 0)
+        event["output_bytes"] = resampled_table.estimated_size()
+    return resampled_table
+
+
+def _resample_rhythm_table(rhythm_table, target_fs):
+    signal_dtype = rhythm_table.schema["IntervalSignal"]
+    record_fs = rhythm_table["RecordFs"].to_list()
+    if all(float(fs) == float(target_fs) for fs in record_fs):
+        return rhythm_table
+
+    interval_signals = rhythm_table["IntervalSignal"]
+    interval_annotated_indices = rhythm_table["IntervalAnnotatedIndices"]
+    starts = rhythm_table["Start"].to_numpy()
+    baselines = rhythm_table["Baseline"].to_numpy() if "Baseline" in rhythm_table.columns else np.zeros(len(rhythm_table))
+
+    signals, indices, new_starts, new_ends, durations = [], [], [], [], []
+    for row, fs in enumerate(record_fs):
+        signal = resample_signal(interval_signals[row].to_numpy(), fs, target_fs, baselines[row])
+        signals.append(signal)
+        indices.append(resample_indices(interval_annotated_indices[row].to_numpy(), fs, target_fs, len(signal)))
+        start = int(resample_indices(starts[row], fs, target_fs))
+        new_starts.append(start)
+        new_ends.append(start + len(signal))
+        durations.append(round(len(signal) / target_fs, 2))
+
+    fs_dtype = pl.Int64 if float(target_fs).is_integer() else pl.Float64
+    return rhythm_table.with_columns(
+        pl.Series("RecordFs", [target_fs] * len(rhythm_table)).cast(fs_dtype),
+        pl.Series("Start", new_starts, dtype=pl.Int64),
+        pl.Series("End", new_ends, dtype=pl.Int64),
+        pl.Series("IntervalDuration", durations, dtype=pl.Float64),
+        _list_series("IntervalSignal", signals, signal_dtype),
+        _list_series("IntervalAnnotatedIndices", indices, pl.List(pl.Int64)),
+    )
@@ -5,104 +5,216 @@ import numpy as np
 import polars as pl
 import streamlit as st
 import matplotlib.pyplot as plt
-def find_rhythm_interval(record_name, database_path=None):
+
+from .metrics import instrumentation_for
+from .read_record import RecordReader, UnsupportedInMemoryFormat
+from .signal_dtype import check_signal_dtype, digital_to_int16, polars_signal_dtype, gain_columns, GAIN_COLUMNS
+
+# Per-record columns that segments inherit from their interval
+METADATA_COLUMNS = ["SignalNames"] + GAIN_COLUMNS
+
+
+def _annotation_bounds(annotated_indices, starts, ends):
+    """
+    Locate the annotations falling inside each [start, end] sample range.
+
+    Parameters:
+    - annotated_indices: Sorted sample indices of the annotations
+    - starts: First sample of each range
+    - ends: Last sample of each range (inclusive)
+
+    Returns:
+    - Two arrays (lo, hi) such that annotated_indices[lo[i]:hi[i]] lies inside range i
+    """
+    lo = np.searchsorted(annotated_indices, starts, side='left')
+    hi = np.searchsorted(annotated_indices, ends, side='right')
+    return lo, np.maximum(lo, hi)
+
+def find_rhythm_interval(record_name, database_path=None, cache=None, instrumentation=None, signal_dtype="float64",
+                         channels=None, files=None):
     """
     Find rhythm intervals based on rhythm annotations and their corresponding indices.
 
     Parameters:
     - record_name: The name of the record file (without extension) or full path for local files
     - database_path: Path to the database directory or empty string for local files
+    - cache: Optional RecordCache; database records are then fetched once and read from local disk
+    - instrumentation: Optional Instrumentation receiving the 'read' and 'intervals' stage events
+    - signal_dtype: 'float64' (physical units), 'float32' (physical units, half the memory) or
+      'int16' (raw ADC samples plus AdcGain/Baseline columns, see signal_dtype.to_physical)
+    - channels: None for the first channel only; a list of channel numbers, or 'all', to decode
+      those leads together into samples x channels signals, with their names in a SignalNames column
+    - files: Optional {file name: bytes-like content} of the record's .hea, .dat and .atr files,
+      e.g. uploads; the record is then parsed in memory (see RecordReader.from_memory), and
+      UnsupportedInMemoryFormat is raised for signal formats other than 16 and 212
 
     Returns:
     - A Polars DataFrame containing the start, end, rhythm information, and associated signals and annotations.
     """
-    try:
-        if database_path:
-            # Using database path
-            record = wfdb.rdrecord(record_name=record_name, pn_dir=database_path)
-            record_annotations = wfdb.rdann(record_name=record_name, pn_dir=database_path, extension='atr')
-        else:
-            # Using local files with full path
-            record = wfdb.rdrecord(record_name)
-            record_annotations = wfdb.rdann(record_name, extension='atr')
-    except Exception as e:
-        raise Exception(f"Error reading WFDB files: {str(e)}")
-
-    rd_signal = record.p_signal[:,0]
-    rd_fs = record.fs
-    rd_name = record.record_name
-
-    rd_beat_annotations = record_annotations.symbol
-    rd_rhythm_annotations = record_annotations.aux_note
+    check_signal_dtype(signal_dtype)
+    physical = signal_dtype != "int16"
+    return_res = {"float64": 64, "float32": 32, "int16": 16}[signal_dtype]
+    instrumentation = instrumentation_for(instrumentation)
+    record_label = os.path.basename(str(record_name))
+    signal_names = None
+
+    with instrumentation.stage("read", record_label) as event:
+        if files is not None:
+            database_path = None
+        elif database_path and cache is not None:
+            # Fetch the record into the local cache and read it from there
+            record_name = cache.get(database_path, record_name)
+            database_path = None
+
+        adc_gain = baseline = None
+        try:
+            if database_path:
+                # Using database path
+                if channels == 'all':
+                    channels = list(range(wfdb.rdheader(record_name, pn_dir=database_path).n_sig))
+                record = wfdb.rdrecord(record_name=record_name, pn_dir=database_path,
+                                       physical=physical, return_res=return_res,
+                                       channels=None if channels is None else list(channels))
+                record_annotations = wfdb.rdann(record_name=record_name, pn_dir=database_path, extension='atr')
+                if physical:
+                    rd_signal = record.p_signal
+                else:
+                    rd_signal = digital_to_int16(record.d_signal, record.fmt[0])
+                    adc_gain, baseline = np.asarray(record.adc_gain), np.asarray(record.baseline)
+                if channels is None:
+                    rd_signal = rd_signal[:,0]
+                    if not physical:
+                        adc_gain, baseline = adc_gain[0], baseline[0]
+                else:
+                    signal_names = list(record.sig_name)
+                rd_fs = record.fs
+                rd_name = record.record_name
+                event["output_bytes"] = (record.p_signal if physical else record.d_signal).nbytes
+            else:
+                # Using local files with full path; formats 16 and 212 are
+                # memory-mapped, so only the samples of the intervals are decoded
+                if files is not None:
+                    reader = RecordReader.from_memory(record_label, files)
+                else:
+                    reader = RecordReader(os.path.dirname(record_name), os.path.basename(record_name))
+                record_annotations = reader.get_annotation()
+                if channels == 'all':
+                    channels = list(range(reader.get_header().n_sig))
+                channel = 0 if channels is None else list(channels)
+                rd_signal = reader.open_signal(channel, signal_dtype)
+                if not physical:
+                    adc_gain, baseline = reader.get_adc_gain(channel), reader.get_baseline(channel)
+                if channels is not None:
+                    signal_names = reader.get_signal_names(channels)
+                rd_fs = reader.get_sampling_frequency()
+                rd_name = reader.get_header().record_name
+        except UnsupportedInMemoryFormat:
+            # Callers holding the files in memory fall back to writing them to disk
+            raise
+        except Exception as e:
+            raise Exception(f"Error reading WFDB files: {str(e)}")
+        event["samples"] = len(rd_signal)
+        event["rows"] = len(record_annotations.sample)
+
+    rd_beat_annotations = np.asarray(record_annotations.symbol)
+    rd_rhythm_annotations = np.asarray(record_annotations.aux_note)
     rd_annotated_indices = record_annotations.sample
-        # First, find the location and the rhythm by removing the empty strings
-    location = []
-    rhythm = []
-    for index, annotation in enumerate(rd_rhythm_annotations):
-        if annotation != '':
-            location.append(index)
-            rhythm.append(annotation)
-            
-    #Then, find the start and end indices of the rhythm
-    rhythm_start=[]
-    rhythm_end=[]
-    for i in range(len(location)):
-        start_index = rd_annotated_indices[location[i]]
-        if i<len(location)-1:
-            end_index = rd_annotated_indices[location[i+1]]-1
-        else:
-            end_index = len(rd_signal)-1
-        rhythm_start.append(start_index)
-        rhythm_end.append(end_index)
-    
-    #Finally, create a table with the start, end, and rhythm information
+
+    with instrumentation.stage("intervals", rd_name) as event:
+        rhythm, rhythm_start, rhythm_end = _rhythm_bounds(rd_rhythm_annotations, rd_annotated_indices,
+                                                          len(rd_signal))
+        IntervalSignal = [rd_signal[sampfrom:sampto] for sampfrom, sampto in zip(rhythm_start, rhythm_end)]
+
+        rhythm_table = _build_rhythm_table(rd_name, rd_fs, rhythm, rhythm_start, rhythm_end, IntervalSignal,
+                                           rd_beat_annotations, rd_rhythm_annotations, rd_annotated_indices,
+                                           signal_dtype, adc_gain, baseline, signal_names)
+        event["rows"] = len(rhythm_table)
+        event["samples"] = len(rd_signal)
+        event["output_bytes"] = rhythm_table.estimated_size()
+    return rhythm_table
+
+def _rhythm_bounds(rd_rhythm_annotations, rd_annotated_indices, signal_length):
+    """
+    Find the rhythm episodes of a record from its rhythm annotations.
+
+    Parameters:
+    - rd_rhythm_annotations: NumPy array of auxiliary notes of all annotations
+    - rd_annotated_indices: Sorted sample indices of all annotations
+    - signal_length: Number of samples of the record
+
+    Returns:
+    - Tuple (rhythm, rhythm_start, rhythm_end) with the rhythm label and the
+      first and last sample of each episode
+    """
+    # First, find the location and the rhythm by removing the empty strings
+    location = np.flatnonzero(rd_rhythm_annotations != '')
+    rhythm = rd_rhythm_annotations[location].tolist()
+
+    # Then, find the start and end indices of the rhythm
+    rhythm_start = rd_annotated_indices[location]
+    rhythm_end = np.empty_like(rhythm_start)
+    rhythm_end[:-1] = rhythm_start[1:] - 1
+    rhythm_end[-1:] = signal_length - 1
+    return rhythm, rhythm_start, rhythm_end
+
+def _build_rhythm_table(rd_name, rd_fs, rhythm, rhythm_start, rhythm_end, IntervalSignal,
+                        rd_beat_annotations, rd_rhythm_annotations, rd_annotated_indices,
+                        signal_dtype="float64", adc_gain=None, baseline=None, signal_names=None):
+    """
+    Assemble the rhythm table of a set of episodes.
+
+    Parameters:
+    - rd_name: Name of the record
+    - rd_fs: Sampling frequency of the record
+    - rhythm, rhythm_start, rhythm_end: Episodes as returned by _rhythm_bounds
+    - IntervalSignal: Signal of each episode, i.e. signal[start:end]
+    - rd_beat_annotations, rd_rhythm_annotations: NumPy arrays of symbols and auxiliary notes of all annotations
+    - rd_annotated_indices: Sorted sample indices of all annotations
+    - signal_dtype: Signal dtype mode of IntervalSignal
+    - adc_gain, baseline: ADC gain and baseline of the channel(s), added as columns in 'int16' mode
+    - signal_names: Names of the channels of samples x channels signals, or None for a single channel
+
+    Returns:
+    - A Polars DataFrame with one row per episode
+    """
+    # Finally, create a table with the start, end, and rhythm information
     rhythm_table = pl.DataFrame({'Start': rhythm_start, 'End': rhythm_end, 'rhythm': rhythm})
-    
+
+    # Annotations are sorted by sample, so the annotations of every interval
+    # form a contiguous run that can be located with a single sorted search
+    first_annotation, last_annotation = _annotation_bounds(rd_annotated_indices, rhythm_start, rhythm_end)
+
+    # Running counts turn the PAC/PVC count of any run into a subtraction
+    pac_cumsum = np.concatenate(([0], np.cumsum(rd_beat_annotations == 'A')))
+    pvc_cumsum = np.concatenate(([0], np.cumsum(rd_beat_annotations == 'V')))
+    NoOfPAC = pac_cumsum[last_annotation] - pac_cumsum[first_annotation]
+    NoOfPVC = pvc_cumsum[last_annotation] - pvc_cumsum[first_annotation]
+
     interval_duration = []
-    IntervalSignal=[]
-    IntervalAnnotatedIndices=[]
-    IntervalBeatAnnotations=[]
-    IntervalRhythmAnnotations=[]
-    NoOfPAC=[]
-    NoOfPVC=[]
-    
-    for row in range(len(rhythm_table)):
-        
-        sampfrom = rhythm_table['Start'][row]
-        sampto = rhythm_table['End'][row]
-        interval_signal = rd_signal[sampfrom:sampto]
+    IntervalAnnotatedIndices = []
+    IntervalBeatAnnotations = []
+    IntervalRhythmAnnotations = []
+
+    for interval_signal, sampfrom, lo, hi in zip(IntervalSignal, rhythm_start, first_annotation, last_annotation):
         interval_duration.append(round(len(interval_signal)/rd_fs,2))
-        IntervalSignal.append(interval_signal)
-        # Find indices where the annotated indices fall within the specified range
-        annotation_samp = np.intersect1d(np.where(sampfrom <= rd_annotated_indices), np.where(sampto >= rd_annotated_indices))
-            
-        # Calculate interval samples
-        interval_sample = rd_annotated_indices[annotation_samp] - sampfrom
-        IntervalAnnotatedIndices.append(interval_sample)
-        
-        # append beat annotations
-        interval_beat_annotations = [rd_beat_annotations[annotation_samp[i]] for i in range(len(annotation_samp))]
-        IntervalBeatAnnotations.append(interval_beat_annotations)
-        # append rhythm annotations
-        interval_rhythm_annotations = [rd_rhythm_annotations[annotation_samp[i]] for i in range(len(annotation_samp))]
-        IntervalRhythmAnnotations.append(interval_rhythm_annotations)
-        
-        NoOfPAC.append(interval_beat_annotations.count('A'))
-        NoOfPVC.append(interval_beat_annotations.count('V'))
-        
+        IntervalAnnotatedIndices.append(rd_annotated_indices[lo:hi] - sampfrom)
+        IntervalBeatAnnotations.append(rd_beat_annotations[lo:hi].tolist())
+        IntervalRhythmAnnotations.append(rd_rhythm_annotations[lo:hi].tolist())
+
     rhythm_table = rhythm_table.with_columns([
-    pl.Series("IntervalDuration", interval_duration),
-    pl.Series("IntervalSignal", IntervalSignal),
-    pl.Series("IntervalAnnotatedIndices", IntervalAnnotatedIndices),
-    pl.Series("IntervalBeatAnnotations", IntervalBeatAnnotations),
-    pl.Series("IntervalRhythmAnnotations", IntervalRhythmAnnotations),
+    pl.Series("IntervalDuration", interval_duration, dtype=pl.Float64),
+    _list_series("IntervalSignal", IntervalSignal,
+                 polars_signal_dtype(signal_dtype, None if signal_names is None else len(signal_names))),
+    _list_series("IntervalAnnotatedIndices", IntervalAnnotatedIndices, pl.List(pl.Int64)),
+    pl.Series("IntervalBeatAnnotations", IntervalBeatAnnotations, dtype=pl.List(pl.String)),
+    pl.Series("IntervalRhythmAnnotations", IntervalRhythmAnnotations, dtype=pl.List(pl.String)),
     pl.Series("NoOfPAC", NoOfPAC),
     pl.Series("NoOfPVC", NoOfPVC)
     ])
     
     rhythm_table = rhythm_table.with_columns([
-    pl.Series("RecordName", [rd_name for _ in range(len(rhythm_table))]),  
-    pl.Series("RecordFs", [rd_fs for _ in range(len(rhythm_table))]) 
+    pl.Series("RecordName", [rd_name for _ in range(len(rhythm_table))], dtype=pl.String),
+    pl.Series("RecordFs", [rd_fs for _ in range(len(rhythm_table))])
     ])
     # Rearranging the columns of the rhythm_table
     rhythm_table = rhythm_table.select([
@@ -121,85 +233,240 @@ def find_rhythm_interval(record_name, database_path=None):
     ])
     # Clean the 'rhythm' column by removing the opening parenthesis '('
     rhythm_table = rhythm_table.with_columns(pl.col("rhythm").str.replace("(", "", literal=True))
+    if signal_names is not None:
+        rhythm_table = rhythm_table.with_columns(
+            pl.Series("SignalNames", [list(signal_names)] * len(rhythm_table), dtype=pl.List(pl.String))
+        )
+    if adc_gain is not None:
+        # ADC samples are converted to physical units with these on demand
+        rhythm_table = rhythm_table.with_columns(gain_columns(adc_gain, baseline, len(rhythm_table)))
     return rhythm_table
 
-def rhythm_summary(record_rhythm_table):
+def rhythm_summary(record_rhythm_table, by="rhythm", instrumentation=None):
     """
     Create a summary of rhythm statistics from the record rhythm table.
     
+    The statistics are computed by a single lazy group_by aggregation, so the
+    concatenated rhythm tables of a whole database can be summarized in one call.
+
     Parameters:
-    - record_rhythm_table: Polars DataFrame containing rhythm data
+    - record_rhythm_table: Polars DataFrame or LazyFrame containing rhythm data
+    - by: Column or list of columns to group by, e.g. ["RecordName", "rhythm"]
+    - instrumentation: Optional Instrumentation receiving the 'summary' stage event
     
     Returns:
     - Polars DataFrame with rhythm statistics
     """
-    # Calculate frequency of rhythms and rename the column
-    frequency_of_rhythms = record_rhythm_table['rhythm'].value_counts().rename({"count": "frequency"})
-
-    # Initialize lists for statistics
-    min_duration = []
-    max_duration = []
-    mean_duration = []
-    std_duration = []
-    total_duration = []
-    pac_count = []
-    pvc_count = []
-    
-    # Process each rhythm
-    for rhythm in frequency_of_rhythms['rhythm']:
-        # Filter data for current rhythm
-        rhythm_data = record_rhythm_table.filter(pl.col("rhythm") == rhythm)
-        
-        # Calculate duration statistics
-        durations = rhythm_data['IntervalDuration'].to_list()
-        min_duration.append(min(durations))
-        max_duration.append(max(durations))
-        mean_duration.append(np.mean(durations))
-        std_duration.append(np.std(durations))
-        total_duration.append(sum(durations))
-        # Flatten beat annotations and count arrhythmias
-        beat_annotations = [item for sublist in rhythm_data['IntervalBeatAnnotations'].to_list() for item in sublist]
-        pac_count.append(beat_annotations.count('A'))
-        pvc_count.append(beat_annotations.count('V'))
-    
-    # Add statistics to the frequency table
-    summary_table = frequency_of_rhythms.with_columns([
-        pl.Series("min(sec)", min_duration),
-        pl.Series("max(sec)", max_duration),
-        pl.Series("mean(sec)", mean_duration),
-        pl.Series("std(sec)", std_duration),
-        pl.Series("total(sec)", total_duration),
-        pl.Series("PAC", pac_count),
-        pl.Series("PVC", pvc_count)
+    with instrumentation_for(instrumentation).stage("summary") as event:
+        summary_table = _rhythm_summary(record_rhythm_table, by)
+        event["rows"] = len(summary_table)
+        event["output_bytes"] = summary_table.estimated_size()
+    return summary_table
+
+def _rhythm_summary(record_rhythm_table, by):
+    rhythm_data = record_rhythm_table.lazy()
+    columns = rhythm_data.collect_schema().names()
+
+    # NoOfPAC/NoOfPVC hold the per-interval counts of 'A' and 'V' beats;
+    # fall back to counting them in the beat annotations
+    if "NoOfPAC" in columns and "NoOfPVC" in columns:
+        pac = pl.col("NoOfPAC")
+        pvc = pl.col("NoOfPVC")
+    else:
+        pac = pl.col("IntervalBeatAnnotations").list.count_matches("A")
+        pvc = pl.col("IntervalBeatAnnotations").list.count_matches("V")
+
+    duration = pl.col("IntervalDuration")
+    summary_table = rhythm_data.group_by(by, maintain_order=True).agg([
+        pl.len().alias("frequency"),
+        duration.min().alias("min(sec)"),
+        duration.max().alias("max(sec)"),
+        duration.mean().alias("mean(sec)"),
+        duration.std(ddof=0).alias("std(sec)"),
+        duration.sum().alias("total(sec)"),
+        pac.sum().cast(pl.Int64).alias("PAC"),
+        pvc.sum().cast(pl.Int64).alias("PVC"),
     ])
     
-    return summary_table
+    return summary_table.collect()
 
-def create_segments(record_rhythm_table, window_size, window_step, progress_callback=None):
+def _window_starts(n_samples, window_size_samples, window_step_samples):
+    """
+    Compute the left edge of every window that fits inside an interval.
+
+    Parameters:
+    - n_samples: Number of samples in the interval
+    - window_size_samples: Window width in samples
+    - window_step_samples: Distance between consecutive windows in samples
+
+    Returns:
+    - A NumPy array with the first sample of each window
+    """
+    return np.arange(0, n_samples - window_size_samples, window_step_samples)
+
+def _sliding_windows(signal, window_size_samples, window_step_samples, no_of_windows=None):
+    """
+    Return a strided, read-only view with one window of the signal per row.
+
+    No sample is copied; row i starts at i * window_step_samples. By default
+    every window that fits inside the signal is returned. A samples x
+    channels signal gives windows x samples x channels, so all leads are
+    windowed in the same pass.
+    """
+    if no_of_windows is None:
+        no_of_windows = len(_window_starts(len(signal), window_size_samples, window_step_samples))
+    if no_of_windows == 0:
+        return np.empty((0, window_size_samples) + signal.shape[1:], dtype=signal.dtype)
+    windows = np.lib.stride_tricks.sliding_window_view(signal, window_size_samples, axis=0)
+    if signal.ndim == 2:
+        windows = windows.transpose(0, 2, 1)
+    return windows[::window_step_samples][:no_of_windows]
+
+def _list_series(name, rows, dtype):
+    """
+    Build a Polars list column from a sequence of NumPy arrays.
+
+    Polars infers a fixed-size Array when all rows have the same length,
+    and keeps the dtype of ragged NumPy rows; the result is always converted
+    to the requested List dtype. Rows of
+    samples x channels give a list of fixed-size arrays per row.
+    """
+    if isinstance(dtype.inner, pl.Array):
+        return _array_list_series(name, rows, dtype)
+    series = pl.Series(name, rows, dtype=dtype)
+    if isinstance(series.dtype, pl.Array):
+        series = series.arr.to_list()
+    # Ragged rows keep the dtype of their NumPy arrays, so the inner dtype is cast too
+    return series.cast(dtype)
+
+def _array_list_series(name, rows, dtype):
+    """Build a List(Array) column from samples x channels NumPy arrays without per-sample conversion."""
+    n_channels = dtype.inner.size
+    series = [pl.Series(name, np.ascontiguousarray(row).reshape(-1)).reshape((-1, n_channels)).implode()
+              for row in rows]
+    if not series:
+        return pl.Series(name, [], dtype=dtype)
+    return pl.concat(series).cast(dtype)
+
+def _ragged_series(name, values, offsets, dtype):
+    """
+    Build a Polars list column from flat values and per-row offsets.
+
+    Parameters:
+    - name: Name of the resulting Series
+    - values: Flat NumPy array holding the items of every row
+    - offsets: Array of length n_rows + 1; row i is values[offsets[i]:offsets[i+1]]
+    - dtype: Polars List dtype of the result
+
+    Returns:
+    - A Polars Series of dtype List
+    """
+    return _list_series(name, np.split(values, offsets[1:-1]), dtype)
+
+def _segment_interval(signal, beat_annotations, annotated_indices, window_size_samples, window_step_samples,
+                      no_of_windows=None):
+    """
+    Segment a single rhythm interval with one batched annotation search.
+
+    Parameters:
+    - signal: Signal of the interval
+    - beat_annotations: NumPy array of beat symbols of the interval
+    - annotated_indices: Sorted sample indices of the annotations, relative to the interval
+    - window_size_samples: Window width in samples
+    - window_step_samples: Distance between consecutive windows in samples
+    - no_of_windows: Number of windows to take; defaults to every window that fits
+
+    Returns:
+    - Tuple (windows, annotations, indices) with a strided view of the windows
+      and the list columns of beat symbols and window-relative indices
+    """
+    windows = _sliding_windows(signal, window_size_samples, window_step_samples, no_of_windows)
+    left_index = np.arange(len(windows)) * window_step_samples
+    lo, hi = _annotation_bounds(annotated_indices, left_index, left_index + window_size_samples - 1)
+
+    # Gather the annotations of all windows at once; windows overlap, so the
+    # same annotation may appear in several rows
+    counts = hi - lo
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    gather = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - lo, counts)
+    shift = np.repeat(left_index, counts)
+
+    annotations = _ragged_series("annotations", beat_annotations[gather], offsets, pl.List(pl.String))
+    indices = _ragged_series("indices", annotated_indices[gather] - shift, offsets, pl.List(pl.Int64))
+    return windows, annotations, indices
+
+def _segment_frame(rd_name, row, rhythm, windows, annotations, indices):
+    """Assemble the segment table rows of one interval."""
+    return pl.DataFrame([
+        pl.Series("signals", windows).arr.to_list(),
+        annotations,
+        indices,
+    ]).select(
+        pl.lit(rd_name, dtype=pl.String).alias("RecordName"),
+        pl.lit(row, dtype=pl.Int64).alias("intervalNo"),
+        "signals",
+        "annotations",
+        "indices",
+        pl.lit(rhythm, dtype=pl.String).alias("rhythm_type"),
+    )
+
+def _empty_segment_table(signal_dtype=pl.List(pl.Float64), metadata_schema=None):
+    schema = {
+        'RecordName': pl.String,
+        'intervalNo': pl.Int64,
+        'signals': signal_dtype,
+        'annotations': pl.List(pl.String),
+        'indices': pl.List(pl.Int64),
+        'rhythm_type': pl.String,
+    }
+    schema.update(metadata_schema or {})
+    return pl.DataFrame(schema=schema)
+
+def _metadata_schema(table):
+    """Return the schema of the SignalNames/AdcGain/Baseline columns a table holds."""
+    return {name: table.schema[name] for name in METADATA_COLUMNS if name in table.columns}
+
+def _with_metadata_columns(segments_table, record_rhythm_table):
+    """Carry the channel names and ADC gains of each interval over to its segments."""
+    return segments_table.with_columns(
+        record_rhythm_table[name].gather(segments_table['intervalNo'])
+        for name in _metadata_schema(record_rhythm_table)
+    )
+
+def create_segments(record_rhythm_table, window_size, window_step, progress_callback=None, instrumentation=None):
     """
     Create segments from rhythm table.
     
+    Windows are taken as strided views of each interval signal, and the
+    annotations of all windows of an interval are located with a single
+    sorted search.
+
     Args:
         record_rhythm_table: Input rhythm table
         window_size: Size of each segment window in seconds
         window_step: Step size between windows in seconds
-        progress_callback: Optional callback function to report progress
+        progress_callback: Optional callback function to report progress; it
+            receives at most one message per progress interval
+        instrumentation: Optional Instrumentation receiving the 'segmentation'
+            stage event and throttled progress events
     """
-    window_size = window_size  # seconds
-    window_step = window_step  # seconds
-    parent_record_name = []
-    segmented_intervalNo = []
-    segmented_intervalFs = []
-    segmented_signal = []
-    segmented_beat_annotations = []
-    segmented_rhythm_annotations = []
-    segmented_annotated_indices = [] 
-    
-    for row in range(len(record_rhythm_table)):     
-        
-        signal = record_rhythm_table['IntervalSignal'][row]
-        beat_annotations = record_rhythm_table['IntervalBeatAnnotations'][row]
-        annotated_indices = record_rhythm_table['IntervalAnnotatedIndices'][row]
+    instrumentation = instrumentation_for(instrumentation, progress_callback)
+    record_label = record_rhythm_table['RecordName'][0] if len(record_rhythm_table) else None
+    with instrumentation.stage("segmentation", record_label) as event:
+        segments_table = _create_segments(record_rhythm_table, window_size, window_step, instrumentation)
+        event["rows"] = len(segments_table)
+        event["samples"] = int(record_rhythm_table['IntervalSignal'].list.len().sum() or 0)
+        event["output_bytes"] = segments_table.estimated_size()
+    return segments_table
+
+def _create_segments(record_rhythm_table, window_size, window_step, instrumentation):
+    interval_signals = record_rhythm_table['IntervalSignal']
+    interval_beat_annotations = record_rhythm_table['IntervalBeatAnnotations']
+    interval_annotated_indices = record_rhythm_table['IntervalAnnotatedIndices']
+    segmented_tables = []
+    no_of_intervals = len(record_rhythm_table)
+
+    for row in range(no_of_intervals):
         rd_name = record_rhythm_table['RecordName'][row]
         rhythm = record_rhythm_table['rhythm'][row]
         signal_fs = record_rhythm_table['RecordFs'][row]
@@ -207,74 +474,31 @@ def create_segments(record_rhythm_table, window_size, window_step, progress_call
         # Convert durations to samples
         window_size_samples = int(window_size * signal_fs)
         window_step_samples = int(window_step * signal_fs)
-        
+
         if signal_duration < window_size:
-            if progress_callback:
-                progress_callback(f"Skipping interval {row} of {rd_name} (duration: {signal_duration}s)")
-            continue    
-    
-        if signal_duration >= window_size:
-            if progress_callback:
-                progress_callback(f"Processing interval {row} of {rd_name} (duration: {signal_duration}s)")
-            
-                     
-            no_of_segments = int((len(signal) - window_size_samples) / window_step_samples) + 1            
-            
-            intervalNo = []
-            intervalFs = []
-            intervalParent = []
-
-            segmentSignal = []
-            segmentBeatAnnotations = []
-            segmentRhythmAnnotations = []
-            segmentAnnotatedIndices = []
-            
-            left_index = 0
-            right_index = left_index + window_size_samples
-            while (left_index < (len(signal) - window_size_samples)) and (right_index <= len(signal)):
-                intervalNo.append(row)
-                intervalFs.append(signal_fs)
-                intervalParent.append(rd_name)
-                segmentRhythmAnnotations.append(rhythm)                
-                
-                # Extract segment signal
-                interval_signal = signal[left_index:right_index]        
-                segmentSignal.append(interval_signal)
-
-                # Find indices where the annotations fall within the range
-                annotation_samp = np.where((annotated_indices >= left_index) & (annotated_indices < right_index))[0]
-                    
-                # Calculate interval samples
-                interval_sample = annotated_indices[annotation_samp] - left_index
-                segmentAnnotatedIndices.append(interval_sample)
-                
-                # Append beat annotations
-                interval_beat_annotations = beat_annotations[annotation_samp]
-                segmentBeatAnnotations.append(interval_beat_annotations)
-                
-                # Update indices
-                left_index += window_step_samples
-                right_index = left_index + window_size_samples
-                
-            if progress_callback:
-                progress_callback(f"Created {no_of_segments} segments")
-        parent_record_name.append(intervalParent)
-        segmented_intervalNo.append(intervalNo)
-        segmented_intervalFs.append(intervalFs)
-        segmented_signal.append(segmentSignal)
-        segmented_beat_annotations.append(segmentBeatAnnotations)
-        segmented_rhythm_annotations.append(segmentRhythmAnnotations)
-        segmented_annotated_indices.append(segmentAnnotatedIndices)
-    segmented_table=pl.DataFrame({
-    'RecordName':[parent_record_name[i][j] for i in range(len(parent_record_name)) for j in range(len(parent_record_name[i]))],
-    'intervalNo':[segmented_intervalNo[i][j] for i in range(len(segmented_intervalNo)) for j in range(len(segmented_intervalNo[i]))],
-    'signals':[segmented_signal[i][j] for i in range(len(segmented_signal)) for j in range(len(segmented_signal[i]))],
-    'annotations':[segmented_beat_annotations[i][j] for i in range(len(segmented_beat_annotations)) for j in range(len(segmented_beat_annotations[i]))],
-    'indices':[segmented_annotated_indices[i][j] for i in range(len(segmented_annotated_indices)) for j in range(len(segmented_annotated_indices[i]))],
-    'rhythm_type':[segmented_rhythm_annotations[i][j] for i in range(len(segmented_rhythm_annotations)) for j in range(len(segmented_rhythm_annotations[i]))]
-    })
-    
-    return segmented_table
+            instrumentation.progress("segmentation", row + 1, no_of_intervals, rd_name,
+                                     f"Skipping interval {row} of {rd_name} (duration: {signal_duration}s)")
+            continue
+
+        signal = interval_signals[row].to_numpy()
+        beat_annotations = np.asarray(interval_beat_annotations[row].to_list(), dtype=str)
+        annotated_indices = interval_annotated_indices[row].to_numpy()
+
+        windows, annotations, indices = _segment_interval(
+            signal, beat_annotations, annotated_indices, window_size_samples, window_step_samples
+        )
+        no_of_segments = len(windows)
+        if no_of_segments > 0:
+            segmented_tables.append(_segment_frame(rd_name, row, rhythm, windows, annotations, indices))
+
+        instrumentation.progress("segmentation", row + 1, no_of_intervals, rd_name,
+                                 f"Processed interval {row} of {rd_name} (duration: {signal_duration}s): "
+                                 f"created {no_of_segments} segments")
+
+    if not segmented_tables:
+        return _empty_segment_table(record_rhythm_table.schema['IntervalSignal'],
+                                    _metadata_schema(record_rhythm_table))
+    return _with_metadata_columns(pl.concat(segmented_tables), record_rhythm_table)
 
 
 def plot_rhythm_summary(rhythm_summary):
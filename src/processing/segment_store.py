@@ -0,0 +1,316 @@
+"""
+Persistent, memory-mapped segment store for training workloads.
+
+A store is a directory holding the signals of fixed-width segments as one
+contiguous array of rows (segments x samples, or segments x samples x
+channels) that is memory-mapped on open, the concatenated beat annotations
+of all segments, and a columnar index with one row per segment. Any segment
+or batch of segments is read with plain array indexing, without parsing.
+
+Segments are appended record by record: the new rows are written at the end
+of the files and committed by rewriting the small store.json, so an append
+costs the size of the new segments and a failed or interrupted append leaves
+the store as it was. Appends from several processes are serialized with a file
+lock.
+
+Layout:
+    store.json          dtype, row shape, committed row and beat counts, beat symbols
+    signals.bin         rows x samples (x channels) of the store's dtype
+    beat_indices.bin    int32 annotation positions relative to each segment
+    beat_symbols.bin    uint8 codes of the annotation symbols in store.json
+    index/part-*.parquet  RecordName, intervalNo, rhythm_type, the metadata
+                        columns of the segments, row, beat_start and beat_end
+
+Example:
+    store = SegmentStore("segments_250hz")
+    store.append(create_segments(rhythm_table, window_size=30, window_step=5))
+    signals, index = store.batch(np.random.permutation(len(store))[:256])
+"""
+
+import os
+import json
+import contextlib
+
+import numpy as np
+import polars as pl
+
+from .export import iter_chunks
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+STORE_VERSION = 1
+MAX_SYMBOLS = 256
+
+
+class SegmentStore:
+    """
+    Fixed-width segments in contiguous memory-mapped arrays with a columnar index.
+
+    All segments of a store have the same number of samples, channels and
+    signal dtype, which are set by the first append; resample records with
+    resample_rhythm_table to mix sampling frequencies.
+    """
+
+    def __init__(self, path):
+        """
+        Open or create a SegmentStore.
+
+        Args:
+            path (str): Directory of the store; created if it does not exist.
+        """
+        self.path = str(path)
+        os.makedirs(os.path.join(self.path, "index"), exist_ok=True)
+        self.__meta_path = os.path.join(self.path, "store.json")
+        self.__index = None
+        self.__index_parts = 0
+        self.refresh()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @contextlib.contextmanager
+    def _lock(self):
+        """Serialize appends between processes sharing the store."""
+        if fcntl is None:
+            yield
+            return
+        with open(self._file("store.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_meta(self):
+        if not os.path.exists(self.__meta_path):
+            return {"version": STORE_VERSION, "dtype": None, "shape": None, "rows": 0, "beats": 0,
+                    "parts": 0, "symbols": []}
+        with open(self.__meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_meta(self, meta):
+        tmp_path = f"{self.__meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=1)
+        os.replace(tmp_path, self.__meta_path)
+
+    def _map(self, name, dtype, count, shape=()):
+        """Memory-map the committed part of a file; empty stores get an empty array."""
+        if count == 0:
+            return np.empty((0, *shape), dtype=dtype)
+        return np.memmap(self._file(name), dtype=dtype, mode="r", shape=(count, *shape))
+
+    def refresh(self):
+        """Reload the store, e.g. after another process appended segments."""
+        meta = self._load_meta()
+        self.__meta = meta
+        shape = tuple(meta["shape"] or ())
+        dtype = np.dtype(meta["dtype"]) if meta["dtype"] else np.float64
+        self.__signals = self._map("signals.bin", dtype, meta["rows"], shape)
+        self.__beat_indices = self._map("beat_indices.bin", np.int32, meta["beats"])
+        self.__beat_codes = self._map("beat_symbols.bin", np.uint8, meta["beats"])
+        self.__symbols = np.asarray(meta["symbols"] or [""], dtype=object)
+
+        # Index parts are immutable once committed, so only the new ones are read
+        first_part = self.__index_parts if meta["parts"] >= self.__index_parts else 0
+        if first_part == 0:
+            self.__index = None
+        parts = [os.path.join(self.path, "index", f"part-{i:05d}.parquet") for i in range(first_part, meta["parts"])]
+        if parts:
+            new_rows = pl.read_parquet(parts)
+            self.__index = new_rows if self.__index is None else pl.concat([self.__index, new_rows])
+        self.__index_parts = meta["parts"]
+        if self.__index is not None:
+            self.__beat_start = self.__index["beat_start"].to_numpy()
+            self.__beat_end = self.__index["beat_end"].to_numpy()
+
+    @property
+    def index(self):
+        """Columnar index with one row per segment, in the order of the signal rows."""
+        if self.__index is None:
+            return pl.DataFrame(schema={"RecordName": pl.String, "intervalNo": pl.Int64, "rhythm_type": pl.String,
+                                        "row": pl.Int64, "beat_start": pl.Int64, "beat_end": pl.Int64})
+        return self.__index
+
+    @property
+    def signals(self):
+        """Memory-mapped array of all segments: rows x samples (x channels)."""
+        return self.__signals
+
+    @property
+    def dtype(self):
+        return self.__signals.dtype
+
+    @property
+    def width(self):
+        """Number of samples of every segment, or None for an empty store."""
+        return self.__meta["shape"][0] if self.__meta["shape"] else None
+
+    def __len__(self):
+        return self.__meta["rows"]
+
+    def _row(self, i):
+        n_rows = len(self)
+        if i < 0:
+            i += n_rows
+        if not 0 <= i < n_rows:
+            raise IndexError(f"Segment {i} out of range for a store of {n_rows} segments")
+        return i
+
+    def signal(self, i):
+        """Return the signal of segment i as a view of the memory-mapped array."""
+        return self.__signals[self._row(i)]
+
+    def annotations(self, i):
+        i = self._row(i)
+        return self.__symbols[self.__beat_codes[self.__beat_start[i]:self.__beat_end[i]]].astype(str)
+
+    def indices(self, i):
+        i = self._row(i)
+        return np.asarray(self.__beat_indices[self.__beat_start[i]:self.__beat_end[i]], dtype=np.int64)
+
+    def __getitem__(self, i):
+        """Return segment i as a dictionary with the columns of create_segments."""
+        i = self._row(i)
+        return {
+            'RecordName': self.__index['RecordName'][i],
+            'intervalNo': self.__index['intervalNo'][i],
+            'signals': self.signal(i),
+            'annotations': self.annotations(i),
+            'indices': self.indices(i),
+            'rhythm_type': self.__index['rhythm_type'][i],
+        }
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def batch(self, rows):
+        """
+        Read a batch of segments.
+
+        Args:
+            rows (array-like): Row numbers, e.g. a shuffled slice of range(len(store)).
+
+        Returns:
+            tuple: (signals, index) with the signals of the rows as one
+            array of rows x samples (x channels) and their index rows.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        return np.asarray(self.__signals[rows]), self.index[rows]
+
+    def rows(self, *predicates):
+        """Return the row numbers of the segments matching Polars predicates on the index."""
+        return self.index.filter(*predicates)["row"].to_numpy()
+
+    def _encode(self, meta, symbols):
+        """Return the uint8 codes of annotation symbols, adding new symbols to the store's vocabulary."""
+        vocabulary = {symbol: code for code, symbol in enumerate(meta["symbols"])}
+        unique_symbols, inverse = np.unique(symbols, return_inverse=True)
+        for symbol in unique_symbols:
+            if symbol not in vocabulary:
+                if len(vocabulary) >= MAX_SYMBOLS:
+                    raise ValueError(f"A segment store holds at most {MAX_SYMBOLS} annotation symbols")
+                vocabulary[symbol] = len(vocabulary)
+                meta["symbols"].append(str(symbol))
+        codes = np.array([vocabulary[symbol] for symbol in unique_symbols], dtype=np.uint8)
+        return codes[inverse]
+
+    def _index_columns(self):
+        """Return the schema of the segment columns kept in the index, or None for an empty store."""
+        if self.__index is None:
+            return None
+        return {name: dtype for name, dtype in self.__index.schema.items()
+                if name not in ("row", "beat_start", "beat_end")}
+
+    def _check_chunk(self, meta, columns, expected_columns, signals):
+        shape = list(signals.shape[1:])
+        if meta["dtype"] is None:
+            meta["dtype"], meta["shape"] = signals.dtype.name, shape
+        elif signals.dtype.name != meta["dtype"]:
+            raise ValueError(f"Store holds {meta['dtype']} signals, got {signals.dtype.name}; "
+                             "segment with the same signal_dtype")
+        elif shape != meta["shape"]:
+            raise ValueError(f"Store holds segments of shape {tuple(meta['shape'])}, got {tuple(shape)}; "
+                             "use the same window size and resample_rhythm_table to a common fs")
+        if expected_columns is not None and columns != expected_columns:
+            raise ValueError(f"Segment columns {columns} do not match the store's index {expected_columns}")
+
+    def append(self, tables, max_rows=1000):
+        """
+        Append segments to the store.
+
+        Args:
+            tables: Segment table returned by create_segments, a LazySegmentTable
+                or an iterable of segment tables such as iter_segments; they
+                are written in chunks of max_rows segments.
+            max_rows (int): Number of segments converted to arrays at a time.
+
+        Returns:
+            int: Number of segments appended.
+
+        Raises:
+            ValueError: If the segments differ in width, channels or dtype from
+                the store, or their metadata columns from its index.
+        """
+        appended = 0
+        with self._lock():
+            # Another process may have appended since this store was opened
+            self.refresh()
+            meta = self.__meta
+            expected_columns = self._index_columns()
+            row_bytes = self.__signals.dtype.itemsize * int(np.prod(meta["shape"] or (0,)))
+            files = {name: open(self._file(name), "ab") for name in
+                     ("signals.bin", "beat_indices.bin", "beat_symbols.bin")}
+            try:
+                # Drop whatever an interrupted append left after the committed rows
+                files["signals.bin"].truncate(meta["rows"] * row_bytes)
+                files["beat_indices.bin"].truncate(meta["beats"] * 4)
+                files["beat_symbols.bin"].truncate(meta["beats"])
+
+                for chunk in iter_chunks(tables, max_rows):
+                    if len(chunk) == 0:
+                        continue
+                    lengths = chunk["signals"].list.len().to_numpy()
+                    if len(np.unique(lengths)) > 1:
+                        raise ValueError("Segments have different lengths; use the same window size "
+                                         "and resample_rhythm_table to a common fs")
+                    samples = chunk["signals"].explode().to_numpy()
+                    signals = samples.reshape(len(chunk), int(lengths[0]), *samples.shape[1:])
+                    columns = dict(chunk.drop("signals", "annotations", "indices").schema)
+                    self._check_chunk(meta, columns, expected_columns, signals)
+                    expected_columns = columns
+
+                    beat_counts = chunk["annotations"].list.len().fill_null(0).to_numpy().astype(np.int64)
+                    symbols = chunk["annotations"].explode().drop_nulls().to_numpy().astype(str)
+                    positions = chunk["indices"].explode().drop_nulls().to_numpy().astype(np.int32)
+                    beat_end = meta["beats"] + np.cumsum(beat_counts)
+
+                    index = chunk.drop("signals", "annotations", "indices").with_columns(
+                        pl.Series("row", np.arange(meta["rows"], meta["rows"] + len(chunk)), dtype=pl.Int64),
+                        pl.Series("beat_start", beat_end - beat_counts, dtype=pl.Int64),
+                        pl.Series("beat_end", beat_end, dtype=pl.Int64),
+                    )
+                    files["signals.bin"].write(np.ascontiguousarray(signals).tobytes())
+                    files["beat_indices.bin"].write(positions.tobytes())
+                    files["beat_symbols.bin"].write(self._encode(meta, symbols).tobytes())
+                    index.write_parquet(os.path.join(self.path, "index", f"part-{meta['parts']:05d}.parquet"))
+                    meta["rows"] += len(chunk)
+                    meta["beats"] = int(beat_end[-1])
+                    meta["parts"] += 1
+                    appended += len(chunk)
+
+                # Commit all chunks at once; a failed append leaves store.json unchanged
+                for output in files.values():
+                    output.flush()
+                    os.fsync(output.fileno())
+                if appended:
+                    self._save_meta(meta)
+            finally:
+                for output in files.values():
+                    output.close()
+                self.refresh()
+        return appended
@@ -0,0 +1,179 @@
+"""
+Compact signal representations.
+
+Signals are normally decoded to float64 physical units. Two compact modes are
+supported throughout the rhythm table, the segment table and the exports:
+
+- 'float32': physical units in single precision (half the memory)
+- 'int16': the raw ADC samples of the .dat file (a quarter of the memory);
+  the tables then carry the AdcGain and Baseline of the channel so that
+  to_physical can convert the signals when, and only when, they are needed
+
+Invalid samples are stored as DIGITAL_NAN in int16 mode and become NaN in
+physical units.
+"""
+
+import numpy as np
+import polars as pl
+
+SIGNAL_DTYPES = {
+    "float64": (np.float64, pl.Float64),
+    "float32": (np.float32, pl.Float32),
+    "int16": (np.int16, pl.Int16),
+}
+DIGITAL_NAN = np.iinfo(np.int16).min
+GAIN_COLUMNS = ["AdcGain", "Baseline"]
+
+# Bit resolution and invalid-sample marker of each WFDB storage format, as
+# defined by the WFDB signal file specification
+FORMAT_BIT_RES = {"8": 8, "16": 16, "24": 24, "32": 32, "61": 16, "80": 8, "160": 16, "212": 12,
+                  "310": 10, "311": 10, "508": 8, "516": 16, "524": 24}
+FORMAT_INVALID_SAMPLE = {"8": None, "16": -32768, "24": -8388608, "32": -2147483648, "61": -32768, "80": -128,
+                         "160": -32768, "212": -2048, "310": -512, "311": -512, "508": -128, "516": -32768,
+                         "524": -8388608}
+SIGNAL_COLUMNS = ["IntervalSignal", "signals"]
+
+
+def check_signal_dtype(signal_dtype):
+    """
+    Validate a signal dtype name.
+
+    Raises:
+        ValueError: If signal_dtype is not one of SIGNAL_DTYPES.
+    """
+    if signal_dtype not in SIGNAL_DTYPES:
+        raise ValueError(f"Unknown signal dtype {signal_dtype!r}, expected one of {list(SIGNAL_DTYPES)}")
+    return signal_dtype
+
+
+def polars_signal_dtype(signal_dtype, n_channels=None):
+    """
+    Return the Polars list dtype of a signal column in the given mode.
+
+    Single-channel signals are lists of samples; multi-channel signals
+    (n_channels given) are lists of fixed-size arrays, one per sample.
+    """
+    inner = SIGNAL_DTYPES[check_signal_dtype(signal_dtype)][1]
+    if n_channels is None:
+        return pl.List(inner)
+    return pl.List(pl.Array(inner, n_channels))
+
+
+def gain_columns(adc_gain, baseline, n_rows):
+    """
+    Return the AdcGain and Baseline columns of a table in 'int16' mode.
+
+    A scalar gain gives Float64/Int64 columns; the per-channel gains of a
+    multi-channel signal give fixed-size array columns.
+    """
+    if np.isscalar(adc_gain):
+        return [pl.Series("AdcGain", [float(adc_gain)] * n_rows, dtype=pl.Float64),
+                pl.Series("Baseline", [int(baseline)] * n_rows, dtype=pl.Int64)]
+    n_channels = len(adc_gain)
+    return [pl.Series("AdcGain", [list(map(float, adc_gain))] * n_rows, dtype=pl.Array(pl.Float64, n_channels)),
+            pl.Series("Baseline", [list(map(int, baseline))] * n_rows, dtype=pl.Array(pl.Int64, n_channels))]
+
+
+def digital_nan(fmt):
+    """Return the digital value marking invalid samples in a WFDB format (or a list of formats), or None."""
+    if isinstance(fmt, (list, tuple)):
+        return [digital_nan(f) for f in fmt]
+    return FORMAT_INVALID_SAMPLE.get(fmt)
+
+
+def digital_to_int16(d_signal, fmt):
+    """
+    Convert digital samples of one channel to int16, mapping the invalid-sample
+    marker of the storage format to DIGITAL_NAN.
+
+    Args:
+        d_signal (np.ndarray): Digital samples as returned by wfdb.
+        fmt (str): WFDB storage format of the channel.
+
+    Raises:
+        ValueError: If the format has a resolution above 16 bits.
+    """
+    if FORMAT_BIT_RES.get(fmt, 32) > 16:
+        raise ValueError(f"Signal format {fmt} does not fit in int16; use signal_dtype='float32'")
+    d_nan = digital_nan(fmt)
+    if d_nan is not None and d_nan != DIGITAL_NAN:
+        d_signal = np.where(d_signal == d_nan, DIGITAL_NAN, d_signal)
+    return d_signal.astype(np.int16, copy=False)
+
+
+def physical_signal(signal, adc_gain, baseline):
+    """
+    Convert the int16 samples of one signal to float64 physical units.
+
+    Args:
+        signal (np.ndarray): ADC samples.
+        adc_gain (float): ADC gain of the channel.
+        baseline (int): ADC baseline of the channel.
+    """
+    signal = np.asarray(signal)
+    physical = (signal.astype(np.float64) - baseline) / adc_gain
+    physical[signal == DIGITAL_NAN] = np.nan
+    return physical
+
+
+def _physical_rows(rows):
+    """Convert a struct Series of (signal, AdcGain, Baseline) multi-channel rows to physical units."""
+    signal, adc_gain, baseline = (rows.struct.field(name) for name in rows.struct.fields)
+    lengths = signal.list.len().fill_null(0).to_numpy().astype(np.int64)
+    samples = signal.explode().drop_nulls().to_numpy()
+    row_of_sample = np.repeat(np.arange(len(rows)), lengths)
+    physical = physical_signal(samples, adc_gain.to_numpy()[row_of_sample], baseline.to_numpy()[row_of_sample])
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    n_channels = samples.shape[1]
+    series = [
+        pl.Series(signal.name, physical[offsets[i]:offsets[i + 1]].reshape(-1)).reshape((-1, n_channels)).implode()
+        for i in range(len(rows))
+    ]
+    if not series:
+        return pl.Series(signal.name, [], dtype=pl.List(pl.Array(pl.Float64, n_channels)))
+    return pl.concat(series)
+
+
+def to_physical(table):
+    """
+    Convert the signal columns of a rhythm or segment table to float64 physical units.
+
+    Parameters:
+    - table: Polars DataFrame or LazyFrame in any signal dtype mode
+
+    Returns:
+    - The table with Float64 signal lists and without the AdcGain/Baseline
+      columns, i.e. the table the default float64 mode produces
+    """
+    schema = table.collect_schema() if isinstance(table, pl.LazyFrame) else table.schema
+    columns = []
+    for name, dtype in schema.items():
+        if name in GAIN_COLUMNS:
+            continue
+        if name in SIGNAL_COLUMNS and isinstance(dtype, pl.Array):
+            column = pl.col(name).arr.to_list()
+            dtype = pl.List(dtype.inner)
+        else:
+            column = pl.col(name)
+        if name in SIGNAL_COLUMNS and isinstance(dtype, pl.List) and isinstance(dtype.inner, pl.Array):
+            # Multi-channel signals: samples x channels
+            n_channels = dtype.inner.size
+            if dtype.inner.inner == pl.Int16:
+                if not all(gain in schema for gain in GAIN_COLUMNS):
+                    raise ValueError(f"Column {name} holds ADC samples but the table has no {GAIN_COLUMNS} columns")
+                column = pl.struct(column.alias(name), "AdcGain", "Baseline").map_batches(
+                    _physical_rows, return_dtype=pl.List(pl.Array(pl.Float64, n_channels))
+                ).alias(name)
+            else:
+                column = column.cast(pl.List(pl.Array(pl.Float64, n_channels)))
+        elif name in SIGNAL_COLUMNS and dtype == pl.List(pl.Int16):
+            if not all(gain in schema for gain in GAIN_COLUMNS):
+                raise ValueError(f"Column {name} holds ADC samples but the table has no {GAIN_COLUMNS} columns")
+            valid = column.list.eval(
+                pl.when(pl.element() == DIGITAL_NAN).then(float("nan")).otherwise(pl.element().cast(pl.Float64))
+            )
+            column = ((valid - pl.col("Baseline")) / pl.col("AdcGain")).alias(name)
+        elif name in SIGNAL_COLUMNS and dtype == pl.List(pl.Float32):
+            column = column.cast(pl.List(pl.Float64))
+        columns.append(column)
+    return table.select(columns)
@@ -0,0 +1,265 @@
+"""
+Streaming, bounded-memory processing of long-term records.
+
+The signal file is decoded chunk by chunk and rhythm intervals and segments
+are yielded as soon as the samples they cover have been read. Concatenating
+everything a generator yields gives the same table as the in-memory
+find_rhythm_interval / create_segments pipeline.
+"""
+
+import os
+import wfdb
+import numpy as np
+import polars as pl
+
+from .metrics import instrumentation_for
+from .read_record import RecordReader
+from .signal_dtype import check_signal_dtype, digital_to_int16, gain_columns
+from .rhythm_segmentation import (
+    _rhythm_bounds,
+    _build_rhythm_table,
+    _window_starts,
+    _segment_interval,
+    _segment_frame,
+)
+
+DEFAULT_CHUNK_SIZE = 2 ** 20  # samples
+
+
+class _SignalBuffer:
+    """The samples read so far that may still be needed, kept as a list of chunks."""
+
+    def __init__(self):
+        self.__chunks = []  # (first sample, array)
+
+    def append(self, sampfrom, chunk):
+        self.__chunks.append((sampfrom, chunk))
+
+    def slice(self, sampfrom, sampto):
+        """Return signal[sampfrom:sampto]; a view when it lies within one chunk."""
+        pieces = []
+        for chunk_start, chunk in self.__chunks:
+            chunk_end = chunk_start + len(chunk)
+            if chunk_end <= sampfrom or chunk_start >= sampto:
+                continue
+            pieces.append(chunk[max(sampfrom - chunk_start, 0):sampto - chunk_start])
+        if len(pieces) == 1:
+            return pieces[0]
+        if not pieces:
+            if not self.__chunks:
+                return np.empty(0)
+            like = self.__chunks[0][1]
+            return np.empty((0,) + like.shape[1:], dtype=like.dtype)
+        return np.concatenate(pieces)
+
+    def discard_before(self, sample):
+        """Drop the chunks that end at or before the given sample."""
+        self.__chunks = [(start, chunk) for start, chunk in self.__chunks if start + len(chunk) > sample]
+
+
+def _open_record(record_name, database_path=None, cache=None, channels=None, signal_dtype="float64"):
+    """
+    Read the header and annotations of a record without decoding its signal.
+
+    Returns:
+    - Tuple (rd_name, rd_fs, signal_length, annotation, read_chunk, gain, signal_names)
+      where read_chunk(sampfrom, sampto) decodes one range of the first channel
+      (channels=None) or of the listed channels as samples x channels in
+      signal_dtype, gain is the (adc_gain, baseline) pair in 'int16' mode and
+      (None, None) otherwise, and signal_names lists the channels read, or is
+      None for the first channel only
+    """
+    check_signal_dtype(signal_dtype)
+    if database_path and cache is not None:
+        record_name = cache.get(database_path, record_name)
+        database_path = None
+
+    try:
+        if database_path:
+            header = wfdb.rdheader(record_name, pn_dir=database_path)
+            annotation = wfdb.rdann(record_name, pn_dir=database_path, extension='atr')
+            annotation.symbol = np.asarray(annotation.symbol)
+            annotation.aux_note = np.asarray(annotation.aux_note)
+        else:
+            reader = RecordReader(os.path.dirname(record_name), os.path.basename(record_name))
+            header = reader.get_header()
+            annotation = reader.get_annotation()
+    except Exception as e:
+        raise Exception(f"Error reading WFDB files: {str(e)}")
+
+    if channels == 'all':
+        channels = list(range(header.n_sig))
+    channel = 0 if channels is None else list(channels)
+    columns = np.atleast_1d(channel).tolist()
+
+    if database_path:
+        def read_chunk(sampfrom, sampto):
+            record = wfdb.rdrecord(record_name, pn_dir=database_path, sampfrom=sampfrom, sampto=sampto,
+                                   channels=columns, physical=signal_dtype != "int16")
+            if signal_dtype == "int16":
+                signal = digital_to_int16(record.d_signal, record.fmt[0])
+            else:
+                signal = record.p_signal.astype(signal_dtype, copy=False)
+            return signal[:, 0] if channels is None else signal
+    else:
+        def read_chunk(sampfrom, sampto):
+            return reader.read_channels(channel, sampfrom, sampto, signal_dtype)
+
+    gain = (None, None)
+    if signal_dtype == "int16":
+        gain = (np.array([header.adc_gain[ch] for ch in columns]), np.array([header.baseline[ch] for ch in columns]))
+        if channels is None:
+            gain = (gain[0][0], gain[1][0])
+    signal_names = None if channels is None else [header.sig_name[ch] for ch in columns]
+    return header.record_name, header.fs, header.sig_len, annotation, read_chunk, gain, signal_names
+
+
+def _chunks(signal_length, chunk_size):
+    for sampfrom in range(0, signal_length, chunk_size):
+        yield sampfrom, min(sampfrom + chunk_size, signal_length)
+
+
+def iter_rhythm_intervals(record_name, database_path=None, cache=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                          instrumentation=None, signal_dtype="float64", channels=None):
+    """
+    Yield the rhythm table of a record piece by piece while reading it in chunks.
+
+    Each yielded table holds the intervals that end inside the chunk just
+    read. Only the samples of the episode in progress are kept between
+    chunks, so peak memory is bounded by the chunk size plus the longest
+    single episode, not by the record length.
+
+    Parameters:
+    - record_name: The name of the record file (without extension) or full path for local files
+    - database_path: Path to the database directory or empty string for local files
+    - cache: Optional RecordCache used for database records
+    - chunk_size: Number of samples decoded at a time
+    - instrumentation: Optional Instrumentation receiving throttled 'read' progress events
+    - signal_dtype: 'float64', 'float32' or 'int16', see find_rhythm_interval
+    - channels: None for the first channel, or a list of channels (or 'all'), see find_rhythm_interval
+
+    Yields:
+    - Polars DataFrames with the columns of find_rhythm_interval
+    """
+    instrumentation = instrumentation_for(instrumentation)
+    rd_name, rd_fs, signal_length, annotation, read_chunk, gain, signal_names = _open_record(
+        record_name, database_path, cache, channels=channels, signal_dtype=signal_dtype
+    )
+    rhythm, rhythm_start, rhythm_end = _rhythm_bounds(annotation.aux_note, annotation.sample, signal_length)
+
+    buffer = _SignalBuffer()
+    next_row = 0
+    for sampfrom, sampto in _chunks(signal_length, chunk_size):
+        if next_row == len(rhythm_start):
+            break
+        if sampto <= rhythm_start[next_row]:
+            # No episode has started yet
+            continue
+        buffer.append(sampfrom, read_chunk(sampfrom, sampto))
+        instrumentation.progress("read", sampto, signal_length, rd_name)
+
+        # An interval holds signal[Start:End], so it is complete once End is read
+        last_row = int(np.searchsorted(rhythm_end, sampto, side='right'))
+        if last_row > next_row:
+            rows = slice(next_row, last_row)
+            IntervalSignal = [buffer.slice(start, max(start, end))
+                              for start, end in zip(rhythm_start[rows], rhythm_end[rows])]
+            yield _build_rhythm_table(rd_name, rd_fs, rhythm[rows], rhythm_start[rows], rhythm_end[rows],
+                                      IntervalSignal, annotation.symbol, annotation.aux_note, annotation.sample,
+                                      signal_dtype, *gain, signal_names)
+            next_row = last_row
+
+        if next_row < len(rhythm_start):
+            buffer.discard_before(rhythm_start[next_row])
+
+
+def iter_segments(record_name, window_size, window_step, database_path=None, cache=None,
+                  chunk_size=DEFAULT_CHUNK_SIZE, instrumentation=None, signal_dtype="float64", channels=None):
+    """
+    Yield the segment table of a record piece by piece while reading it in chunks.
+
+    Windows are cut as soon as their last sample has been read, and only the
+    samples of windows still to come are kept between chunks, so peak memory
+    is bounded by the chunk size plus one window, even for episodes that span
+    many hours.
+
+    Parameters:
+    - record_name: The name of the record file (without extension) or full path for local files
+    - window_size: Size of each segment window in seconds
+    - window_step: Step size between windows in seconds
+    - database_path: Path to the database directory or empty string for local files
+    - cache: Optional RecordCache used for database records
+    - chunk_size: Number of samples decoded at a time
+    - instrumentation: Optional Instrumentation receiving throttled 'read' progress events
+    - signal_dtype: 'float64', 'float32' or 'int16', see find_rhythm_interval
+    - channels: None for the first channel, or a list of channels (or 'all'), see find_rhythm_interval
+
+    Yields:
+    - Polars DataFrames with the columns of create_segments
+    """
+    instrumentation = instrumentation_for(instrumentation)
+    rd_name, rd_fs, signal_length, annotation, read_chunk, gain, signal_names = _open_record(
+        record_name, database_path, cache, channels=channels, signal_dtype=signal_dtype
+    )
+    rhythm, rhythm_start, rhythm_end = _rhythm_bounds(annotation.aux_note, annotation.sample, signal_length)
+    rhythm = [label.replace("(", "", 1) for label in rhythm]
+
+    window_size_samples = int(window_size * rd_fs)
+    window_step_samples = int(window_step * rd_fs)
+
+    # Plan every window of the record up front from the annotations alone
+    window_row = []
+    window_start = []
+    for row, (start, end) in enumerate(zip(rhythm_start, rhythm_end)):
+        interval_length = max(0, min(end, signal_length) - start)
+        if round(interval_length / rd_fs, 2) < window_size:
+            continue
+        starts = _window_starts(interval_length, window_size_samples, window_step_samples)
+        window_row.append(np.full(len(starts), row))
+        window_start.append(start + starts)
+    window_row = np.concatenate(window_row) if window_row else np.empty(0, dtype=np.int64)
+    window_start = np.concatenate(window_start) if window_start else np.empty(0, dtype=np.int64)
+
+    buffer = _SignalBuffer()
+    next_window = 0
+    for sampfrom, sampto in _chunks(signal_length, chunk_size):
+        if next_window == len(window_start):
+            break
+        if sampto <= window_start[next_window]:
+            continue
+        buffer.append(sampfrom, read_chunk(sampfrom, sampto))
+        instrumentation.progress("read", sampto, signal_length, rd_name)
+
+        # Windows whose last sample has been read
+        last_window = int(np.searchsorted(window_start + window_size_samples, sampto, side='right'))
+        tables = []
+        while next_window < last_window:
+            row = window_row[next_window]
+            group_end = next_window + int(np.searchsorted(window_row[next_window:last_window], row, side='right'))
+            first_start = window_start[next_window]
+            last_end = window_start[group_end - 1] + window_size_samples
+
+            lo = np.searchsorted(annotation.sample, first_start, side='left')
+            hi = np.searchsorted(annotation.sample, last_end, side='left')
+            windows, annotations, indices = _segment_interval(
+                buffer.slice(first_start, last_end),
+                annotation.symbol[lo:hi],
+                annotation.sample[lo:hi] - first_start,
+                window_size_samples,
+                window_step_samples,
+                no_of_windows=group_end - next_window,
+            )
+            tables.append(_segment_frame(rd_name, int(row), rhythm[row], windows, annotations, indices))
+            next_window = group_end
+
+        if tables:
+            table = pl.concat(tables)
+            if signal_names is not None:
+                table = table.with_columns(
+                    pl.Series("SignalNames", [signal_names] * len(table), dtype=pl.List(pl.String))
+                )
+            if gain[0] is not None:
+                table = table.with_columns(gain_columns(*gain, len(table)))
+            yield table
+        if next_window < len(window_start):
+            buffer.discard_before(window_start[next_window])
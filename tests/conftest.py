@@ -0,0 +1,32 @@
+import os
+import hashlib
+
+import pytest
+
+from benchmarks.synthetic import make_record
+from src.processing.record_cache import CHECKSUM_FILE
+
+DATABASE = "testdb"
+
+
+@pytest.fixture(scope="session")
+def source_root(tmp_path_factory):
+    """A directory laid out like a WFDB database server with three short synthetic records."""
+    root = tmp_path_factory.mktemp("server")
+    directory = os.path.join(root, DATABASE)
+    records = [os.path.basename(make_record(directory, hours, fs=128, mean_episode_sec=15))
+               for hours in (0.01, 0.02, 0.03)]
+    with open(os.path.join(directory, "RECORDS"), "w", encoding="ascii") as f:
+        f.write("\n".join(records) + "\n")
+    with open(os.path.join(directory, CHECKSUM_FILE), "w", encoding="utf-8") as f:
+        for file_name in sorted(os.listdir(directory)):
+            if file_name.startswith("synth_"):
+                with open(os.path.join(directory, file_name), "rb") as record_file:
+                    f.write(f"{hashlib.sha256(record_file.read()).hexdigest()} {file_name}\n")
+    return str(root)
+
+
+@pytest.fixture(scope="session")
+def record_names(source_root):
+    with open(os.path.join(source_root, DATABASE, "RECORDS"), encoding="ascii") as f:
+        return f.read().split()
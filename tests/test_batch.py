@@ -0,0 +1,36 @@
+import os
+
+import polars as pl
+
+from src.processing import batch
+from conftest import DATABASE
+
+
+def process_record_or_die(database, record_name, *args):
+    """process_record whose worker is killed on the second record, like a worker over --max-memory-mb."""
+    if record_name == batch.list_local_records(database)[1]:
+        os._exit(1)
+    assert os.environ["POLARS_MAX_THREADS"] == "1"
+    return batch.process_record(database, record_name, *args)
+
+
+def test_run_batch(tmp_path, source_root, record_names):
+    records_table, summary_table = batch.run_batch(os.path.join(source_root, DATABASE), tmp_path,
+                                                   window_size=10, window_step=10, workers=2)
+
+    assert records_table["RecordName"].to_list() == record_names
+    assert records_table["status"].to_list() == ["ok"] * 3
+    assert summary_table is not None
+    assert os.path.exists(tmp_path / f"segments_{record_names[0]}_w10_s10.parquet")
+
+
+def test_dead_worker_fails_only_its_record(tmp_path, source_root, record_names, monkeypatch):
+    monkeypatch.setattr(batch, "process_record", process_record_or_die)
+    monkeypatch.delenv("POLARS_MAX_THREADS", raising=False)
+    records_table, _ = batch.run_batch(os.path.join(source_root, DATABASE), tmp_path,
+                                       window_size=10, window_step=10, workers=1)
+
+    assert records_table["status"].to_list() == ["ok", "failed", "ok"]
+    assert records_table.filter(pl.col("status") == "failed")["error"][0].startswith("BrokenProcessPool")
+    # The worker settings stay out of the caller's environment
+    assert "POLARS_MAX_THREADS" not in os.environ
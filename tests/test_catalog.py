@@ -0,0 +1,62 @@
+import os
+
+import pytest
+import polars as pl
+
+from src.processing.catalog import EpisodeCatalog
+from src.processing.record_cache import RecordCache
+from src.processing.rhythm_segmentation import find_rhythm_interval, create_segments
+from conftest import DATABASE
+from test_record_cache import CountingSource
+
+
+@pytest.fixture
+def local_catalog(tmp_path, source_root):
+    catalog = EpisodeCatalog(str(tmp_path / "episodes.sqlite"))
+    catalog.index_database(os.path.join(source_root, DATABASE))
+    return catalog
+
+
+def test_index_matches_find_rhythm_interval(local_catalog, source_root, record_names):
+    for record_name in record_names:
+        rhythm_table = find_rhythm_interval(os.path.join(source_root, DATABASE, record_name), "")
+        episodes = local_catalog.query(records=[record_name])
+        assert episodes.schema["RecordFs"] == rhythm_table.schema["RecordFs"] == pl.Int64
+        columns = ["RecordName", "RecordFs", "rhythm", "Start", "End", "IntervalDuration", "NoOfPAC", "NoOfPVC"]
+        assert episodes.select(columns).equals(rhythm_table.select(columns))
+
+
+@pytest.mark.parametrize("channels, signal_dtype", [(None, "float64"), ([0, 1], "float32"), (None, "int16"),
+                                                    ([1, 0], "int16")])
+def test_fetch_signals_round_trip(local_catalog, source_root, record_names, channels, signal_dtype):
+    for record_name in record_names:
+        rhythm_table = find_rhythm_interval(os.path.join(source_root, DATABASE, record_name), "",
+                                            channels=channels, signal_dtype=signal_dtype)
+        fetched = local_catalog.fetch_signals(local_catalog.query(records=[record_name]), channels=channels,
+                                              signal_dtype=signal_dtype)
+        assert fetched.select(rhythm_table.columns).equals(rhythm_table)
+        assert create_segments(fetched, 10, 3).equals(create_segments(rhythm_table, 10, 3))
+
+
+def test_fetch_signals_of_filtered_episodes(local_catalog, source_root, record_names):
+    episodes = local_catalog.query(min_duration=10)
+    fetched = local_catalog.fetch_signals(episodes)
+    for record_name in record_names:
+        rhythm_table = find_rhythm_interval(os.path.join(source_root, DATABASE, record_name), "")
+        expected = rhythm_table.with_row_index("intervalNo").with_columns(pl.col("intervalNo").cast(pl.Int64)) \
+            .filter(pl.col("IntervalDuration") >= 10)
+        assert fetched.filter(pl.col("RecordName") == record_name).select(expected.columns).equals(expected)
+
+
+def test_index_fetches_headers_and_annotations_only(tmp_path, source_root, record_names):
+    source = CountingSource(source_root)
+    catalog = EpisodeCatalog(str(tmp_path / "episodes.sqlite"), cache=RecordCache(tmp_path / "cache", source=source))
+    catalog.index_database(DATABASE)
+    assert not [file_name for file_name in source.opened if file_name.endswith(".dat")]
+    assert catalog.records(DATABASE)["RecordName"].to_list() == record_names
+
+    # Only the records of the fetched episodes are downloaded in full
+    fetched = catalog.fetch_signals(catalog.query(records=[record_names[1]]))
+    assert [file_name for file_name in source.opened if file_name.endswith(".dat")] == [f"{record_names[1]}.dat"]
+    rhythm_table = find_rhythm_interval(os.path.join(source_root, DATABASE, record_names[1]), "")
+    assert create_segments(fetched, 10, 3).equals(create_segments(rhythm_table, 10, 3))
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import polars as pl
+
+from src.processing.decimation import RecordView
+from src.processing.rhythm_segmentation import find_rhythm_interval
+from conftest import DATABASE
+
+
+def test_binned_bands_start_at_first_interval(source_root, record_names):
+    rhythm_table = find_rhythm_interval(os.path.join(source_root, DATABASE, record_names[2]), "")
+    # Drop the first interval, so the record starts with samples outside every band
+    view = RecordView(rhythm_table[1:])
+    first_start = int(rhythm_table["Start"][1])
+
+    exact = view.bands(0, len(view), max_bands=len(rhythm_table))
+    binned = view.bands(0, len(view), max_bands=3)
+    assert exact["Start"][0] == first_start
+    assert binned["Start"][0] >= first_start // 2
+    assert set(binned["rhythm"]) <= set(rhythm_table["rhythm"][1:])
+
+    # A view entirely before the first interval has no bands at all
+    assert len(view.bands(0, first_start - 1, max_bands=1)) == 0
+
+
+def test_binned_bands_label_centres(source_root, record_names):
+    rhythm_table = find_rhythm_interval(os.path.join(source_root, DATABASE, record_names[2]), "")
+    view = RecordView(rhythm_table)
+    binned = view.bands(0, len(view), max_bands=4)
+
+    assert binned["Start"][0] == 0 and binned["End"][-1] == len(view)
+    assert (binned["Start"][1:].to_numpy() == binned["End"][:-1].to_numpy()).all()
+    # Every bin is labelled with the rhythm of the interval holding its centre
+    edges = len(view) * np.arange(5) // 4
+    centres = (edges[:-1] + edges[1:]) // 2
+    intervals = np.searchsorted(rhythm_table["Start"].to_numpy(), centres, side="right") - 1
+    expected = [rhythm_table["rhythm"][int(i)] for i in intervals]
+    for rhythm, start, end in binned.iter_rows():
+        bins = (centres >= start) & (centres < end)
+        assert {expected[i] for i in np.flatnonzero(bins)} == {rhythm}
+    assert binned.schema == {"rhythm": pl.String, "Start": pl.Int64, "End": pl.Int64}
+
+
+def test_bands_include_the_end_sample(source_root, record_names):
+    rhythm_table = find_rhythm_interval(os.path.join(source_root, DATABASE, record_names[2]), "")
+    view = RecordView(rhythm_table)
+    exact = view.bands(0, len(view), max_bands=len(rhythm_table))
+
+    # End of the rhythm table is inclusive and End of the bands exclusive, so the bands tile the record
+    assert exact["rhythm"].to_list() == rhythm_table["rhythm"].to_list()
+    assert exact["Start"].to_list() == rhythm_table["Start"].to_list()
+    assert exact["End"][:-1].to_list() == (rhythm_table["End"][:-1] + 1).to_list()
+    assert exact["End"][-1] == min(int(rhythm_table["End"][-1]) + 1, len(view))
+    for row, end in enumerate(rhythm_table["End"][:-1].to_list()):
+        assert view.bands(end, end + 1)["rhythm"].to_list() == [rhythm_table["rhythm"][row]]
@@ -0,0 +1,67 @@
+import time
+import threading
+
+import pytest
+
+from src.processing.memo import StageCache
+
+
+def run_threads(target, n):
+    threads = [threading.Thread(target=target) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_misses_compute_once():
+    cache = StageCache()
+    calls, results = [], []
+
+    def compute():
+        calls.append(threading.get_ident())
+        time.sleep(0.2)
+        return b"result"
+
+    run_threads(lambda: results.append(cache.cached("stage", ("record",), compute)), 4)
+    assert len(calls) == 1
+    assert results == [b"result"] * 4
+    assert len(cache) == 1 and cache.size() == len(b"result")
+
+
+def test_waiters_compute_after_a_failure():
+    cache = StageCache()
+    calls, results, errors = [], [], []
+
+    def compute():
+        calls.append(threading.get_ident())
+        time.sleep(0.2)
+        if len(calls) == 1:
+            raise RuntimeError("cancelled")
+        return b"result"
+
+    def call():
+        try:
+            results.append(cache.cached("stage", ("record",), compute))
+        except RuntimeError as e:
+            errors.append(e)
+
+    run_threads(call, 3)
+    # The failed computation is retried once by one of the waiting callers
+    assert len(calls) == 2
+    assert len(errors) == 1 and results == [b"result"] * 2
+    assert cache.cached("stage", ("record",), lambda: pytest.fail("recomputed")) == b"result"
+
+
+def test_different_keys_compute_concurrently():
+    cache = StageCache()
+    started = threading.Barrier(2, timeout=5)
+
+    def compute():
+        # Both computations run at the same time, or the barrier times out
+        started.wait()
+        return b"result"
+
+    keys = iter([("a",), ("b",)])
+    run_threads(lambda: cache.cached("stage", next(keys), compute), 2)
+    assert len(cache) == 2
@@ -0,0 +1,169 @@
+import os
+import time
+import shutil
+import threading
+import functools
+import http.server
+
+import pytest
+
+from src.processing.record_cache import RecordCache, HTTPSource
+from conftest import DATABASE
+
+
+class Handler(http.server.SimpleHTTPRequestHandler):
+    """Serves the database directory with Range support and scripted failures."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        path = self.translate_path(self.path)
+        file_name = os.path.basename(path)
+        with server.lock:
+            server.requests.append((file_name, self.headers.get("Range")))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            if not os.path.isfile(path):
+                return self.send_error(404)
+            if file_name in server.fail_once:
+                server.fail_once.discard(file_name)
+                return self.send_error(503)
+            with open(path, "rb") as f:
+                data = f.read()
+            offset = int(self.headers["Range"].split("=")[1].split("-")[0]) if self.headers.get("Range") else 0
+            body = data[offset:]
+            self.send_response(206 if offset else 200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            time.sleep(0.02)
+            if file_name in server.drop_once:
+                # The connection drops half way through the body
+                server.drop_once.discard(file_name)
+                self.wfile.write(body[:len(body) // 2])
+                self.close_connection = True
+                return
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+@pytest.fixture
+def server(source_root):
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(Handler, directory=source_root))
+    httpd.lock = threading.Lock()
+    httpd.requests, httpd.fail_once, httpd.drop_once = [], set(), set()
+    httpd.active = httpd.max_active = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def assert_cached(cache, source_root, record_name):
+    path = cache.get(DATABASE, record_name)
+    for ext in ("hea", "dat", "atr"):
+        with open(f"{path}.{ext}", "rb") as cached, \
+                open(os.path.join(source_root, DATABASE, f"{record_name}.{ext}"), "rb") as original:
+            assert cached.read() == original.read()
+
+
+def test_concurrent_prefetch(tmp_path, server, source_root, record_names):
+    cache = RecordCache(tmp_path, source=HTTPSource(server.url, timeout=5))
+    results = cache.prefetch(DATABASE, concurrency=4)
+
+    assert [r["RecordName"] for r in results] == record_names
+    assert [r["status"] for r in results] == ["fetched"] * 3
+    assert server.max_active > 1
+    for record_name in record_names:
+        assert_cached(cache, source_root, record_name)
+
+    server.requests.clear()
+    assert [r["status"] for r in cache.prefetch(DATABASE)] == ["cached"] * 3
+    assert [file_name for file_name, _ in server.requests] == ["RECORDS"]
+
+
+def test_transient_errors_are_retried(tmp_path, server, source_root, record_names):
+    server.fail_once.update({f"{record_names[0]}.hea", f"{record_names[1]}.dat"})
+    cache = RecordCache(tmp_path, source=HTTPSource(server.url, timeout=5))
+    results = cache.prefetch(DATABASE, backoff=0.01)
+
+    assert [r["status"] for r in results] == ["fetched"] * 3
+    requested = [file_name for file_name, _ in server.requests]
+    assert requested.count(f"{record_names[0]}.hea") == 2
+    assert requested.count(f"{record_names[1]}.dat") == 2
+    for record_name in record_names:
+        assert_cached(cache, source_root, record_name)
+
+
+def test_missing_record_fails_without_retry(tmp_path, server):
+    cache = RecordCache(tmp_path, source=HTTPSource(server.url, timeout=5))
+    results = cache.prefetch(DATABASE, records=["nope"], backoff=0.01)
+
+    assert results[0]["status"] == "failed" and "404" in results[0]["error"]
+    assert [file_name for file_name, _ in server.requests] == ["nope.hea"]
+
+
+def test_dropped_download_resumes(tmp_path, server, source_root, record_names):
+    server.drop_once.add(f"{record_names[2]}.dat")
+    cache = RecordCache(tmp_path, source=HTTPSource(server.url, timeout=5))
+    results = cache.prefetch(DATABASE, records=[record_names[2]], backoff=0.01)
+
+    assert results[0]["status"] == "fetched"
+    dat_size = os.path.getsize(os.path.join(source_root, DATABASE, f"{record_names[2]}.dat"))
+    ranges = [byte_range for file_name, byte_range in server.requests if file_name == f"{record_names[2]}.dat"]
+    assert ranges == [None, f"bytes={dat_size // 2}-"]
+    assert_cached(cache, source_root, record_names[2])
+
+
+def test_interrupted_prefetch_resumes_from_part_file(tmp_path, server, source_root, record_names):
+    # A previous run stopped after downloading a third of the signal file
+    directory = tmp_path / DATABASE
+    directory.mkdir()
+    dat_path = os.path.join(source_root, DATABASE, f"{record_names[1]}.dat")
+    with open(dat_path, "rb") as f:
+        (directory / f"{record_names[1]}.dat.part").write_bytes(f.read(os.path.getsize(dat_path) // 3))
+
+    cache = RecordCache(tmp_path, source=HTTPSource(server.url, timeout=5))
+    results = cache.prefetch(DATABASE, records=[record_names[1]])
+
+    assert results[0]["status"] == "fetched"
+    assert (f"{record_names[1]}.dat", f"bytes={os.path.getsize(dat_path) // 3}-") in server.requests
+    assert not (directory / f"{record_names[1]}.dat.part").exists()
+    assert_cached(cache, source_root, record_names[1])
+
+
+def test_part_file_of_changed_file_is_discarded(tmp_path, server, source_root, record_names):
+    directory = tmp_path / DATABASE
+    directory.mkdir()
+    (directory / f"{record_names[0]}.atr.part").write_bytes(b"\xff" * 16)
+
+    cache = RecordCache(tmp_path, source=HTTPSource(server.url, timeout=5))
+    results = cache.prefetch(DATABASE, records=[record_names[0]], backoff=0.01)
+
+    # The resumed file does not match the server's checksum, so it is discarded
+    # and downloaded again from the start
+    assert results[0]["status"] == "fetched"
+    ranges = [byte_range for file_name, byte_range in server.requests if file_name == f"{record_names[0]}.atr"]
+    assert ranges == ["bytes=16-", None]
+    assert_cached(cache, source_root, record_names[0])
+
+
+def test_prefetch_beyond_the_cap_fails_fast(tmp_path, server, source_root, record_names):
+    record_size = sum(os.path.getsize(os.path.join(source_root, DATABASE, f"{record_names[0]}.{ext}"))
+                      for ext in ("hea", "dat", "atr"))
+    cache = RecordCache(tmp_path, max_bytes=record_size, source=HTTPSource(server.url, timeout=5), lease=0)
+    results = cache.prefetch(DATABASE, concurrency=1)
+
+    statuses = [r["status"] for r in results]
+    assert statuses[0] == "fetched" and "failed" in statuses
+    assert all("cache size cap" in r["error"] for r in results if r["status"] == "failed")
+    # Records fetched by the prefetch are not evicted to make room for the next ones
+    for r in results:
+        assert cache.contains(DATABASE, r["RecordName"]) == (r["status"] == "fetched")
+    assert not os.path.exists(os.path.join(str(tmp_path), DATABASE, f"{record_names[2]}.dat"))
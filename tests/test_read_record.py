@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import pytest
+import wfdb
+
+from src.processing.read_record import RecordReader, UnsupportedInMemoryFormat
+from src.processing.rhythm_segmentation import find_rhythm_interval
+from conftest import DATABASE
+
+
+def read_files(directory, record_name):
+    files = {}
+    for ext in ("hea", "dat", "atr"):
+        with open(os.path.join(directory, f"{record_name}.{ext}"), "rb") as f:
+            files[f"{record_name}.{ext}"] = f.read()
+    return files
+
+
+def test_in_memory_record_matches_files(source_root, record_names):
+    directory = os.path.join(source_root, DATABASE)
+    for record_name in record_names:
+        in_memory = find_rhythm_interval(record_name, files=read_files(directory, record_name), channels="all")
+        assert in_memory.equals(find_rhythm_interval(os.path.join(directory, record_name), "", channels="all"))
+
+
+def test_unsupported_in_memory_format(tmp_path, source_root, record_names):
+    # The same record rewritten in format 32, which is only read from files
+    record = wfdb.rdrecord(os.path.join(source_root, DATABASE, record_names[0]), physical=False)
+    record.fmt = ["32"] * record.n_sig
+    record.wrsamp(write_dir=str(tmp_path), expanded=False)
+    atr = os.path.join(source_root, DATABASE, f"{record_names[0]}.atr")
+    os.link(atr, tmp_path / f"{record_names[0]}.atr")
+    files = read_files(tmp_path, record_names[0])
+
+    with pytest.raises(UnsupportedInMemoryFormat, match="format 32"):
+        RecordReader.from_memory(record_names[0], files).read_signal([0])
+    with pytest.raises(UnsupportedInMemoryFormat):
+        find_rhythm_interval(record_names[0], files=files)
+    assert len(find_rhythm_interval(str(tmp_path / record_names[0]), "")) > 0
+
+
+def test_broken_in_memory_record_is_not_unsupported(source_root, record_names):
+    files = read_files(os.path.join(source_root, DATABASE), record_names[0])
+    files[f"{record_names[0]}.dat"] = files[f"{record_names[0]}.dat"][:100]
+
+    with pytest.raises(Exception) as error:
+        find_rhythm_interval(record_names[0], files=files)
+    assert not isinstance(error.value, UnsupportedInMemoryFormat)
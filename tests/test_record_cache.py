@@ -0,0 +1,184 @@
+import os
+import time
+import shutil
+import threading
+
+import pytest
+
+from src.processing.record_cache import RecordCache, LocalSource, CHECKSUM_FILE
+from conftest import DATABASE
+
+
+class CountingSource(LocalSource):
+    """LocalSource that counts the files opened."""
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.opened = []
+
+    def open(self, database, file_name, offset=0):
+        self.opened.append(file_name)
+        return super().open(database, file_name, offset)
+
+
+def record_size(root, record_name):
+    directory = os.path.join(root, DATABASE)
+    return sum(os.path.getsize(os.path.join(directory, f"{record_name}.{ext}")) for ext in ("hea", "dat", "atr"))
+
+
+def test_miss_fetches_record_files(tmp_path, source_root, record_names):
+    source = CountingSource(source_root)
+    cache = RecordCache(tmp_path, source=source)
+    path = cache.get(DATABASE, record_names[0])
+
+    assert path == os.path.join(str(tmp_path), DATABASE, record_names[0])
+    assert sorted(source.opened) == sorted(f"{record_names[0]}.{ext}" for ext in ("hea", "dat", "atr"))
+    for ext in ("hea", "dat", "atr"):
+        with open(f"{path}.{ext}", "rb") as cached, \
+                open(os.path.join(source_root, DATABASE, f"{record_names[0]}.{ext}"), "rb") as original:
+            assert cached.read() == original.read()
+    assert cache.contains(DATABASE, record_names[0])
+    assert cache.size() == record_size(source_root, record_names[0])
+
+
+def test_hit_does_not_touch_source(tmp_path, source_root, record_names):
+    source = CountingSource(source_root)
+    cache = RecordCache(tmp_path, source=source)
+    first = cache.get(DATABASE, record_names[0])
+    source.opened.clear()
+
+    assert cache.get(DATABASE, record_names[0]) == first
+    assert source.opened == []
+
+
+def test_missing_file_is_fetched_again(tmp_path, source_root, record_names):
+    cache = RecordCache(tmp_path, source=LocalSource(source_root))
+    path = cache.get(DATABASE, record_names[0])
+    os.remove(f"{path}.dat")
+
+    cache.get(DATABASE, record_names[0])
+    assert os.path.exists(f"{path}.dat")
+
+
+def test_checksum_mismatch_is_rejected(tmp_path, source_root, record_names):
+    root = tmp_path / "server"
+    shutil.copytree(source_root, root)
+    with open(root / DATABASE / f"{record_names[0]}.atr", "ab") as f:
+        f.write(b"\0\0")
+
+    cache = RecordCache(tmp_path / "cache", source=LocalSource(str(root)))
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        cache.get(DATABASE, record_names[0])
+    assert not cache.contains(DATABASE, record_names[0])
+
+
+def test_validate_refetches_changed_record(tmp_path, source_root, record_names):
+    root = tmp_path / "server"
+    shutil.copytree(source_root, root)
+    source = CountingSource(str(root))
+    cache = RecordCache(tmp_path / "cache", source=source)
+    cache.get(DATABASE, record_names[0])
+
+    # The server publishes a new version of the annotations
+    atr_path = root / DATABASE / f"{record_names[0]}.atr"
+    shutil.copyfile(root / DATABASE / f"{record_names[1]}.atr", atr_path)
+    checksums = (root / DATABASE / CHECKSUM_FILE).read_text().splitlines()
+    new_checksum = next(line.split()[0] for line in checksums if line.endswith(f"{record_names[1]}.atr"))
+    (root / DATABASE / CHECKSUM_FILE).write_text("\n".join(
+        f"{new_checksum} {record_names[0]}.atr" if line.endswith(f"{record_names[0]}.atr") else line
+        for line in checksums) + "\n")
+
+    cache = RecordCache(tmp_path / "cache", source=source)
+    source.opened.clear()
+    assert cache.get(DATABASE, record_names[0]) and source.opened == []
+    path = cache.get(DATABASE, record_names[0], validate=True)
+    assert f"{record_names[0]}.atr" in source.opened
+    assert open(f"{path}.atr", "rb").read() == atr_path.read_bytes()
+
+
+def test_least_recently_used_record_is_evicted(tmp_path, source_root, record_names):
+    sizes = [record_size(source_root, name) for name in record_names]
+    cache = RecordCache(tmp_path, max_bytes=sizes[1] + sizes[2], source=LocalSource(source_root), lease=0)
+    for name in record_names:
+        cache.get(DATABASE, name)
+
+    assert not cache.contains(DATABASE, record_names[0])
+    assert not os.path.exists(os.path.join(str(tmp_path), DATABASE, f"{record_names[0]}.dat"))
+    assert cache.contains(DATABASE, record_names[1]) and cache.contains(DATABASE, record_names[2])
+    assert cache.size() <= cache.max_bytes
+
+
+def test_hit_refreshes_recency(tmp_path, source_root, record_names):
+    sizes = [record_size(source_root, name) for name in record_names]
+    cache = RecordCache(tmp_path, max_bytes=sizes[0] + sizes[2], source=LocalSource(source_root), lease=0)
+    cache.get(DATABASE, record_names[0])
+    cache.get(DATABASE, record_names[1])
+    cache.get(DATABASE, record_names[0])
+    cache.get(DATABASE, record_names[2])
+
+    assert cache.contains(DATABASE, record_names[0])
+    assert not cache.contains(DATABASE, record_names[1])
+
+
+def test_leased_records_are_not_evicted(tmp_path, source_root, record_names):
+    # Another process may be about to read a record it just got from the cache
+    cache = RecordCache(tmp_path, max_bytes=1, source=LocalSource(source_root), lease=60)
+    paths = [cache.get(DATABASE, name) for name in record_names]
+
+    assert all(cache.contains(DATABASE, name) for name in record_names)
+    assert all(os.path.exists(f"{path}.dat") for path in paths)
+
+    expired = RecordCache(tmp_path, max_bytes=1, source=LocalSource(source_root), lease=0)
+    expired.get(DATABASE, record_names[0])
+    assert [name for name in record_names if expired.contains(DATABASE, name)] == [record_names[0]]
+
+
+class SlowSource(CountingSource):
+    """CountingSource whose files arrive in small, slow chunks, so concurrent fetches overlap."""
+
+    def open(self, database, file_name, offset=0):
+        f = super().open(database, file_name, offset)
+        read = f.read
+
+        def slow_read(size=-1):
+            time.sleep(0.001)
+            return read(min(size, 512) if size and size > 0 else 512)
+        f.read = slow_read
+        return f
+
+
+def test_concurrent_fetches_of_one_record(tmp_path, source_root, record_names):
+    source = SlowSource(source_root)
+    caches = [RecordCache(tmp_path, source=source) for _ in range(2)]
+    record_name = record_names[2]
+    barrier = threading.Barrier(3)
+    results, errors = [], []
+
+    def fetch(cache, prefetch):
+        barrier.wait()
+        try:
+            if prefetch:
+                results.append(cache.prefetch(DATABASE, [record_name])[0]["status"])
+            else:
+                results.append(os.path.basename(cache.get(DATABASE, record_name)))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=fetch, args=(caches[0], False)),
+               threading.Thread(target=fetch, args=(caches[1], False)),
+               threading.Thread(target=fetch, args=(caches[1], True))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(results, key=str) == sorted([record_name, record_name, "cached"], key=str)
+    # The second and third fetch waited for the first and found the record cached
+    assert source.opened.count(f"{record_name}.dat") == 1
+    path = caches[0].get(DATABASE, record_name)
+    for ext in ("hea", "dat", "atr"):
+        with open(f"{path}.{ext}", "rb") as cached, \
+                open(os.path.join(source_root, DATABASE, f"{record_name}.{ext}"), "rb") as original:
+            assert cached.read() == original.read()
+    assert not [name for name in os.listdir(os.path.dirname(path)) if name.endswith(".part")]
@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+import polars as pl
+import pytest
+
+from src.processing.resampling import resample_rhythm_table
+from src.processing.rhythm_segmentation import find_rhythm_interval, create_segments
+from src.processing.segment_store import SegmentStore
+from conftest import DATABASE
+
+SIGNAL_DTYPES = {"float64": pl.Float64, "float32": pl.Float32, "int16": pl.Int16}
+
+
+@pytest.mark.parametrize("signal_dtype", list(SIGNAL_DTYPES))
+@pytest.mark.parametrize("channels", [None, [0, 1]])
+def test_resampling_keeps_signal_dtype(source_root, record_names, signal_dtype, channels):
+    rhythm_table = find_rhythm_interval(os.path.join(source_root, DATABASE, record_names[2]), "",
+                                        signal_dtype=signal_dtype, channels=channels)
+    resampled = resample_rhythm_table(rhythm_table, 250)
+
+    assert resampled.schema["IntervalSignal"] == rhythm_table.schema["IntervalSignal"]
+    inner = SIGNAL_DTYPES[signal_dtype] if channels is None else pl.Array(SIGNAL_DTYPES[signal_dtype], 2)
+    assert resampled.schema["IntervalSignal"] == pl.List(inner)
+    assert resampled.schema["RecordFs"] == pl.Int64 and resampled["RecordFs"].to_list() == [250] * len(resampled)
+    lengths = resampled["IntervalSignal"].list.len().to_numpy()
+    expected = np.ceil(rhythm_table["IntervalSignal"].list.len().to_numpy() * 250 / 128)
+    assert (lengths == expected).all()
+
+
+def test_resampled_float32_segments_fit_a_float32_store(tmp_path, source_root, record_names):
+    store = SegmentStore(tmp_path / "store")
+    for record_name in record_names:
+        rhythm_table = find_rhythm_interval(os.path.join(source_root, DATABASE, record_name), "",
+                                            signal_dtype="float32")
+        store.append(create_segments(resample_rhythm_table(rhythm_table, 250), 5, 5))
+    assert len(store) > 0 and store.dtype == np.float32 and store.width == 5 * 250
@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+import polars as pl
+import pytest
+
+from src.processing.rhythm_segmentation import find_rhythm_interval, create_segments
+from src.processing.segment_store import SegmentStore
+from conftest import DATABASE
+
+
+def record_segments(source_root, record_name, window_size=5, signal_dtype="float64", channels=None):
+    rhythm_table = find_rhythm_interval(os.path.join(source_root, DATABASE, record_name), "",
+                                        signal_dtype=signal_dtype, channels=channels)
+    return create_segments(rhythm_table, window_size, window_size)
+
+
+def read_meta(store):
+    with open(os.path.join(store.path, "store.json"), "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("signal_dtype", ["float64", "float32", "int16"])
+@pytest.mark.parametrize("channels", [None, [0, 1]])
+def test_round_trip(tmp_path, source_root, record_names, signal_dtype, channels):
+    tables = [record_segments(source_root, record_name, signal_dtype=signal_dtype, channels=channels)
+              for record_name in record_names]
+    segments = pl.concat(tables)
+    store = SegmentStore(tmp_path / "store")
+    # Small chunks so that the segments span several index parts
+    assert store.append(tables, max_rows=7) == len(segments)
+
+    reopened = SegmentStore(tmp_path / "store")
+    assert len(reopened) == len(segments)
+    assert reopened.dtype == np.dtype(signal_dtype)
+    assert reopened.width == 5 * 128
+    assert reopened.signals.shape == (len(segments), 5 * 128) + ((2,) if channels else ())
+    assert reopened.index["row"].to_list() == list(range(len(segments)))
+    for i, segment in enumerate(segments.iter_rows(named=True)):
+        stored = reopened[i]
+        assert stored["RecordName"] == segment["RecordName"]
+        assert stored["intervalNo"] == segment["intervalNo"]
+        assert stored["rhythm_type"] == segment["rhythm_type"]
+        assert stored["signals"].dtype == np.dtype(signal_dtype)
+        np.testing.assert_array_equal(stored["signals"], np.asarray(segment["signals"], dtype=signal_dtype))
+        assert stored["annotations"].tolist() == (segment["annotations"] or [])
+        assert stored["indices"].tolist() == (segment["indices"] or [])
+
+
+def test_batch_and_rows(tmp_path, source_root, record_names):
+    segments = record_segments(source_root, record_names[2])
+    store = SegmentStore(tmp_path / "store")
+    store.append(segments)
+
+    rows = np.array([3, 0, len(segments) - 1])
+    signals, index = store.batch(rows)
+    assert isinstance(signals, np.ndarray) and not isinstance(signals, np.memmap)
+    assert signals.shape == (3, 5 * 128)
+    for signal, row in zip(signals, rows):
+        np.testing.assert_array_equal(signal, segments["signals"][int(row)].to_numpy())
+    assert index["row"].to_list() == rows.tolist()
+    assert index["intervalNo"].to_list() == segments["intervalNo"].gather(rows).to_list()
+
+    rhythm_type = segments["rhythm_type"][0]
+    matching = store.rows(pl.col("rhythm_type") == rhythm_type)
+    assert matching.tolist() == np.flatnonzero(segments["rhythm_type"].to_numpy() == rhythm_type).tolist()
+    assert store.rows(pl.col("RecordName") == "missing").tolist() == []
+
+
+@pytest.mark.parametrize("mismatch", [{"window_size": 10}, {"signal_dtype": "float32"}, {"channels": [0, 1]}])
+def test_rejects_mismatched_segments(tmp_path, source_root, record_names, mismatch):
+    store = SegmentStore(tmp_path / "store")
+    store.append(record_segments(source_root, record_names[0]))
+    n_rows, meta = len(store), read_meta(store)
+
+    with pytest.raises(ValueError):
+        store.append(record_segments(source_root, record_names[1], **mismatch))
+    assert len(store) == n_rows
+    assert read_meta(store) == meta
+
+
+def test_failed_append_leaves_store_unchanged(tmp_path, source_root, record_names):
+    store = SegmentStore(tmp_path / "store")
+    first = record_segments(source_root, record_names[0])
+    store.append(first)
+    n_rows, meta = len(store), read_meta(store)
+
+    # The first chunk is written before the second fails
+    with pytest.raises(ValueError):
+        store.append([record_segments(source_root, record_names[1]),
+                      record_segments(source_root, record_names[2], window_size=10)])
+    assert len(store) == n_rows
+    assert read_meta(store) == meta
+    assert len(SegmentStore(tmp_path / "store")) == n_rows
+
+    # A later append overwrites what the failed one left after the committed rows
+    last = record_segments(source_root, record_names[2])
+    assert store.append(last) == len(last)
+    assert len(store) == n_rows + len(last)
+    np.testing.assert_array_equal(store.signal(n_rows), last["signals"][0].to_numpy())
+    assert store.annotations(n_rows).tolist() == (last["annotations"][0].to_list() or [])
+    assert store.indices(-1).tolist() == (last["indices"][-1].to_list() or [])
+    assert store.index["RecordName"].unique().sort().to_list() == sorted([record_names[0], record_names[2]])
+
+
+def test_refresh_sees_appends_of_another_instance(tmp_path, source_root, record_names):
+    reader = SegmentStore(tmp_path / "store")
+    writer = SegmentStore(tmp_path / "store")
+    first = record_segments(source_root, record_names[0])
+    writer.append(first)
+    assert len(reader) == 0
+
+    reader.refresh()
+    assert len(reader) == len(first)
+    second = record_segments(source_root, record_names[1])
+    writer.append(second)
+    reader.refresh()
+    assert len(reader) == len(first) + len(second)
+    assert reader.index["row"].to_list() == list(range(len(reader)))
+    np.testing.assert_array_equal(reader.signal(-1), second["signals"][-1].to_numpy())